@@ -54,7 +54,37 @@ db.init_app(app)  # Bind db to app
 # --- Database Models ---
 # It's good practice to have your models defined or imported before creating the tables.
 # Assuming your models are correctly defined in the 'models.py' file.
-from models import User, Receipt, WidgetOrder
+from models import User, Receipt, ReceiptItem, ReceiptTombstone, ReceiptUsage, ReceiptDailyRollup, WidgetOrder, AnalyticsExport, EmailOutbox
+
+# Keep the receipt full-text index and the analytics rollup in step with receipt writes
+from utils.search import register_search_index
+from utils.rollup import register_rollup
+register_search_index()
+register_rollup()
+
+# Password hashing off the request worker
+from utils.passwords import init_password_hashing
+init_password_hashing(app)
+
+# Verified-token and current-user caches used by token_required
+from utils.decorators import init_token_cache
+from utils.current_user import init_user_cache
+init_token_cache(app)
+init_user_cache(app)
+
+# Per-IP and per-user rate limits, checked before every request
+from utils.rate_limit import init_rate_limiter
+init_rate_limiter(app)
+
+# Versioned analytics result cache (also bumps User.data_version on receipt writes)
+from utils.analytics_cache import init_analytics_cache
+from utils.spend_index import init_spend_index
+init_analytics_cache(app)
+init_spend_index(app)
+
+# Background analytics PDF exports (render process pool and PDF cache)
+from utils.exports import init_exports
+init_exports(app)
 
 # --- Blueprints (Routes) ---
 # FIX: Corrected the import paths by removing the 'backend.' prefix.
@@ -0,0 +1,82 @@
+"""
+Compares the pure Python and NumPy (utils/columnar.py) item-level analytics on synthetic
+receipts and checks that both return the same payloads.
+
+    cd backend && python -m benchmarks.analytics_engine [receipts]
+"""
+import random
+import sys
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+
+from utils import columnar, widgets
+
+Row = namedtuple('Row', 'date total store_name store_category items')
+
+CATEGORIES = ['Fruits', 'Vegetables', 'Meat & poultry', 'Seafood', 'Snacks', 'Dairy & eggs', 'Bakery', None]
+
+
+def synthetic_rows(count, products=400, seed=1):
+    rng = random.Random(seed)
+    today = date.today()
+    catalog = [(f'product {p}', round(rng.uniform(0.2, 40), 2), rng.choice(CATEGORIES)) for p in range(products)]
+    rows = []
+    for _ in range(count):
+        items = []
+        for _ in range(rng.randint(1, 25)):
+            name, price, category = rng.choice(catalog)
+            if rng.random() < 0.2:  # promotions and price changes
+                price = round(price * rng.uniform(0.7, 1.3), 2)
+            quantity = rng.randint(1, 3)
+            item = {'name': name, 'price': price, 'quantity': quantity, 'total': round(price * quantity, 2)}
+            if category:
+                item['category'] = category
+            items.append(item)
+        rows.append(Row(today - timedelta(days=rng.randrange(365)), sum(i['total'] for i in items),
+                        'Store', 'Grocery', items))
+    return rows
+
+
+def timed(f, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    if not columnar.available():
+        sys.exit('NumPy is not installed')
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rows = synthetic_rows(count)
+    print(f'{count} receipts, {sum(len(r.items) for r in rows)} items')
+
+    cases = [
+        ('top_products', lambda m: m.top_products(rows, 10)),
+        ('most_expensive_products', lambda m: m.most_expensive_products(rows, 8)),
+        ('category_totals', lambda m: m.category_totals(rows)),
+        ('products_by_category', lambda m: m.products_by_category(rows, 'Fruits')),
+    ]
+    for name, run in cases:
+        expected, python_time = timed(lambda: run(widgets))
+        result, numpy_time = timed(lambda: run(columnar))
+        assert result == expected, f'{name}: engines disagree'
+        print(f'{name:<26} python {python_time * 1000:8.1f}ms   numpy {numpy_time * 1000:8.1f}ms')
+
+    # The dashboard parses the items once and reuses the arrays for every item widget
+    params = {widget: dict(options) for widget, options in widgets.WIDGET_PARAMS.items()}
+    for widget in ('expenses_by_category', 'top_products', 'most_expensive'):
+        params[widget]['period'] = 'year'
+    args = (widgets.DEFAULT_WIDGETS, params, rows, None, None, 'USD', True)
+    expected, python_time = timed(lambda: widgets.build_dashboard(*args))
+    result, numpy_time = timed(lambda: widgets.build_dashboard(*args, item_columns=columnar.ItemColumns))
+    assert result == expected, 'dashboard: engines disagree'
+    print(f'{"dashboard":<26} python {python_time * 1000:8.1f}ms   numpy {numpy_time * 1000:8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Per-request overhead of token_required (utils/decorators.py), in microseconds:
+
+    legacy    decode in a freshly pushed app context, as the decorator did before the cache
+    uncached  decode on every request (TOKEN_CACHE_MAX_ENTRIES = 0)
+    cached    the verified-token cache, one request with the token already verified
+
+    cd backend && python -m benchmarks.auth [requests]
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+import jwt
+from flask import Flask, request, current_app as app
+
+from utils.decorators import token_required, init_token_cache
+
+SECRET = 'benchmark-secret-of-at-least-32-bytes'
+
+
+def legacy_token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.headers['Authorization'].split()[1]
+        with app.app_context():
+            data = jwt.decode(token, app.config['JWT_SECRET'], algorithms=["HS256"])
+        return f(data.get('user_id'), *args, **kwargs)
+    return decorated
+
+
+def view(user_id):
+    return user_id
+
+
+def make_app(max_entries):
+    flask_app = Flask(__name__)
+    flask_app.config.update(JWT_SECRET=SECRET, TOKEN_CACHE_MAX_ENTRIES=max_entries)
+    init_token_cache(flask_app)
+    return flask_app
+
+
+def measure(flask_app, decorated, token, requests):
+    headers = {'Authorization': f'Bearer {token}'}
+    with flask_app.test_request_context('/api/analytics/spend', headers=headers):
+        decorated()  # warm up (and fill the cache)
+        start = time.perf_counter()
+        for _ in range(requests):
+            decorated()
+        return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    token = jwt.encode(
+        {'user_id': 1, 'email': 'bench@example.com', 'exp': int((datetime.utcnow() + timedelta(hours=1)).timestamp())},
+        SECRET, algorithm='HS256'
+    )
+    runs = [
+        ('legacy', make_app(0), legacy_token_required(view)),
+        ('uncached', make_app(0), token_required(view)),
+        ('cached', make_app(4096), token_required(view)),
+    ]
+    for name, flask_app, decorated in runs:
+        print(f'{name:<9} {measure(flask_app, decorated, token, requests):7.1f}us per request')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Login throughput of password verification (utils/passwords.py) with concurrent logins
+in one gthread gunicorn worker (gunicorn.conf.py; threads defaults to its
+GUNICORN_THREADS), verified in the request thread (0 pool workers) or in the hash pool. Rejected counts logins that got a 503 because too many were waiting. The pool can
+only beat the request thread with at least as many free cores as pool workers; runs with
+fewer are marked.
+
+    cd backend && python -m benchmarks.login [logins] [threads] [bcrypt rounds]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask
+
+from errors import ServiceUnavailableError
+from utils import passwords
+
+PASSWORD = 'correct horse battery staple'
+
+
+def make_app(workers, rounds, max_pending):
+    app = Flask(__name__)
+    app.config.update(
+        PASSWORD_HASH_SCHEME='bcrypt',
+        PASSWORD_BCRYPT_ROUNDS=rounds,
+        PASSWORD_HASH_WORKERS=workers,
+        PASSWORD_HASH_MAX_PENDING=max_pending,
+    )
+    passwords.init_password_hashing(app)
+    return app
+
+
+def measure(app, stored_hash, logins, threads):
+    def login(_):
+        with app.app_context():
+            try:
+                return passwords.verify_password(stored_hash, PASSWORD)[0]
+            except ServiceUnavailableError:
+                return None
+
+    with app.app_context():
+        passwords.verify_password(stored_hash, PASSWORD)  # warm up (starts the pool)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+    return sum(1 for r in results if r) / elapsed, results.count(None)
+
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else int(os.environ.get('GUNICORN_THREADS', 4))
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    stored_hash = passwords.hash_password_now(PASSWORD, 'bcrypt', rounds)
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    print(f'{cores} cores, {logins} logins from {threads} threads, bcrypt rounds {rounds}')
+    for workers, max_pending in [(0, threads), (2, threads), (4, threads), (2, 2)]:
+        app = make_app(workers, rounds, max_pending)
+        rate, rejected = measure(app, stored_hash, logins, threads)
+        note = '  (more workers than cores)' if workers > cores else ''
+        print(f'workers {workers}  max pending {max_pending:>2}  {rate:7.1f} logins/s  rejected {rejected}{note}')
+        if app.extensions['password_pool']:
+            app.extensions['password_pool'].reset()
+
+
+if __name__ == '__main__':
+    main()
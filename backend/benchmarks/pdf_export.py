@@ -0,0 +1,56 @@
+"""
+Peak Python memory and time of the analytics PDF render modes (utils/pdf_export.py) as
+the exported tables grow. What the chunked mode still grows by is ReportLab's canvas,
+which keeps every finished page (a few KiB each) until the document is saved.
+
+    cd backend && python -m benchmarks.pdf_export [rows ...]
+"""
+import io
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from utils import pdf_export
+
+
+def synthetic_export(rows):
+    """A pro export whose daily spend and diet tables have `rows` rows each."""
+    start = date(2020, 1, 1)
+    days = [(start + timedelta(days=i)).isoformat() for i in range(rows)]
+    return {
+        'bill_stats': {'All': {'total_receipts': rows, 'average_bill': 42.5, 'average_bill_delta': None, 'has_data': True}},
+        'total_spent': {'daily': {'data': [{'period': day, 'total_spent': 12.34} for day in days]}},
+        'top_products': {'all': {'products': [
+            {'name': f'product {i}', 'count': 3, 'percentage': 1.5, 'category': 'Snacks'} for i in range(rows)
+        ]}},
+        'diet_composition': {'3months': {'data': [
+            {'period': day, 'fruits_percent': 10.0, 'vegetables_percent': 20.0, 'meat_percent': 30.0,
+             'seafood_percent': 5.0, 'snacks_percent': 15.0, 'dairy_percent': 20.0} for day in days
+        ]}},
+    }
+
+
+def measure(data, mode):
+    pdf_export.build_pdf(io.BytesIO(), 'pro', data, '2026-01-01', mode)  # warm up imports and fonts
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open('/dev/null', 'wb') as output:
+        pdf_export.build_pdf(output, 'pro', data, '2026-01-01', mode)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [180, 1000, 5000]
+    for rows in sizes:
+        data = synthetic_export(rows)
+        for mode in pdf_export.RENDER_MODES:
+            peak, elapsed = measure(data, mode)
+            print(f'{rows:>6} rows  {mode:<8} peak {peak / 2**20:7.1f} MiB   {elapsed * 1000:8.0f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Per-request cost of the rate limiter (utils/rate_limit.py) for the analytics rules (one
+per-user and one per-IP window) and for a single per-IP rule, in microseconds.
+
+    cd backend && python -m benchmarks.rate_limit [requests]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import jwt
+from flask import Flask, Blueprint
+
+from utils.decorators import init_token_cache
+from utils.rate_limit import RateLimiter, MemoryRateLimitStorage, SQLiteRateLimitStorage
+
+SECRET = 'benchmark-secret-of-at-least-32-bytes'
+RULES = {
+    'analytics': [(10 ** 9, 60, 'user'), (10 ** 9, 60, 'ip')],
+    'auth': [(10 ** 9, 60, 'ip')],
+}
+
+
+def make_app():
+    app = Flask(__name__)
+    app.config.update(JWT_SECRET=SECRET)
+    init_token_cache(app)
+    for name in RULES:
+        blueprint = Blueprint(name, __name__, url_prefix=f'/{name}')
+        blueprint.add_url_rule('/view', 'view', lambda: '')
+        app.register_blueprint(blueprint)
+    return app
+
+
+def measure(app, limiter, path, headers, requests):
+    with app.test_request_context(path, headers=headers):
+        limiter.check()  # warm up (opens the connection, caches the token)
+        start = time.perf_counter()
+        for _ in range(requests):
+            limiter.check()
+        return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    app = make_app()
+    token = jwt.encode({'user_id': 1}, SECRET, algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}', 'X-Forwarded-For': '203.0.113.7'}
+    with tempfile.TemporaryDirectory() as directory:
+        storages = [
+            ('memory', MemoryRateLimitStorage()),
+            ('sqlite', SQLiteRateLimitStorage(os.path.join(directory, 'rate_limit.db'))),
+        ]
+        for name, storage in storages:
+            limiter = RateLimiter(storage, RULES, trusted_proxies=1)
+            for path in ('/analytics/view', '/auth/view'):
+                print(f'{name:<7} {path:<16} {measure(app, limiter, path, headers, requests):6.1f}us per request')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Cost of the prefix-sum spend index (utils/spend_index.py) against summing the daily
+rollup directly, per bill-stats lookup, for users with growing histories (3 stores,
+a receipt most days):
+
+    reload    load_index, paid by each worker on its first lookup after a receipt write
+    lookup    totals() of a window on a cached index
+    sum 30d   window_totals over 30 days of rollup rows
+    sum all   window_totals over the whole history
+
+    cd backend && python -m benchmarks.spend_index [years ...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from flask import Flask
+
+from models import db, User, ReceiptDailyRollup
+from utils.rollup import RECEIPT_ROW
+from utils.spend_index import load_index, window_totals
+
+STORES = [('Corner Shop', 'Groceries'), ('Market', 'Groceries'), ('Pharmacy', 'Health')]
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite:///' + path)
+    db.init_app(app)
+    return app
+
+
+def fill(user_id, years, seed=1):
+    rng = random.Random(seed)
+    today = date.today()
+    rows = []
+    for offset in range(365 * years):
+        for store_name, store_category in STORES:
+            if rng.random() < 0.4:
+                rows.append(dict(user_id=user_id, day=today - timedelta(days=offset), store_name=store_name,
+                                 store_category=store_category, category=RECEIPT_ROW,
+                                 spend=round(rng.uniform(2, 120), 2), item_count=0, receipt_count=1))
+    db.session.execute(ReceiptDailyRollup.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def timed(f, repeat=20):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    histories = [int(arg) for arg in sys.argv[1:]] or [1, 3, 10]
+    today = date.today()
+    month_ago = today - timedelta(days=30)
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            for user_id, years in enumerate(histories, start=1):
+                db.session.add(User(id=user_id, email=f'user{user_id}@example.com', password_hash='x'))
+                db.session.commit()
+                rows = fill(user_id, years)
+                index = load_index(db, user_id)
+                results = [
+                    ('reload', timed(lambda: load_index(db, user_id))),
+                    ('lookup', timed(lambda: index.totals(month_ago, today))),
+                    ('sum 30d', timed(lambda: window_totals(db, user_id, month_ago, today))),
+                    ('sum all', timed(lambda: window_totals(db, user_id, date.min, today))),
+                ]
+                print(f'{years:>2} years, {rows:>5} rollup rows  ' +
+                      '  '.join(f'{name} {ms:8.4f}ms' for name, ms in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -29,6 +29,77 @@ class Config:
     # JWT settings
     JWT_SECRET = os.environ.get('JWT_SECRET', 'your_jwt_secret')
     JWT_ACCESS_TOKEN_EXPIRES = 120  # hours (5 days)
+    # Email outbox drained by `flask mail-worker` (utils/outbox.py)
+    OUTBOX_MAX_ATTEMPTS = 8
+    OUTBOX_RETRY_BASE_SECONDS = 30  # doubled per failed attempt
+    OUTBOX_RETRY_MAX_SECONDS = 3600
+    OUTBOX_KEEP_SENT_DAYS = 7
+    OUTBOX_CLAIM_SECONDS = 300  # a batch's emails are claimed again after this if its worker died
+
+    # Password hashing in a per-worker process pool (utils/passwords.py)
+    PASSWORD_HASH_SCHEME = os.environ.get('PASSWORD_HASH_SCHEME', 'bcrypt')  # or 'pbkdf2'
+    PASSWORD_BCRYPT_ROUNDS = int(os.environ.get('PASSWORD_BCRYPT_ROUNDS', 12))  # outdated hashes are rehashed on login
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))  # 0 hashes in the request
+    PASSWORD_HASH_MAX_PENDING = 32  # calls waiting for the pool beyond this get a 503 (only below GUNICORN_THREADS)
+    PASSWORD_HASH_TIMEOUT_SECONDS = 10
+    # Verified tokens cached per worker (utils/decorators.py); never beyond the token's exp
+    TOKEN_CACHE_MAX_ENTRIES = 4096
+    TOKEN_CACHE_TTL_SECONDS = 300
+    # Current-user projections (id, plan, currency, subscription status) cached per worker
+    USER_CACHE_TTL_SECONDS = 30
+    USER_CACHE_MAX_ENTRIES = 4096
+    
+    # Sliding-window rate limits (utils/rate_limit.py): endpoint or blueprint -> [(limit, seconds, 'ip' | 'user')].
+    # An endpoint's rules replace its blueprint's; 'user' falls back to the IP without a valid token.
+    RATE_LIMIT_STORAGE = os.environ.get('RATE_LIMIT_STORAGE', 'sqlite')  # shared by the workers on a host; 'memory' or 'none'
+    RATE_LIMIT_PATH = os.environ.get(
+        'RATE_LIMIT_PATH',
+        os.path.join(os.path.dirname(__file__), 'instance', 'rate_limit.db')
+    )
+    # Load balancers adding X-Forwarded-For; 0 uses the socket address, so a client cannot pick its own IP
+    RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 0))
+    RATE_LIMITS = {
+        'auth.login': [(10, 60, 'ip'), (100, 3600, 'ip')],
+        'auth.register': [(5, 60, 'ip'), (30, 3600, 'ip')],
+        'auth.request_password_reset': [(3, 60, 'ip'), (20, 3600, 'ip')],
+        'auth': [(60, 60, 'ip')],
+        'analytics': [(120, 60, 'user'), (600, 60, 'ip')],
+    }
+
+    # Idempotency-Key settings
+    IDEMPOTENCY_TTL_HOURS = 24
+    IDEMPOTENCY_WAIT_SECONDS = 10  # how long a duplicate waits for the first request to finish
+    IDEMPOTENCY_LEASE_SECONDS = 60  # a claim still in progress after this was abandoned (beyond gunicorn's 30s timeout)
+    IDEMPOTENCY_MAX_BODY_BYTES = 64 * 1024  # larger responses are not stored for replay
+    
+    # Analytics result cache: 'memory' (per worker), 'sqlite' (shared by the workers on a host) or 'none'
+    ANALYTICS_CACHE_BACKEND = os.environ.get('ANALYTICS_CACHE_BACKEND', 'memory')
+    ANALYTICS_CACHE_PATH = os.environ.get(
+        'ANALYTICS_CACHE_PATH',
+        os.path.join(os.path.dirname(__file__), 'instance', 'analytics_cache.db')
+    )
+    ANALYTICS_CACHE_MAX_ENTRIES = 2048
+    ANALYTICS_CACHE_FRESH_SECONDS = 300  # served without recomputing
+    ANALYTICS_CACHE_STALE_SECONDS = 3600  # served while a background refresh runs
+    # GET /api/analytics/cache-stats: counters of the worker that answers, for operators only
+    ANALYTICS_CACHE_STATS_ENABLED = os.environ.get('ANALYTICS_CACHE_STATS_ENABLED', '').lower() in ('1', 'true')
+    # Dashboard item widgets: 'numpy' (columnar engine, falls back to Python when NumPy is missing) or 'python'
+    ANALYTICS_ENGINE = os.environ.get('ANALYTICS_ENGINE', 'numpy')
+    # Per-worker prefix-sum spend indexes (user x store filter), see utils/spend_index.py
+    SPEND_INDEX_MAX_ENTRIES = 1024
+    
+    # Analytics PDF export jobs: rendered in a process pool, PDFs cached on disk by content hash
+    EXPORT_RENDER_WORKERS = int(os.environ.get('EXPORT_RENDER_WORKERS', 2))  # per gunicorn worker; 0 renders in the job thread
+    EXPORT_RENDER_TASKS_PER_CHILD = 20  # renders before a pool process is replaced
+    # 'chunked' (styles built once per process, page-sized tables, flat memory) or 'simple'
+    EXPORT_RENDER_MODE = os.environ.get('EXPORT_RENDER_MODE', 'chunked')
+    EXPORT_JOB_TIMEOUT_SECONDS = 300  # jobs still active after this are reported failed
+    EXPORT_JOB_RETENTION_HOURS = 24
+    EXPORT_CACHE_DIR = os.environ.get(
+        'EXPORT_CACHE_DIR',
+        os.path.join(os.path.dirname(__file__), 'instance', 'exports')
+    )
+    EXPORT_CACHE_MAX_FILES = 500
     
     # Security settings
     PASSWORD_MIN_LENGTH = 8
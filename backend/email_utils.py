@@ -26,7 +26,7 @@ def init_mail(app):
     app.config['MAIL_DEFAULT_SENDER'] = (os.environ.get('GMAIL_USERNAME'), 'Receipt Scanner App')
     return Mail(app)
 
-def send_confirmation_email(mail, to_email, username, token):
+def confirmation_message(to_email, username, token):
     confirm_url = f"{API_BASE_URL}/api/auth/confirm-email?token={token}"
     
     msg = Message(
@@ -89,7 +89,12 @@ def send_confirmation_email(mail, to_email, username, token):
     
     If you didn't create an account, you can safely ignore this email.
     """
-    
+    return msg
+
+
+def send_confirmation_email(mail, to_email, username, token):
+    """Sends the email in the request; the auth routes queue it in the outbox instead (utils/outbox.py)."""
+    msg = confirmation_message(to_email, username, token)
     try:
         mail.send(msg)
         print(f"Confirmation email sent to {to_email}")
@@ -100,7 +105,7 @@ def send_confirmation_email(mail, to_email, username, token):
         return False
 
 
-def send_password_reset_email(mail, to_email, username, token):
+def password_reset_message(to_email, username, token):
     reset_url = f"{API_BASE_URL}/api/auth/reset-password-web?token={token}"
     
     msg = Message(
@@ -164,7 +169,12 @@ def send_password_reset_email(mail, to_email, username, token):
     
     If you're having trouble, please contact our support team.
     """
-    
+    return msg
+
+
+def send_password_reset_email(mail, to_email, username, token):
+    """Sends the email in the request; the auth routes queue it in the outbox instead (utils/outbox.py)."""
+    msg = password_reset_message(to_email, username, token)
     try:
         mail.send(msg)
         print(f"Password reset email sent to {to_email}")
@@ -34,11 +34,25 @@ class ResourceNotFoundError(APIError):
     def __init__(self, message, payload=None):
         super().__init__(message, status_code=404, payload=payload)
 
+class ServiceUnavailableError(APIError):
+    """Raised when the server is too busy to take the request; the client should retry"""
+    def __init__(self, message, retry_after=1, payload=None):
+        super().__init__(message, status_code=503, payload=payload)
+        self.retry_after = retry_after
+
+class RateLimitError(APIError):
+    """Raised when a client exceeds a rate limit; the client should retry after retry_after seconds"""
+    def __init__(self, message, retry_after=1, payload=None):
+        super().__init__(message, status_code=429, payload=payload)
+        self.retry_after = retry_after
+
 def register_error_handlers(app):
     @app.errorhandler(APIError)
     def handle_api_error(error):
         response = jsonify(error.to_dict())
         response.status_code = error.status_code
+        if getattr(error, 'retry_after', None):
+            response.headers['Retry-After'] = str(error.retry_after)
         return response
 
     @app.errorhandler(HTTPException)
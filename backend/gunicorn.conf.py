@@ -0,0 +1,12 @@
+# gunicorn settings for the web process (Procfile). Each worker serves GUNICORN_THREADS
+# requests at once (gthread), so a request waiting on the password hash pool
+# (utils/passwords.py), a PDF render (utils/exports.py) or the database leaves the other
+# threads of the worker serving. With the default sync worker a worker ran one request
+# at a time and those pools only ever had one call in flight. The per-worker caches are
+# guarded by locks, and the database sessions are per thread.
+import os
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = 30  # IDEMPOTENCY_LEASE_SECONDS (config.py) must stay above this
@@ -1,16 +1,41 @@
+import os
 import click
+from alembic import command
+from alembic.config import Config as AlembicConfig
+from flask import current_app
 from flask.cli import with_appcontext
-from models import db # Use db from models.py, not application.py
+from sqlalchemy import inspect
+import time
+from models import db, Receipt, ReceiptItem # Use db from models.py, not application.py
+from utils.search import rebuild_search_index
+from utils.rollup import rebuild_rollup
+from utils.outbox import send_due_emails, purge_sent_emails
+
+BASELINE_REVISION = '3c1e9a7f2b10' # migrations/versions/3c1e9a7f2b10_baseline_schema.py
+
+def alembic_config():
+    cfg = AlembicConfig(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alembic.ini'))
+    cfg.set_main_option('script_location', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
+    # Escape '%' for ConfigParser interpolation (passwords in the URL)
+    cfg.set_main_option('sqlalchemy.url', current_app.config['SQLALCHEMY_DATABASE_URI'].replace('%', '%%'))
+    # Keep the Flask logging setup instead of alembic.ini's
+    cfg.attributes['configure_logger'] = False
+    return cfg
 
 @click.command('init-db')
 @with_appcontext
 def init_db_command(*args, **kwargs):
-    """Clears existing data and creates new tables."""
+    """Creates or upgrades the database schema by running the Alembic migrations."""
     try:
-        print("Attempting to create all database tables...")
-        # The following line will create all tables based on your models
-        db.create_all()
-        print("Database tables created successfully.")
+        cfg = alembic_config()
+        tables = set(inspect(db.engine).get_table_names())
+        if 'receipt' in tables and 'alembic_version' not in tables:
+            # Database predates migrations (built by db.create_all()); adopt it at the baseline
+            print(f"Existing schema without migration history, stamping {BASELINE_REVISION}...")
+            command.stamp(cfg, BASELINE_REVISION)
+        print("Running database migrations...")
+        command.upgrade(cfg, 'head')
+        print("Database migrations applied successfully.")
         click.echo('Initialized the database.')
     except Exception as e:
         # This will print the full error to the deployment logs
@@ -19,7 +44,72 @@ def init_db_command(*args, **kwargs):
         # Exit with a non-zero status code to signal failure to Elastic Beanstalk
         raise
 
+@click.command('backfill-receipt-items')
+@click.option('--user-id', type=int, default=None, help='Only backfill this user\'s receipts.')
+@click.option('--batch-size', type=int, default=500, show_default=True, help='Receipts per transaction.')
+@with_appcontext
+def backfill_receipt_items_command(user_id, batch_size):
+    """Rebuilds the receipt_item table from the Receipt.items JSON."""
+    query = db.session.query(Receipt.id).order_by(Receipt.id)
+    if user_id is not None:
+        query = query.filter(Receipt.user_id == user_id)
+    receipt_ids = [row.id for row in query]
+    click.echo(f'Backfilling items for {len(receipt_ids)} receipts...')
+
+    for start in range(0, len(receipt_ids), batch_size):
+        batch_ids = receipt_ids[start:start + batch_size]
+        # Clear with one statement so the rebuild does not lazy-load old rows per receipt
+        db.session.query(ReceiptItem).filter(ReceiptItem.receipt_id.in_(batch_ids))\
+            .delete(synchronize_session=False)
+        for receipt in db.session.query(Receipt).filter(Receipt.id.in_(batch_ids)):
+            receipt.sync_line_items()
+        db.session.commit()
+        click.echo(f'  {min(start + batch_size, len(receipt_ids))}/{len(receipt_ids)}')
+
+    click.echo('Receipt items backfilled.')
+
+@click.command('rebuild-search-index')
+@click.option('--user-id', type=int, default=None, help='Only reindex this user\'s receipts.')
+@with_appcontext
+def rebuild_search_index_command(user_id):
+    """Reindexes receipts into the full-text search table."""
+    count = rebuild_search_index(db.session, user_id=user_id)
+    db.session.commit()
+    click.echo(f'Reindexed {count} receipts.')
+
+@click.command('rebuild-analytics-rollup')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user\'s rollup rows.')
+@click.option('--batch-size', type=int, default=500, show_default=True, help='Receipts read per query.')
+@with_appcontext
+def rebuild_analytics_rollup_command(user_id, batch_size):
+    """Recomputes the daily analytics rollup from the receipt table."""
+    count = rebuild_rollup(db.session.connection(), user_id=user_id, batch_size=batch_size)
+    db.session.commit()
+    click.echo(f'Rolled up {count} receipts.')
+
+@click.command('mail-worker')
+@click.option('--batch-size', type=int, default=50, show_default=True, help='Emails sent per SMTP connection.')
+@click.option('--poll-interval', type=float, default=5.0, show_default=True, help='Seconds to wait when the outbox is empty.')
+@click.option('--once', is_flag=True, help='Send the emails due now and exit.')
+@with_appcontext
+def mail_worker_command(batch_size, poll_interval, once):
+    """Sends the queued emails of the email outbox."""
+    app = current_app._get_current_object()
+    purge_sent_emails(app)
+    while True:
+        sent, failed = send_due_emails(app, batch_size)
+        if sent or failed:
+            click.echo(f'Sent {sent} emails, {failed} failed.')
+        if sent + failed < batch_size:
+            if once:
+                break
+            time.sleep(poll_interval)
+
 def init_app(app):
     """Register database functions with the Flask app."""
     # This makes the 'init-db' command available to the 'flask' command
-    app.cli.add_command(init_db_command)
\ No newline at end of file
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(backfill_receipt_items_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(rebuild_analytics_rollup_command)
+    app.cli.add_command(mail_worker_command)
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""Baseline schema (user, receipt, widget_order) as created by db.create_all()
+
+Databases created before migrations existed already have these tables; init-db
+stamps them at this revision instead of running it.
+
+Revision ID: 3c1e9a7f2b10
+Revises:
+Create Date: 2026-10-16 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1e9a7f2b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'user',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('email', sa.String(length=120), nullable=False),
+        sa.Column('password_hash', sa.String(length=128), nullable=True),
+        sa.Column('email_verified', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('currency', sa.String(length=3), nullable=True),
+        sa.Column('plan', sa.String(length=50), nullable=False),
+        sa.Column('stripe_customer_id', sa.String(length=64), nullable=True),
+        sa.Column('stripe_subscription_id', sa.String(length=64), nullable=True),
+        sa.Column('subscription_start_date', sa.DateTime(), nullable=True),
+        sa.Column('next_billing_date', sa.DateTime(), nullable=True),
+        sa.Column('subscription_end_date', sa.DateTime(), nullable=True),
+        sa.Column('subscription_status', sa.String(length=20), nullable=True),
+        sa.Column('trial_start_date', sa.DateTime(), nullable=True),
+        sa.Column('trial_end_date', sa.DateTime(), nullable=True),
+        sa.Column('is_trial_active', sa.Boolean(), nullable=True),
+        sa.Column('has_completed_onboarding', sa.Boolean(), nullable=False),
+        sa.Column('onboarding_goals', sa.JSON(), nullable=True),
+        sa.Column('onboarding_features', sa.JSON(), nullable=True),
+        sa.Column('onboarding_completed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+    )
+    op.create_table(
+        'receipt',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('store_category', sa.String(length=100), nullable=True),
+        sa.Column('store_name', sa.String(length=120), nullable=True),
+        sa.Column('date', sa.Date(), nullable=True),
+        sa.Column('total', sa.Float(), nullable=True),
+        sa.Column('tax_amount', sa.Float(), nullable=True),
+        sa.Column('total_discount', sa.Float(), nullable=True),
+        sa.Column('items', sa.JSON(), nullable=True),
+        sa.Column('fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'fingerprint', name='uix_user_fingerprint'),
+    )
+    op.create_index('ix_receipt_fingerprint', 'receipt', ['fingerprint'])
+    op.create_table(
+        'widget_order',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('order', sa.JSON(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id'),
+    )
+
+
+def downgrade():
+    op.drop_table('widget_order')
+    op.drop_index('ix_receipt_fingerprint', table_name='receipt')
+    op.drop_table('receipt')
+    op.drop_table('user')
@@ -0,0 +1,40 @@
+"""Add receipt_daily_rollup and fill it from existing receipts
+
+Revision ID: 4a8c2e6f1d93
+Revises: e7a9d1c4f6b2
+Create Date: 2026-10-16 14:00:00
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+from utils.rollup import rebuild_rollup
+
+
+# revision identifiers, used by Alembic.
+revision = '4a8c2e6f1d93'
+down_revision = 'e7a9d1c4f6b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'receipt_daily_rollup',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('store_name', sa.String(length=120), nullable=False),
+        sa.Column('store_category', sa.String(length=100), nullable=False),
+        sa.Column('category', sa.String(length=100), nullable=False),
+        sa.Column('spend', sa.Float(), nullable=False),
+        sa.Column('item_count', sa.Integer(), nullable=False),
+        sa.Column('receipt_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('user_id', 'day', 'store_name', 'store_category', 'category'),
+    )
+    if not context.is_offline_mode():
+        rebuild_rollup(op.get_bind())
+
+
+def downgrade():
+    op.drop_table('receipt_daily_rollup')
@@ -0,0 +1,93 @@
+"""Add receipt_tombstone, receipt_item, receipt_usage and idempotency_record
+
+Deployments that ran init-db while it still called db.create_all() may already
+have some of these tables, so each one is only created if it is missing.
+
+Revision ID: 8d4b6f0e1a27
+Revises: 3c1e9a7f2b10
+Create Date: 2026-10-16 12:10:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4b6f0e1a27'
+down_revision = '3c1e9a7f2b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'receipt_tombstone' not in existing:
+        op.create_table(
+            'receipt_tombstone',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('receipt_id', sa.Integer(), nullable=False),
+            sa.Column('deleted_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_receipt_tombstone_user_deleted_at', 'receipt_tombstone', ['user_id', 'deleted_at'])
+
+    if 'receipt_item' not in existing:
+        op.create_table(
+            'receipt_item',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('receipt_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('date', sa.Date(), nullable=True),
+            sa.Column('position', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=255), nullable=True),
+            sa.Column('category', sa.String(length=100), nullable=True),
+            sa.Column('price', sa.Float(), nullable=True),
+            sa.Column('quantity', sa.Float(), nullable=True),
+            sa.Column('total', sa.Float(), nullable=True),
+            sa.Column('discount', sa.Float(), nullable=True),
+            sa.ForeignKeyConstraint(['receipt_id'], ['receipt.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_receipt_item_receipt_id', 'receipt_item', ['receipt_id'])
+        op.create_index('ix_receipt_item_user_date', 'receipt_item', ['user_id', 'date'])
+        op.create_index('ix_receipt_item_user_category', 'receipt_item', ['user_id', 'category'])
+
+    if 'receipt_usage' not in existing:
+        op.create_table(
+            'receipt_usage',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('month', sa.Date(), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('user_id', 'month'),
+        )
+
+    if 'idempotency_record' not in existing:
+        op.create_table(
+            'idempotency_record',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('key', sa.String(length=255), nullable=False),
+            sa.Column('request_hash', sa.String(length=64), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('response_status', sa.Integer(), nullable=True),
+            sa.Column('response_body', sa.Text(), nullable=True),
+            sa.Column('response_mimetype', sa.String(length=100), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'key', name='uix_user_idempotency_key'),
+        )
+        op.create_index('ix_idempotency_record_expires_at', 'idempotency_record', ['expires_at'])
+
+
+def downgrade():
+    op.drop_table('idempotency_record')
+    op.drop_table('receipt_usage')
+    op.drop_table('receipt_item')
+    op.drop_table('receipt_tombstone')
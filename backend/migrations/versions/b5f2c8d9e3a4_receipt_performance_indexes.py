@@ -0,0 +1,61 @@
+"""Composite receipt indexes for per-user filters; drop redundant fingerprint index
+
+Every hot receipt query filters on user_id plus one of date, store_name,
+store_category, created_at or updated_at. The standalone fingerprint index is
+covered by uix_user_fingerprint (user_id, fingerprint), since fingerprints are
+only looked up per user.
+
+On PostgreSQL the indexes are built with CREATE INDEX CONCURRENTLY outside the
+migration transaction, so the receipt table stays writable during the deploy.
+If a concurrent build fails it leaves an INVALID index behind; drop it by name
+and rerun the upgrade.
+
+Revision ID: b5f2c8d9e3a4
+Revises: 8d4b6f0e1a27
+Create Date: 2026-10-16 12:20:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5f2c8d9e3a4'
+down_revision = '8d4b6f0e1a27'
+branch_labels = None
+depends_on = None
+
+RECEIPT_INDEXES = [
+    ('ix_receipt_user_date', ['user_id', 'date']),
+    ('ix_receipt_user_store_name', ['user_id', 'store_name']),
+    ('ix_receipt_user_store_category', ['user_id', 'store_category']),
+    ('ix_receipt_user_created_at', ['user_id', 'created_at']),
+    ('ix_receipt_user_updated_at', ['user_id', 'updated_at']),
+]
+
+
+def is_postgresql():
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def upgrade():
+    if is_postgresql():
+        with op.get_context().autocommit_block():
+            for name, columns in RECEIPT_INDEXES:
+                op.create_index(name, 'receipt', columns, if_not_exists=True, postgresql_concurrently=True)
+            op.drop_index('ix_receipt_fingerprint', table_name='receipt', if_exists=True, postgresql_concurrently=True)
+    else:
+        for name, columns in RECEIPT_INDEXES:
+            op.create_index(name, 'receipt', columns, if_not_exists=True)
+        op.drop_index('ix_receipt_fingerprint', table_name='receipt', if_exists=True)
+
+
+def downgrade():
+    if is_postgresql():
+        with op.get_context().autocommit_block():
+            op.create_index('ix_receipt_fingerprint', 'receipt', ['fingerprint'], if_not_exists=True, postgresql_concurrently=True)
+            for name, _ in RECEIPT_INDEXES:
+                op.drop_index(name, table_name='receipt', if_exists=True, postgresql_concurrently=True)
+    else:
+        op.create_index('ix_receipt_fingerprint', 'receipt', ['fingerprint'], if_not_exists=True)
+        for name, _ in RECEIPT_INDEXES:
+            op.drop_index(name, table_name='receipt', if_exists=True)
@@ -0,0 +1,26 @@
+"""Add user.data_version for the analytics result cache
+
+Revision ID: c9e4b7a2d5f8
+Revises: 4a8c2e6f1d93
+Create Date: 2026-10-16 15:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e4b7a2d5f8'
+down_revision = '4a8c2e6f1d93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.add_column(sa.Column('data_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('data_version')
@@ -0,0 +1,39 @@
+"""Fill receipt_usage for the months before the usage counters existed
+
+receipt_usage only got a row when a user uploaded in a month, so earlier
+months had none. The lifetime receipt count is summed from these rows
+(utils/usage.py), so every month with receipts gets its row here, counted
+from the receipts uploaded (created_at) that month. Rows already present
+are kept.
+
+Revision ID: d1f7a3c5b9e0
+Revises: a6d3f9b1c7e2
+Create Date: 2026-10-16 23:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1f7a3c5b9e0'
+down_revision = 'a6d3f9b1c7e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        month = "CAST(date_trunc('month', r.created_at) AS DATE)"
+    else:
+        month = "date(r.created_at, 'start of month')"
+    op.execute(
+        "INSERT INTO receipt_usage (user_id, month, count) "
+        "SELECT m.user_id, m.month, m.count FROM ("
+        f" SELECT r.user_id, {month} AS month, count(*) AS count FROM receipt r"
+        " WHERE r.created_at IS NOT NULL GROUP BY r.user_id, month) m "
+        "WHERE NOT EXISTS (SELECT 1 FROM receipt_usage u WHERE u.user_id = m.user_id AND u.month = m.month)"
+    )
+
+
+def downgrade():
+    pass  # the rows stay valid counters
@@ -0,0 +1,58 @@
+"""Full-text search index over receipt store names and item names
+
+SQLite: FTS5 virtual table (rowid = receipt id) with prefix indexes for
+search-as-you-type. PostgreSQL: receipt_search table holding a weighted
+tsvector (store name 'A', item names 'B') with a GIN index. Both are filled
+from the existing receipts here and kept current by utils/search.py.
+
+Revision ID: e7a9d1c4f6b2
+Revises: b5f2c8d9e3a4
+Create Date: 2026-10-16 13:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a9d1c4f6b2'
+down_revision = 'b5f2c8d9e3a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            "CREATE TABLE receipt_search ("
+            " receipt_id INTEGER PRIMARY KEY REFERENCES receipt (id) ON DELETE CASCADE,"
+            " user_id INTEGER NOT NULL,"
+            " document TSVECTOR NOT NULL)"
+        )
+        op.execute("CREATE INDEX ix_receipt_search_document ON receipt_search USING GIN (document)")
+        op.execute("CREATE INDEX ix_receipt_search_user_id ON receipt_search (user_id)")
+        op.execute(
+            "INSERT INTO receipt_search (receipt_id, user_id, document) "
+            "SELECT r.id, r.user_id, "
+            " setweight(to_tsvector('simple', coalesce(r.store_name, '')), 'A') || "
+            " setweight(to_tsvector('simple', coalesce((SELECT string_agg(e ->> 'name', ' ') "
+            "  FROM json_array_elements(CASE WHEN json_typeof(r.items) = 'array' THEN r.items ELSE '[]'::json END) e"
+            "  WHERE json_typeof(e) = 'object'), '')), 'B') "
+            "FROM receipt r"
+        )
+    else:
+        op.execute(
+            "CREATE VIRTUAL TABLE receipt_search USING fts5("
+            "owner, store_name, item_names, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        op.execute(
+            "INSERT INTO receipt_search (rowid, owner, store_name, item_names) "
+            "SELECT r.id, 'u' || r.user_id, coalesce(r.store_name, ''), "
+            " coalesce(CASE WHEN json_valid(r.items) THEN (SELECT group_concat(json_extract(e.value, '$.name'), ' ') "
+            "  FROM json_each(r.items) e WHERE e.type = 'object') END, '') "
+            "FROM receipt r"
+        )
+
+
+def downgrade():
+    op.execute("DROP TABLE receipt_search")
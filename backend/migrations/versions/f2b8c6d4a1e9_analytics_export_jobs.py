@@ -0,0 +1,37 @@
+"""Add analytics_export for background PDF export jobs
+
+Revision ID: f2b8c6d4a1e9
+Revises: c9e4b7a2d5f8
+Create Date: 2026-10-16 16:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8c6d4a1e9'
+down_revision = 'c9e4b7a2d5f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'analytics_export',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=True),
+        sa.Column('error', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_analytics_export_user_id', 'analytics_export', ['user_id'])
+
+
+def downgrade():
+    op.drop_index('ix_analytics_export_user_id', table_name='analytics_export')
+    op.drop_table('analytics_export')
@@ -1,11 +1,30 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 from sqlalchemy.dialects.postgresql import JSON
 from sqlalchemy.ext.mutable import MutableList
 
+from utils import passwords
+
 db = SQLAlchemy()  # Only create the instance, do not bind to app
 
+def parse_number(value):
+    """Best-effort float conversion for item fields (accepts '1,5'); returns None if invalid."""
+    if value is None:
+        return None
+    try:
+        if isinstance(value, str):
+            value = value.replace(',', '.')
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+def parse_text(value, max_length):
+    """Coerces an item field to a stripped, length-limited string; returns None if empty."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value[:max_length] or None
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -31,20 +50,36 @@ class User(db.Model):
     onboarding_features = db.Column(db.JSON, nullable=True)
     onboarding_completed_at = db.Column(db.DateTime, nullable=True)
 
+    # Bumped by every receipt write and currency change; keys the analytics result cache
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     # Optional: One-to-many relationship
     receipts = db.relationship('Receipt', backref='user', lazy=True)
     widget_order = db.relationship('WidgetOrder', backref='user', uselist=False)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+        self.password_hash = passwords.hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """
+        Verifies the password in the hash pool (utils/passwords.py). A valid password whose
+        hash has outdated parameters is rehashed in place; commit the session to keep it.
+        """
+        valid, new_hash = passwords.verify_password(self.password_hash, password)
+        if new_hash:
+            self.password_hash = new_hash
+        return valid
 
 
 class Receipt(db.Model):
     __table_args__ = (
         db.UniqueConstraint('user_id', 'fingerprint', name='uix_user_fingerprint'),
+        # Composite indexes for the hot per-user predicates (see migrations/)
+        db.Index('ix_receipt_user_date', 'user_id', 'date'),
+        db.Index('ix_receipt_user_store_name', 'user_id', 'store_name'),
+        db.Index('ix_receipt_user_store_category', 'user_id', 'store_category'),
+        db.Index('ix_receipt_user_created_at', 'user_id', 'created_at'),
+        db.Index('ix_receipt_user_updated_at', 'user_id', 'updated_at'),
     )
 
     id = db.Column(db.Integer, primary_key=True)
@@ -58,11 +93,136 @@ class Receipt(db.Model):
     total_discount = db.Column(db.Float)
 
     items = db.Column(MutableList.as_mutable(JSON))  # Stores list of {"name", "quantity", "price", "category", "total", "discount"} and tracks mutations
-    fingerprint = db.Column(db.String(64), nullable=False, index=True)  # SHA256 hex string
+    fingerprint = db.Column(db.String(64), nullable=False)  # SHA256 hex string, indexed by uix_user_fingerprint
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Normalized copy of `items`, rewritten by sync_line_items() on every receipt write
+    line_items = db.relationship('ReceiptItem', backref='receipt', lazy=True,
+                                 cascade='all, delete-orphan', order_by='ReceiptItem.position')
+
+    def sync_line_items(self):
+        """Rebuilds the ReceiptItem rows from the items JSON. Call before committing a receipt write."""
+        self.line_items = [
+            ReceiptItem(
+                user_id=self.user_id,
+                date=self.date,
+                position=position,
+                name=parse_text(item.get('name'), 255),
+                category=parse_text(item.get('category'), 100),
+                price=parse_number(item.get('price')),
+                quantity=parse_number(item.get('quantity')),
+                total=parse_number(item.get('total')),
+                discount=parse_number(item.get('discount')),
+            )
+            for position, item in enumerate(self.items or [])
+            if isinstance(item, dict)
+        ]
+
+
+class ReceiptItem(db.Model):
+    """One line of a receipt, kept in sync with Receipt.items for SQL-side aggregation."""
+    __table_args__ = (
+        db.Index('ix_receipt_item_user_date', 'user_id', 'date'),
+        db.Index('ix_receipt_item_user_category', 'user_id', 'category'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    receipt_id = db.Column(db.Integer, db.ForeignKey('receipt.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date = db.Column(db.Date)
+    position = db.Column(db.Integer, nullable=False)  # index in Receipt.items
+
+    name = db.Column(db.String(255))
+    category = db.Column(db.String(100))
+    price = db.Column(db.Float)
+    quantity = db.Column(db.Float)
+    total = db.Column(db.Float)
+    discount = db.Column(db.Float)
+
+
+class ReceiptTombstone(db.Model):
+    """Records a deleted receipt so delta sync clients can drop it locally."""
+    __table_args__ = (
+        db.Index('ix_receipt_tombstone_user_deleted_at', 'user_id', 'deleted_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    receipt_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ReceiptUsage(db.Model):
+    """Receipts uploaded per user per calendar month (UTC), maintained alongside receipt writes."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)  # first day of the month
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ReceiptDailyRollup(db.Model):
+    """
+    Per-day analytics totals, updated by deltas on every receipt write (see utils/rollup.py).
+    category '' holds receipt totals and counts; other categories hold item totals and counts.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    store_name = db.Column(db.String(120), primary_key=True, default='')
+    store_category = db.Column(db.String(100), primary_key=True, default='')
+    category = db.Column(db.String(100), primary_key=True, default='')
+    spend = db.Column(db.Float, nullable=False, default=0.0)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    receipt_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class IdempotencyRecord(db.Model):
+    """Stored outcome of a POST sent with an Idempotency-Key, replayed for retries until it expires."""
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uix_user_idempotency_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)  # SHA256 of method, path and body
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress, completed
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    response_mimetype = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)  # claim time, renewed when a retry takes over
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class AnalyticsExport(db.Model):
+    """Analytics PDF export job, computed and rendered in the background (see utils/exports.py)."""
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex, handed to the client
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    content_hash = db.Column(db.String(64), nullable=True)  # SHA256 of the rendered data; names the cached PDF
+    error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+
+class EmailOutbox(db.Model):
+    """Email waiting to be sent, written in the transaction that triggers it (see utils/outbox.py)."""
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    recipients = db.Column(db.JSON, nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=True)
+    html = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
 
 class WidgetOrder(db.Model):
     id = db.Column(db.Integer, primary_key=True)
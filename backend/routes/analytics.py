@@ -1,20 +1,18 @@
-from flask import Blueprint, request, jsonify, current_app as app, send_file
+from flask import Blueprint, request, jsonify, current_app as app, send_file, g
 from datetime import datetime, timedelta
-from sqlalchemy import func, desc, and_, or_, case, text
+from collections import namedtuple
+from sqlalchemy import func, desc, and_, or_, case, text, null, select, literal, true
 from flask_cors import cross_origin
 import json
-import io
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.platypus import Table, TableStyle, SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+import os
+import tempfile
 import traceback
-from reportlab.lib.colors import HexColor
 from utils.decorators import token_required
-from models import User, Receipt, WidgetOrder
-from flask_limiter.util import get_remote_address
-from flask_limiter import Limiter
+from utils.analytics_cache import cached_analytics
+from models import User, Receipt, ReceiptDailyRollup, WidgetOrder, AnalyticsExport
+from utils.rollup import RECEIPT_ROW
+from utils.spend_index import spend_index, window_totals
+from utils import widgets, columnar, item_queries, pdf_export, exports
 
 # Import necessary components from the backend application
 # Import models and error classes
@@ -25,14 +23,94 @@ from utils.decorators import token_required
 
 analytics_bp = Blueprint('analytics', __name__, url_prefix='/api/analytics')
 
+SPEND_MAX_RANGE_DAYS = 3660  # ~10 years of zero-filled daily points
+DIET_MAX_RANGE_DAYS = 366  # daily points of a custom diet composition window
+
+def rollup_query(db, user_id, store_name, store_category, *columns):
+    """Query over the user's daily rollup rows (see utils/rollup.py) with the store filters applied."""
+    query = db.session.query(*columns).filter(ReceiptDailyRollup.user_id == user_id)
+    if store_name:
+        query = query.filter(ReceiptDailyRollup.store_name == store_name)
+    if store_category:
+        query = query.filter(ReceiptDailyRollup.store_category == store_category)
+    return query
+
+def date_window():
+    """Optional ?start=YYYY-MM-DD&end=YYYY-MM-DD of the request; ValueError if malformed or reversed."""
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else None
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else None
+    except ValueError:
+        raise ValueError('Invalid date format')
+    if start and end and start > end:
+        raise ValueError('start must not be after end')
+    return start, end
+
+def dashboard_item_columns():
+    """
+    ItemColumns builder for the dashboard's item-level widgets when the NumPy engine is
+    enabled (ANALYTICS_ENGINE) and installed; None runs them on the rows in Python.
+    """
+    if app.config.get('ANALYTICS_ENGINE') == 'numpy' and columnar.available():
+        return columnar.ItemColumns
+    return None
+
+AnalyticsContext = namedtuple('AnalyticsContext', 'currency has_data data_version')
+
+def with_context(db, user_id, query=None, order_by=()):
+    """
+    Runs a view's aggregate `query` and reads the user's currency, whether they have any
+    receipt (the widgets' empty states) and their data_version in the same statement: the
+    aggregate is a subquery LEFT JOINed to the user's row, so the context comes back even
+    when the aggregate is empty. Returns (context, rows); context is None for an unknown user.
+    `order_by` orders the rows, since a subquery's own ORDER BY does not survive the join.
+    """
+    has_data = select(ReceiptDailyRollup.user_id).where(
+        ReceiptDailyRollup.user_id == user_id,
+        ReceiptDailyRollup.category == RECEIPT_ROW
+    ).exists()
+    context = select(
+        func.coalesce(func.nullif(User.currency, ''), 'USD').label('currency'),
+        has_data.label('has_data'),
+        User.data_version.label('data_version')
+    ).where(User.id == user_id).subquery('user_context')
+    if query is None:
+        row = db.session.execute(select(context)).first()
+        return (AnalyticsContext(*row) if row else None), []
+
+    # Numbers the aggregate rows; NULL marks the padding row of an empty aggregate
+    ordinal = func.row_number().over(order_by=order_by) if order_by else literal(1)
+    aggregate = query.add_columns(ordinal.label('ordinal')).subquery('aggregate')
+    result = db.session.execute(
+        select(context, aggregate)
+        .select_from(context.outerjoin(aggregate, true()))
+        .order_by(aggregate.c.ordinal)
+    ).all()
+    if not result:
+        return None, []
+    width = len(context.c)
+    aggregate_row = namedtuple('AggregateRow', [column.key for column in aggregate.c][:-1], rename=True)
+    rows = [aggregate_row(*row[width:-1]) for row in result if row[-1] is not None]
+    return AnalyticsContext(*result[0][:width]), rows
+
 @analytics_bp.route('/spend', methods=['GET'])
 @cross_origin()
 @token_required
+@cached_analytics('spend')
 def get_spend_analytics(user_id):
+    """
+    Spend over time from one query of daily totals; weeks (ISO, Monday start) and months
+    are summed from the days in Python.
+      ?interval=daily|weekly|monthly           {'currency', 'data': [{'period', 'total_spent'}]}
+      ?granularities=daily,weekly,monthly      {'currency', 'start', 'end', 'series': {granularity: [point]}}
+    Optional ?start=YYYY-MM-DD&end=YYYY-MM-DD limit the days and zero-fill every period
+    in between; without them only periods with receipts are returned.
+    """
     # Access db via app.extensions within context
     with app.app_context():
         db = app.extensions['sqlalchemy']
         interval = request.args.get('interval', 'monthly')  # daily, weekly, monthly
+        granularities = request.args.get('granularities')
         store_name = request.args.get('store_name')  # Optional store name filter
         store_category = request.args.get('store_category')
 
@@ -40,161 +118,68 @@ def get_spend_analytics(user_id):
             app.logger.warning("[Analytics] Missing user_id in request")
             return jsonify({'error': 'Missing user_id'}), 400
 
-        # Define time formatting based on interval
+        if granularities:
+            granularities = [g for g in dict.fromkeys(granularities.split(',')) if g]
+            unknown = [g for g in granularities if g not in widgets.SPEND_GRANULARITIES]
+            if unknown:
+                return jsonify({'error': f"Unknown granularities: {', '.join(unknown)}"}), 400
+
         try:
-            # Check database type and use appropriate date functions
-            db_url = app.config.get('SQLALCHEMY_DATABASE_URI', '')
-            app.logger.info(f"[Analytics] Database URL: {db_url}")
-            
-            if 'sqlite' in db_url.lower():
-                # SQLite date functions
-                if interval == 'daily':
-                    date_format = '%Y-%m-%d'
-                    group_by = func.strftime('%Y-%m-%d', Receipt.date)
-                elif interval == 'weekly':
-                    date_format = '%Y-W%W'
-                    group_by = func.strftime('%Y-W%W', Receipt.date)
-                else:
-                    date_format = '%Y-%m'
-                    group_by = func.strftime('%Y-%m', Receipt.date)
-                app.logger.info(f"[Analytics] Using SQLite date functions with group_by: {group_by}")
-            else:
-                # PostgreSQL date functions
-                if interval == 'daily':
-                    date_format = '%Y-%m-%d'
-                    group_by = func.date_trunc('day', Receipt.date)
-                elif interval == 'weekly':
-                    date_format = '%Y-W%W'
-                    group_by = func.date_trunc('week', Receipt.date)
-                else:
-                    date_format = '%Y-%m'
-                    group_by = func.date_trunc('month', Receipt.date)
-                app.logger.info(f"[Analytics] Using PostgreSQL date functions with group_by: {group_by}")
-        except Exception as e:
-            app.logger.error(f"[Analytics] Error setting up group_by: {e}")
-            # Fallback to simple date grouping
-            if interval == 'daily':
-                group_by = func.date(Receipt.date)
-            elif interval == 'weekly':
-                group_by = func.date_trunc('week', Receipt.date)
-            else:
-                group_by = func.date_trunc('month', Receipt.date)
-            app.logger.info(f"[Analytics] Using fallback group_by: {group_by}")
+            start, end = date_window()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         try:
             app.logger.info(f"[Analytics] Fetching spend analytics for user {user_id} with interval {interval}")
-            app.logger.info(f"[Analytics] Database session: {db.session}")
-            app.logger.info(f"[Analytics] Receipt model: {Receipt}")
-            
-            # Get user currency first (needed for both cases)
-            user = db.session.query(User).get(user_id) # Use db from extensions
-            user_currency = user.currency if user and user.currency else 'USD'
-            app.logger.info(f"[Analytics] User currency: {user_currency}")
-            
-            # Test basic query first
-            test_query = db.session.query(Receipt).filter(Receipt.user_id == user_id).limit(1)
-            app.logger.info(f"[Analytics] Test query: {test_query}")
-            test_result = test_query.first()
-            app.logger.info(f"[Analytics] Test result: {test_result}")
-            
-            query = (
-                db.session.query(
-                    group_by.label('period'),
-                    func.sum(Receipt.total).label('total_spent')
-                )
-                .filter(Receipt.user_id == user_id)
-            )
-
-            # Add store name filter if provided
-            if store_name:
-                query = query.filter(Receipt.store_name == store_name)
-                app.logger.info(f"[Analytics] Added store filter: {store_name}")
-            if store_category:
-                query = query.filter(Receipt.store_category == store_category)
-                app.logger.info(f"[Analytics] Added category filter: {store_category}")
 
-            period_results = (
-                query
-                .group_by('period')
-                .order_by('period')
-                .all()
-            )
-
-            app.logger.info(f"[Analytics] Raw query results: {period_results}")
-
-            # If no results, try a simpler query
-            if not period_results:
-                app.logger.info(f"[Analytics] No results from complex query, trying simple query")
-                simple_query = db.session.query(Receipt.total).filter(Receipt.user_id == user_id)
-                simple_results = simple_query.all()
-                app.logger.info(f"[Analytics] Simple query results: {simple_results}")
-                
-                if simple_results:
-                    # If we have receipts but no grouped results, return a single period
-                    total_spent = sum(r.total for r in simple_results if r.total)
-                    response = [{'period': 'All', 'total_spent': round(total_spent, 4)}]
-                else:
-                    response = []
-            else:
-                # Format the response with proper date formatting
-                response = []
-                for period, total in period_results:
-                    if interval == 'daily':
-                        # Format as '09 Jun' for daily
-                        try:
-                            if isinstance(period, str):
-                                # If it's already a string, try to parse and format
-                                parsed_date = datetime.strptime(period, '%Y-%m-%d')
-                                formatted_period = parsed_date.strftime('%d %b')
-                            else:
-                                # If it's a date object, format directly
-                                formatted_period = period.strftime('%d %b')
-                        except:
-                            formatted_period = str(period)
-                    elif interval == 'weekly':
-                        # Format as 'W23' for weekly
-                        try:
-                            if isinstance(period, str):
-                                # Extract week number from date string
-                                parsed_date = datetime.strptime(period, '%Y-%m-%d')
-                                week_num = parsed_date.isocalendar()[1]
-                                formatted_period = f'W{week_num}'
-                            else:
-                                week_num = period.isocalendar()[1]
-                                formatted_period = f'W{week_num}'
-                        except:
-                            formatted_period = str(period)
-                    else:  # monthly
-                        # Format as 'Jun' for monthly
-                        try:
-                            if isinstance(period, str):
-                                parsed_date = datetime.strptime(period, '%Y-%m-%d')
-                                formatted_period = parsed_date.strftime('%b')
-                            else:
-                                formatted_period = period.strftime('%b')
-                        except:
-                            formatted_period = str(period)
-                    
-                    response.append({
-                        'period': formatted_period, 
-                        'total_spent': round(total, 4)
-                    })
-            
-            app.logger.info(f"[Analytics] Found {len(response)} periods of data")
-            app.logger.info(f"[Analytics] Final response: {response}")
-            return jsonify({'currency': user_currency, 'data': response})
+            # Receipt-level rollup rows already hold one total per day and store
+            query = rollup_query(
+                db, user_id, store_name, store_category,
+                ReceiptDailyRollup.day,
+                func.sum(ReceiptDailyRollup.spend).label('total_spent')
+            ).filter(ReceiptDailyRollup.category == RECEIPT_ROW)
+            if start:
+                query = query.filter(ReceiptDailyRollup.day >= start)
+            if end:
+                query = query.filter(ReceiptDailyRollup.day <= end)
+            context, rows = with_context(db, user_id, query.group_by(ReceiptDailyRollup.day))
+            user_currency = context.currency if context else 'USD'
+            daily_totals = dict(rows)
+
+            # Zero-fill needs both ends; an open end stops at the last day with receipts
+            if (start or end) and daily_totals:
+                start, end = start or min(daily_totals), end or max(daily_totals)
+            if start and end and (end - start).days >= SPEND_MAX_RANGE_DAYS:
+                return jsonify({'error': f'Date range is limited to {SPEND_MAX_RANGE_DAYS} days'}), 400
+
+            if not granularities:
+                data = [
+                    {'period': point['period'], 'total_spent': point['total_spent']}
+                    for point in widgets.spend_points(widgets.spend_buckets(daily_totals, interval, start, end), interval)
+                ]
+                app.logger.info(f"[Analytics] Found {len(data)} periods of data")
+                return jsonify({'currency': user_currency, 'data': data})
 
+            return jsonify({
+                'currency': user_currency,
+                'start': start.isoformat() if start else None,
+                'end': end.isoformat() if end else None,
+                'series': {
+                    granularity: widgets.spend_points(
+                        widgets.spend_buckets(daily_totals, granularity, start, end), granularity
+                    )
+                    for granularity in granularities
+                }
+            })
         except Exception as e:
             app.logger.error(f"[Analytics] Error fetching analytics: {e}")
-            app.logger.error(f"[Analytics] Error type: {type(e)}")
-            app.logger.error(f"[Analytics] Error details: {str(e)}")
-            import traceback
             app.logger.error(f"[Analytics] Full traceback: {traceback.format_exc()}")
             return jsonify({'error': 'Internal server error'}), 500
 
 @analytics_bp.route('/top-products', methods=['GET'])
 @cross_origin()
 @token_required
+@cached_analytics('top-products')
 def get_top_products(user_id):
      # Access db via app.extensions within context
     with app.app_context():
@@ -222,11 +207,7 @@ def get_top_products(user_id):
                 start_date = None
 
             # Base query
-            query = db.session.query(
-                Receipt.items,
-                Receipt.date,
-                Receipt.id
-            ).filter(
+            query = db.session.query(func.count(Receipt.id)).filter(
                 Receipt.user_id == user_id,
                 Receipt.items.isnot(None)
             )
@@ -241,14 +222,10 @@ def get_top_products(user_id):
             if start_date:
                 query = query.filter(Receipt.date >= start_date)
 
-            receipts = query.all()
-            total_receipts = len(receipts)
-
-            # Check if user has any receipts at all
-            any_receipts = db.session.query(Receipt).filter(
-                Receipt.user_id == user_id,
-                Receipt.items.isnot(None)
-            ).count() > 0
+            # Context and receipt count in one statement; the item aggregation below is the other
+            context, rows = with_context(db, user_id, query)
+            total_receipts = rows[0][0] if rows else 0
+            any_receipts = bool(context and context.has_data)
 
             if total_receipts == 0:
                 return jsonify({
@@ -258,46 +235,11 @@ def get_top_products(user_id):
                     'has_data': any_receipts
                 })
 
-            # Process items to count product occurrences across receipts
-            product_receipt_counts = {}  # Will store {product_name: {'count': int, 'category': str}}
-            for receipt in receipts:
-                if not receipt.items:
-                    continue
-                # Get unique product names in this receipt
-                products_in_receipt = {}  # {product_name: category}
-                for item in receipt.items:
-                    if not item or not item.get('name'):
-                        continue
-                    product_name = item['name'].strip()
-                    category = item.get('category', 'Other')
-                    if not product_name:
-                        continue
-                    products_in_receipt[product_name] = category
-
-                # Count each unique product once per receipt
-                for product_name, category in products_in_receipt.items():
-                    if product_name in product_receipt_counts:
-                        product_receipt_counts[product_name]['count'] += 1
-                    else:
-                        product_receipt_counts[product_name] = {
-                            'count': 1,
-                            'category': category
-                        }
-
-            # Calculate percentages and sort by count (descending)
-            sorted_products = []
-            for name, data in product_receipt_counts.items():
-                percentage = (data['count'] / total_receipts) * 100
-                sorted_products.append({
-                    'name': name,
-                    'count': data['count'],
-                    'percentage': round(percentage, 1),
-                    'category': data['category']
-                })
-
-            # Sort by count (descending) and take top N
-            sorted_products.sort(key=lambda x: x['count'], reverse=True)
-            top_products = sorted_products[:limit]
+            # Aggregated in the database where supported (utils/item_queries.py); only the top `limit` come back
+            top_products = item_queries.top_products(
+                db.session.connection(), user_id, limit, total_receipts,
+                start_date=start_date, store_name=store_name, store_category=store_category
+            )
 
             return jsonify({
                 'period': period,
@@ -312,6 +254,7 @@ def get_top_products(user_id):
 @analytics_bp.route('/most-expensive-products', methods=['GET'])
 @cross_origin()
 @token_required
+@cached_analytics('most-expensive-products')
 def get_most_expensive_products(user_id):
     # Access db via app.extensions within context
     with app.app_context():
@@ -333,100 +276,20 @@ def get_most_expensive_products(user_id):
             else:  # all time
                 start_date = None
 
-            # Base query
-            query = db.session.query(
-                Receipt.items,
-                Receipt.date,
-                Receipt.id
-            ).filter(
-                Receipt.user_id == user_id,
-                Receipt.items.isnot(None)
-            )
+            # Currency and has_data; the item aggregation is the only other statement
+            context, _ = with_context(db, user_id)
 
-            # Add store name filter if provided
-            if store_name:
-                query = query.filter(Receipt.store_name == store_name)
-            if store_category:
-                query = query.filter(Receipt.store_category == store_category)
-
-            # Add date filter if needed
-            if start_date:
-                query = query.filter(Receipt.date >= start_date)
-
-            receipts = query.all()
-
-            # Check if user has any receipts at all
-            any_receipts = db.session.query(Receipt).filter(
-                Receipt.user_id == user_id,
-                Receipt.items.isnot(None)
-            ).count() > 0
-
-            if len(receipts) == 0:
-                return jsonify({
-                    'period': period,
-                    'products': [],
-                    'currency': user_currency if 'user_currency' in locals() else 'USD',
-                    'has_data': any_receipts
-                })
-
-            # Process items to find most expensive products and count occurrences
-            product_data = {}  # Will store {product_name: {'max_price': float, 'count': int, 'category': str}}
-            for receipt in receipts:
-                if not receipt.items:
-                    continue
-                for item in receipt.items:
-                    if not item or not item.get('name') or not item.get('price'):
-                        continue
-                    product_name = item['name'].strip()
-                    # Ensure price is treated as float
-                    try:
-                         price = float(item.get('price', 0))
-                    except (ValueError, TypeError):
-                         price = 0.0 # Handle cases where price is not a valid number
-
-                    category = item.get('category', 'Other')  # Default to Other if no category
-
-                    if not product_name or price <= 0: # Skip if no name or invalid price
-                        continue
-
-                    # Initialize or update product data
-                    if product_name in product_data:
-                        # Update max price if this one is higher
-                        if price > product_data[product_name]['max_price']:
-                            product_data[product_name]['max_price'] = price
-                            product_data[product_name]['category'] = category  # Update category with the highest price instance
-                        # Increment count
-                        product_data[product_name]['count'] += 1
-                    else:
-                        # First time seeing this product
-                        product_data[product_name] = {
-                            'max_price': price,
-                            'count': 1,
-                            'category': category
-                        }
-
-            # Sort by max price (descending) and take top N
-            sorted_products = []
-            for name, data in product_data.items():
-                sorted_products.append({
-                    'name': name,
-                    'price': round(data['max_price'], 2),
-                    'count': data['count'],
-                    'category': data['category']
-                })
-
-            sorted_products.sort(key=lambda x: x['price'], reverse=True)
-            top_expensive = sorted_products[:limit]
-
-            # Get user currency
-            user = db.session.query(User).get(user_id) # Use db from extensions
-            user_currency = user.currency if user and user.currency else 'USD'
+            # Aggregated in the database where supported (utils/item_queries.py); only the top `limit` come back
+            top_expensive = item_queries.most_expensive_products(
+                db.session.connection(), user_id, limit,
+                start_date=start_date, store_name=store_name, store_category=store_category
+            )
 
             return jsonify({
                 'period': period,
                 'products': top_expensive,
-                'currency': user_currency,
-                'has_data': any_receipts
+                'currency': context.currency if context else 'USD',
+                'has_data': bool(context and context.has_data)
             })
         except Exception as e:
             app.logger.error(f"Error fetching most expensive products: {e}")
@@ -434,6 +297,7 @@ def get_most_expensive_products(user_id):
 
 @analytics_bp.route('/expenses-by-category', methods=['GET'])
 @token_required
+@cached_analytics('expenses-by-category')
 def expenses_by_category(user_id):
     # Access db via app.extensions within context
     with app.app_context():
@@ -453,66 +317,33 @@ def expenses_by_category(user_id):
             else:
                 start_date = None
 
-            # Query receipts
-            query = db.session.query(Receipt).filter(
-                Receipt.user_id == user_id,
-                Receipt.items.isnot(None)
-            )
-
-            # Add store name filter if provided
-            if store_name:
-                query = query.filter(Receipt.store_name == store_name)
-            if store_category:
-                query = query.filter(Receipt.store_category == store_category)
+            # Item-level rollup rows are already summed per day and category
+            query = rollup_query(
+                db, user_id, store_name, store_category,
+                ReceiptDailyRollup.category,
+                func.sum(ReceiptDailyRollup.spend).label('total')
+            ).filter(ReceiptDailyRollup.category != RECEIPT_ROW)
 
             if start_date:
-                query = query.filter(Receipt.date >= start_date)
-
-            receipts = query.all()
-
-            # Check if user has any receipts at all
-            any_receipts = db.session.query(Receipt).filter(
-                Receipt.user_id == user_id,
-                Receipt.items.isnot(None)
-            ).count() > 0
-
-            category_totals = {}
-            for receipt in receipts:
-                items = receipt.items or []
-                for item in items:
-                    category = item.get('category', 'Other')
-                    item_total = item.get('total', 0) # Use item total, not unit price
-                    try:
-                        item_total = float(item_total)
-                    except Exception:
-                        item_total = 0
-                    if not category:
-                        category = 'Other'
-                    if category in category_totals:
-                        category_totals[category] += item_total
-                    else:
-                        category_totals[category] = item_total
-
-            # Format result
-            result = [
-                {'category': cat, 'total': round(total, 2)}
-                for cat, total in category_totals.items()
-            ]
+                query = query.filter(ReceiptDailyRollup.day >= start_date)
 
-            # Sort by total descending
-            result.sort(key=lambda x: x['total'], reverse=True)
+            context, rows = with_context(db, user_id, query.group_by(ReceiptDailyRollup.category))
 
-            # Get user currency
-            user = db.session.query(User).get(user_id) # Use db from extensions
-            user_currency = user.currency if user and user.currency else 'USD'
+            # Format result, largest total first
+            result = widgets.category_breakdown(dict(rows))
 
-            return jsonify({'categories': result, 'currency': user_currency, 'has_data': any_receipts})
+            return jsonify({
+                'categories': result,
+                'currency': context.currency if context else 'USD',
+                'has_data': bool(context and context.has_data)
+            })
         except Exception as e:
             app.logger.error(f"Error in expenses_by_category: {e}")
             return jsonify({'error': 'Internal server error'}), 500
 
 @analytics_bp.route('/receipts-by-date', methods=['GET'])
 @token_required
+@cached_analytics('receipts-by-date')
 def get_receipts_by_date(user_id):
     # Access db via app.extensions within context
     with app.app_context():
@@ -542,12 +373,22 @@ def get_receipts_by_date(user_id):
                 else:
                     end_date = datetime(year, month + 1, 1).date() - timedelta(days=1)
             
-            # Query receipts for the date range
-            receipts = db.session.query(Receipt).filter(
+            # Receipts for the date range, newest first, with the user's currency
+            context, receipts = with_context(db, user_id, db.session.query(
+                Receipt.id,
+                Receipt.store_name,
+                Receipt.store_category,
+                Receipt.date,
+                Receipt.total,
+                Receipt.tax_amount,
+                Receipt.total_discount,
+                Receipt.items
+            ).filter(
                 Receipt.user_id == user_id,
                 Receipt.date >= start_date,
                 Receipt.date <= end_date
-            ).order_by(Receipt.date.desc()).all()
+            ), order_by=(Receipt.date.desc(), Receipt.id.desc()))
+            currency = context.currency if context else 'USD'
             
             # Format response
             formatted_receipts = [{
@@ -556,7 +397,7 @@ def get_receipts_by_date(user_id):
                 'store_category': r.store_category,
                 'date': r.date.strftime('%Y-%m-%d'),
                 'total': r.total,
-                'currency': r.user.currency if r.user and r.user.currency else 'USD',
+                'currency': currency,
                 'tax_amount': r.tax_amount,
                 'total_discount': r.total_discount,
                 'items': r.items
@@ -571,12 +412,14 @@ def get_receipts_by_date(user_id):
 @analytics_bp.route('/products-by-category', methods=['GET'])
 @cross_origin()
 @token_required
+@cached_analytics('products-by-category')
 def get_products_by_category(user_id):
      # Access db via app.extensions within context
     with app.app_context():
         db = app.extensions['sqlalchemy']
         category = request.args.get('category')
         period = request.args.get('period', 'week')  # week, month, all
+        limit = request.args.get('limit', type=int)  # all products when absent
         store_name = request.args.get('store_name')  # Add store name filter
         store_category = request.args.get('store_category')  # Add store category filter
         
@@ -593,80 +436,19 @@ def get_products_by_category(user_id):
             else:  # all
                 start_date = None
                 
-            # Query receipts
-            query = db.session.query(Receipt).filter(
-                Receipt.user_id == user_id,
-                Receipt.items.isnot(None)
-            )
-            
-            # Add store name filter if provided
-            if store_name:
-                query = query.filter(Receipt.store_name == store_name)
-            if store_category:
-                query = query.filter(Receipt.store_category == store_category)
-            
-            if start_date:
-                # Use Receipt.created_at or Receipt.date for filtering, assuming Receipt.date is the transaction date
-                query = query.filter(Receipt.date >= start_date)
-                
-            receipts = query.all()
-            
-            # Check if user has any receipts at all
-            any_receipts = db.session.query(Receipt).filter(
-                Receipt.user_id == user_id,
-                Receipt.items.isnot(None)
-            ).count() > 0
-            
-            # Process items to find and group products in the specified category
-            product_groups = {}
-            for receipt in receipts:
-                if not receipt.items:
-                    continue
-                for item in receipt.items:
-                    if item.get('category') == category:
-                        name = item.get('name', '')
-                        # Add null checks before float conversion
-                        try:
-                            price = float(item.get('price', 0)) if item.get('price') is not None else 0.0
-                            quantity = float(item.get('quantity', 1)) if item.get('quantity') is not None else 1.0
-                            total = float(item.get('total', 0)) if item.get('total') is not None else 0.0
-                        except (ValueError, TypeError):
-                            # Skip items with invalid numeric values
-                            continue
-                        
-                        # Use (name, price) as key to group identical products
-                        key = (name, price)
-                        if key in product_groups:
-                            product_groups[key]['quantity'] += quantity
-                            product_groups[key]['total'] += total
-                        else:
-                            product_groups[key] = {
-                                'quantity': quantity,
-                                'total': total
-                            }
-            
-            # Convert grouped products to list format
-            products = [
-                {
-                    'name': name,
-                    'quantity': round(data['quantity'], 2),
-                    'price': price,
-                    'total': round(data['total'], 2)
-                }
-                for (name, price), data in product_groups.items()
-            ]
-            
-            # Sort by total price descending
-            products.sort(key=lambda x: x['total'], reverse=True)
+            # Currency and has_data; the item aggregation is the only other statement
+            context, _ = with_context(db, user_id)
             
-            # Get user currency
-            user = db.session.query(User).get(user_id) # Use db from extensions
-            user_currency = user.currency if user and user.currency else 'USD'
+            # Grouped by (name, price) in the database where supported, largest total first
+            products = item_queries.products_by_category(
+                db.session.connection(), user_id, category, limit,
+                start_date=start_date, store_name=store_name, store_category=store_category
+            )
             
             return jsonify({
                 'items': products,
-                'currency': user_currency,
-                'has_data': any_receipts
+                'currency': context.currency if context else 'USD',
+                'has_data': bool(context and context.has_data)
             })
             
         except Exception as e:
@@ -676,6 +458,7 @@ def get_products_by_category(user_id):
 @analytics_bp.route('/shopping-days', methods=['GET'])
 @cross_origin()
 @token_required
+@cached_analytics('shopping-days')
 def get_shopping_days(user_id):
      # Access db via app.extensions within context
     with app.app_context():
@@ -695,49 +478,25 @@ def get_shopping_days(user_id):
             else:  # all time
                 start_date = None
                 
-            # Query receipts
-            query = db.session.query(Receipt).filter(
-                Receipt.user_id == user_id
-            )
-            
-            # Add store name filter if provided
-            if store_name:
-                query = query.filter(Receipt.store_name == store_name)
-            if store_category:
-                query = query.filter(Receipt.store_category == store_category)
-            
+            # Receipt counts per day from the rollup
+            query = rollup_query(
+                db, user_id, store_name, store_category,
+                ReceiptDailyRollup.day,
+                func.sum(ReceiptDailyRollup.receipt_count)
+            ).filter(ReceiptDailyRollup.category == RECEIPT_ROW)
+
             if start_date:
-                query = query.filter(Receipt.date >= start_date)
-                
-            receipts = query.all()
-            
-            # Check if user has any receipts at all
-            any_receipts = db.session.query(Receipt).filter(
-                Receipt.user_id == user_id
-            ).count() > 0
-            
-            # Initialize counts for each day of week (0 = Monday, 6 = Sunday)
-            day_counts = {i: 0 for i in range(7)}
-            
-            # Count receipts for each day of week
-            for receipt in receipts:
-                day_of_week = receipt.date.weekday()  # 0 = Monday, 6 = Sunday
-                day_counts[day_of_week] += 1
-                
-            # Format response with day names
-            day_names = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-            result = [
-                {
-                    'day': day_names[i],
-                    'count': count
-                }
-                for i, count in day_counts.items()
-            ]
-            
+                query = query.filter(ReceiptDailyRollup.day >= start_date)
+
+            context, rows = with_context(db, user_id, query.group_by(ReceiptDailyRollup.day))
+
+            # Receipts per day of week, Monday first
+            result = widgets.weekday_counts(dict(rows))
+
             return jsonify({
                 'period': period,
                 'data': result,
-                'has_data': any_receipts
+                'has_data': bool(context and context.has_data)
             })
             
         except Exception as e:
@@ -747,7 +506,17 @@ def get_shopping_days(user_id):
 @analytics_bp.route('/bill-stats', methods=['GET'])
 @cross_origin()
 @token_required
+@cached_analytics('bill-stats')
 def get_bill_stats(user_id):
+    """
+    Receipt count, average bill and its change against the previous period, from the
+    user's prefix-sum spend index (see utils/spend_index.py).
+    Query params:
+      - interval: 'M' (last 30 days, compared with the 30 before across all stores) or 'All'
+      - start, end: optional custom window (YYYY-MM-DD) instead of the interval; end defaults
+        to today. With a start it is compared with the window of the same length before it.
+      - store_name, store_category: optional filters
+    """
      # Access db via app.extensions within context
     with app.app_context():
         db = app.extensions['sqlalchemy']
@@ -757,69 +526,49 @@ def get_bill_stats(user_id):
         
         if not user_id:
             return jsonify({'error': 'Missing user_id'}), 400
+
+        try:
+            start, end = date_window()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
             
         try:
             today = datetime.utcnow().date()
-            
-            # Calculate current period stats
-            if interval == 'M':
+            # Currency, has_data and the data_version that keys the cached index
+            context, _ = with_context(db, user_id)
+            version = context.data_version if context else None
+            index = spend_index(app, db, user_id, store_name, store_category, version)
+            window = {}
+
+            # Each period is two lookups in the index
+            prev_count, prev_total = 0, 0.0
+            if start or end:
+                end = end or today
+                total_receipts, total_amount = index.totals(start, end)
+                if start:
+                    length = timedelta(days=(end - start).days + 1)
+                    prev_count, prev_total = index.totals(start - length, start - timedelta(days=1))
+                window = {'start': start.isoformat() if start else None, 'end': end.isoformat()}
+            elif interval == 'M':
                 start_date = today - timedelta(days=30)
-                query = db.session.query(Receipt).filter(
-                    Receipt.user_id == user_id,
-                    Receipt.date >= start_date
-                )
-            else:  # All time
-                query = db.session.query(Receipt).filter(Receipt.user_id == user_id)
-            
-            # Add store name filter if provided
-            if store_name:
-                query = query.filter(Receipt.store_name == store_name)
-            if store_category:
-                query = query.filter(Receipt.store_category == store_category)
-                
-            current_receipts = query.all()
-            
-            # Check if user has any receipts at all
-            any_receipts = db.session.query(Receipt).filter(
-                Receipt.user_id == user_id
-            ).count() > 0
-            
-            # Calculate current period metrics
-            total_receipts = len(current_receipts)
-            total_amount = sum(r.total for r in current_receipts)
-            avg_bill = total_amount / total_receipts if total_receipts > 0 else 0
-            
-            # Calculate previous period comparison (only for monthly view)
-            avg_bill_delta = None
-            if interval == 'M':
-                prev_start_date = start_date - timedelta(days=30)
-                prev_end_date = start_date - timedelta(days=1)
-                
-                prev_receipts = db.session.query(Receipt).filter(
-                    Receipt.user_id == user_id,
-                    Receipt.date >= prev_start_date,
-                    Receipt.date <= prev_end_date
-                ).all()
-                
-                # Only calculate delta if there are receipts in both periods
-                if prev_receipts and current_receipts:
-                    prev_total = sum(r.total for r in prev_receipts)
-                    prev_count = len(prev_receipts)
-                    prev_avg = prev_total / prev_count
-                    avg_bill_delta = avg_bill - prev_avg
-            
-            # Get user currency
-            user = db.session.query(User).get(user_id) # Use db from extensions
-            user_currency = user.currency if user and user.currency else 'USD'
-            
+                total_receipts, total_amount = index.totals(start_date)
+                # Previous period comparison, over all stores: with a store filter that is
+                # one bounded SUM instead of loading the unfiltered index as well
+                prev_start, prev_end = start_date - timedelta(days=30), start_date - timedelta(days=1)
+                if store_name or store_category:
+                    prev_count, prev_total = window_totals(db, user_id, prev_start, prev_end)
+                else:
+                    prev_count, prev_total = index.totals(prev_start, prev_end)
+            else:
+                total_receipts, total_amount = index.totals()
+
             return jsonify({
-                'total_receipts': total_receipts,
-                'average_bill': round(avg_bill, 2),
-                'average_bill_delta': round(avg_bill_delta, 2) if avg_bill_delta is not None else None,
-                'currency': user_currency,
-                'has_data': any_receipts
+                **widgets.bill_stats(total_receipts, total_amount, prev_count, prev_total),
+                **window,
+                'currency': context.currency if context else 'USD',
+                'has_data': bool(context and context.has_data)
             })
-            
+
         except Exception as e:
             app.logger.error(f"Error calculating bill stats: {e}")
             return jsonify({'error': 'Internal server error'}), 500
@@ -909,204 +658,32 @@ def save_widget_order(user_id):
             raise APIError('Failed to save widget order')
 
 @analytics_bp.route('/export-pdf', methods=['POST'])
-@token_required
+@token_required(load_user=True)
 def export_analytics_pdf(user_id):
+    """
+    Renders analytics the app collected itself into a PDF, in the request. Kept for older
+    app versions; POST /exports computes the data on the server and renders it in the background.
+    """
     app.logger.info(f"[Export PDF] Called by user_id: {user_id}")
     try:
         data = request.get_json()
-        user_plan = data.get('user_plan', 'basic')
         analytics_data = data.get('data', {})
         export_date = data.get('export_date')
+        # The plan decides which charts are included, so it is not taken from the client
+        user_plan = g.current_user.plan if g.current_user else 'basic'
         app.logger.info(f"[Export PDF] user_plan: {user_plan}, export_date: {export_date}")
 
-        # Set up PDF buffer
-        buffer = io.BytesIO()
-        styles = getSampleStyleSheet()
-        title_style = styles['Title']
-        h2_style = styles['Heading2']
-        h3_style = styles['Heading3']
-        normal_style = styles['BodyText']
-
-        # Custom styles
-        from reportlab.lib.enums import TA_CENTER
-        from reportlab.lib.units import inch
-        app_name_style = ParagraphStyle(
-            'AppName',
-            parent=title_style,
-            fontSize=28,
-            leading=34,
-            alignment=TA_CENTER,
-            textColor=colors.white,
-            spaceAfter=12,
-            spaceBefore=0,
-        )
-        export_title_style = ParagraphStyle(
-            'ExportTitle',
-            parent=title_style,
-            fontSize=20,
-            leading=26,
-            alignment=TA_CENTER,
-            textColor=colors.white,
-            spaceAfter=8,
-            spaceBefore=0,
-        )
-        # Override h2_style for table titles to be white
-        h2_white_style = ParagraphStyle(
-            'H2White',
-            parent=h2_style,
-            textColor=colors.white
-        )
-        export_date_style = ParagraphStyle(
-            'ExportDate',
-            parent=normal_style,
-            textColor=colors.white
-        )
-
-        # Define background color
-        background_color = HexColor('#202338')  # Soft dark blue
-        # Define a function to draw the background on each page
-        def draw_background(canvas, doc):
-            canvas.saveState()
-            canvas.setFillColor(background_color)
-            canvas.rect(0, 0, doc.pagesize[0], doc.pagesize[1], fill=1, stroke=0)
-            canvas.restoreState()
-
-        # Build content
-        elements = []
-        # App name at the top
-        elements.append(Paragraph('Recipta', app_name_style))
-        # Export title and date
-        elements.append(Paragraph('Analytics Export', export_title_style))
-        elements.append(Paragraph(f'Exported: {export_date[:10]}', export_date_style))
-        elements.append(Spacer(1, 18))
-
-        # Define which charts to export by plan
-        chart_map = {
-            'bill_stats': 'Bill Stats',
-            'total_spent': 'Total Spent',
-            'by_category': 'By Category',
-            'top_products': 'Top Products',
-            'most_expensive': 'Most Expensive Products',
-            'shopping_days': 'Shopping Days',
-        }
-        if user_plan == 'basic':
-            charts = ['bill_stats', 'total_spent', 'by_category']
-        else:
-            charts = list(chart_map.keys())
-
-        # Helper to add a table for a chart/interval
-        def add_table(title, headers, rows):
-            elements.append(Paragraph(title, h2_white_style))
-            t = Table([headers] + rows, hAlign='LEFT')
-            t.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), HexColor('#7e5cff')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-                ('BACKGROUND', (0, 1), (-1, -1), HexColor('#232642')),
-                ('TEXTCOLOR', (0, 1), (-1, -1), colors.white),  # Body text white
-                ('GRID', (0, 0), (-1, -1), 0.5, HexColor('#2d3748')),
-            ]))
-            elements.append(t)
-            elements.append(Spacer(1, 16))
-
-        # Bill Stats
-        if 'bill_stats' in charts:
-            for interval, stats in analytics_data.get('bill_stats', {}).items():
-                if stats.get('error') or not stats.get('has_data'):
-                    continue
-                headers = ['Interval', 'Total Receipts', 'Average Bill', 'Delta (vs prev)']
-                rows = [[interval, stats.get('total_receipts', ''), stats.get('average_bill', ''), stats.get('average_bill_delta', '')]]
-                add_table(f'Bill Stats ({interval})', headers, rows)
-
-        # Total Spent
-        if 'total_spent' in charts:
-            for interval, data in analytics_data.get('total_spent', {}).items():
-                if data.get('error') or not data.get('data'):
-                    continue
-                headers = ['Period', 'Total Spent']
-                rows = [[row.get('period', ''), row.get('total_spent', '')] for row in data.get('data', [])]
-                if rows:
-                    add_table(f'Total Spent ({interval})', headers, rows)
-
-        # By Category
-        if 'by_category' in charts:
-            for interval, data in analytics_data.get('by_category', {}).items():
-                if data.get('error') or not data.get('categories'):
-                    continue
-                headers = ['Category', 'Total']
-                rows = [[row.get('category', ''), row.get('total', '')] for row in data.get('categories', [])]
-                if rows:
-                    add_table(f'By Category ({interval})', headers, rows)
-
-        # Top Products
-        if 'top_products' in charts:
-            for interval, data in analytics_data.get('top_products', {}).items():
-                if data.get('error') or not data.get('products'):
-                    continue
-                headers = ['Product', 'Count', 'Percentage', 'Category']
-                rows = [[row.get('name', ''), row.get('count', ''), row.get('percentage', ''), row.get('category', '')] for row in data.get('products', [])]
-                if rows:
-                    add_table(f'Top Products ({interval})', headers, rows)
-
-        # Most Expensive Products
-        if 'most_expensive' in charts:
-            for interval, data in analytics_data.get('most_expensive', {}).items():
-                if data.get('error') or not data.get('products'):
-                    continue
-                headers = ['Product', 'Max Price', 'Count', 'Category']
-                rows = [[row.get('name', ''), row.get('price', ''), row.get('count', ''), row.get('category', '')] for row in data.get('products', [])]
-                if rows:
-                    add_table(f'Most Expensive Products ({interval})', headers, rows)
-
-        # Shopping Days
-        if 'shopping_days' in charts:
-            for interval, data in analytics_data.get('shopping_days', {}).items():
-                if data.get('error') or not data.get('data'):
-                    continue
-                headers = ['Day', 'Count']
-                rows = [[row.get('day', ''), row.get('count', '')] for row in data.get('data', [])]
-                if rows:
-                    add_table(f'Shopping Days ({interval})', headers, rows)
-
-        # Diet Composition (Pro only, 3months interval only)
-        if user_plan == 'pro' and 'diet_composition' in analytics_data:
-            data = analytics_data['diet_composition'].get('3months')
-            if data and not data.get('error') and data.get('data'):
-                headers = [
-                    'Date',
-                    'Fruits & Veggies %',
-                    'Meat & Poultry %',
-                    'Seafood %',
-                    'Snacks %',
-                    'Dairy & Eggs %',
-                ]
-                rows = []
-                for row in data.get('data', []):
-                    fruits_veggies = round((row.get('fruits_percent', 0) or 0) + (row.get('vegetables_percent', 0) or 0), 2)
-                    rows.append([
-                        row.get('period', ''),
-                        fruits_veggies,
-                        row.get('meat_percent', 0),
-                        row.get('seafood_percent', 0),
-                        row.get('snacks_percent', 0),
-                        row.get('dairy_percent', 0),
-                    ])
-                if rows:
-                    add_table(f'Diet Composition (3M)', headers, rows)
-
-        # If no data, add a message
-        if len(elements) <= 4:
-            elements.append(Paragraph('No analytics data available for export.', normal_style))
-
-        # Build PDF with background on each page
-        doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=36, leftMargin=36, topMargin=36, bottomMargin=36)
-        doc.build(elements, onFirstPage=draw_background, onLaterPages=draw_background)
-        buffer.seek(0)
+        # Spooled to disk and streamed from there; send_file closes (and so deletes) it
+        output = tempfile.TemporaryFile()
+        try:
+            pdf_export.build_pdf(output, user_plan, analytics_data, export_date, exports.render_mode(app))
+            output.seek(0)
+        except Exception:
+            output.close()
+            raise
         app.logger.info("[Export PDF] PDF generated successfully, sending file.")
         return send_file(
-            buffer,
+            output,
             as_attachment=True,
             download_name='analytics_export.pdf',
             mimetype='application/pdf'
@@ -1116,14 +693,73 @@ def export_analytics_pdf(user_id):
         app.logger.error(traceback.format_exc())
         return jsonify({'error': 'Failed to generate PDF'}), 500
 
+@analytics_bp.route('/exports', methods=['POST'])
+@cross_origin()
+@token_required(load_user=True)
+def create_analytics_export(user_id):
+    """
+    Starts a background PDF export of the charts the user's plan includes, computed on the
+    server (see utils/exports.py). Returns 202 with the job; poll GET /exports/<id> until
+    'completed', then fetch GET /exports/<id>/download. A job already in progress is returned
+    instead of starting another one.
+    """
+    if not g.current_user:  # read before the app context below, which has a fresh flask.g
+        return jsonify({'error': 'User not found'}), 404
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
+
+        job, created = exports.create_job(db, app, user_id)
+        if created:
+            exports.start_job(app._get_current_object(), job.id, dashboard_item_columns())
+        app.logger.info(f"[Export] {'Queued' if created else 'Reusing'} job {job.id} for user {user_id}")
+        return jsonify(exports.job_payload(app, job)), 202
+
+@analytics_bp.route('/exports/<export_id>', methods=['GET'])
+@cross_origin()
+@token_required
+def get_analytics_export(user_id, export_id):
+    """Status of an export job: queued, running, completed or failed."""
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
+        job = db.session.query(AnalyticsExport).filter_by(id=export_id, user_id=user_id).first()
+        if job is None:
+            return jsonify({'error': 'Export not found'}), 404
+        return jsonify(exports.job_payload(app, job))
+
+@analytics_bp.route('/exports/<export_id>/download', methods=['GET'])
+@cross_origin()
+@token_required
+def download_analytics_export(user_id, export_id):
+    """The rendered PDF of a completed export job."""
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
+        job = db.session.query(AnalyticsExport).filter_by(id=export_id, user_id=user_id).first()
+        if job is None:
+            return jsonify({'error': 'Export not found'}), 404
+        if job.status != 'completed':
+            return jsonify({'error': 'Export is not ready', 'status': exports.job_payload(app, job)['status']}), 409
+
+        path = exports.pdf_path(app, job.content_hash)
+        if not os.path.exists(path):
+            return jsonify({'error': 'Export has expired, please export again'}), 410
+        return send_file(
+            path,
+            as_attachment=True,
+            download_name='analytics_export.pdf',
+            mimetype='application/pdf'
+        )
+
 @analytics_bp.route('/diet-composition', methods=['GET'])
 @cross_origin()
 @token_required
+@cached_analytics('diet-composition')
 def get_diet_composition(user_id):
     """
     Returns a daily time series of plant-based and animal-based food spending percentages for all users.
     Query params:
       - interval: 'month' (last 30 days), '3months' (last 90 days), '6months' (last 180 days)
+      - start, end: optional custom window (YYYY-MM-DD) instead of the interval, up to
+        DIET_MAX_RANGE_DAYS days; end defaults to today, start to 30 days before end
       - store_name: optional filter
       - store_category: optional filter
     """
@@ -1133,109 +769,130 @@ def get_diet_composition(user_id):
         store_name = request.args.get('store_name')
         store_category = request.args.get('store_category')
 
-        user = db.session.query(User).get(user_id)
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-
-        FRUITS_CATEGORIES = {'Fruits'}
-        VEGETABLES_CATEGORIES = {'Vegetables'}
-        MEAT_CATEGORIES = {'Meat & poultry'}
-        SEAFOOD_CATEGORIES = {'Seafood'}
-        SNACKS_CATEGORIES = {'Snacks'}
-        DAIRY_CATEGORIES = {'Dairy & eggs'}
+        try:
+            start, end = date_window()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         today = datetime.utcnow().date()
-        if interval == 'month':
-            days = 30
-        elif interval == '3months':
-            days = 90
-        elif interval == '6months':
-            days = 180
+        if start or end:
+            end_date = end or today
+            start_date = start or end_date - timedelta(days=29)
+            if (end_date - start_date).days >= DIET_MAX_RANGE_DAYS:
+                return jsonify({'error': f'Date range is limited to {DIET_MAX_RANGE_DAYS} days'}), 400
+            date_list = widgets.date_range(start_date, end_date)
+            interval = 'custom'
         else:
-            days = 30  # fallback to 30 days if invalid
-        start_date = today - timedelta(days=days-1)
-        date_list = [start_date + timedelta(days=i) for i in range(days)]
-
-        # Query all receipts in the interval
-        query = db.session.query(Receipt).filter(
-            Receipt.user_id == user_id,
-            Receipt.items.isnot(None),
-            Receipt.date >= start_date,
-            Receipt.date <= today
-        )
-        if store_name:
-            query = query.filter(Receipt.store_name == store_name)
-        if store_category:
-            query = query.filter(Receipt.store_category == store_category)
-        receipts = query.all()
-
-        # Group receipts by day
-        receipts_by_day = {}
-        for receipt in receipts:
-            key = receipt.date.strftime('%Y-%m-%d')
-            if key not in receipts_by_day:
-                receipts_by_day[key] = []
-            receipts_by_day[key].append(receipt)
+            end_date = today
+            start_date, date_list = widgets.diet_window(today, interval)
+
+        # Item spend per day and category in the interval, from the rollup
+        query = rollup_query(
+            db, user_id, store_name, store_category,
+            ReceiptDailyRollup.day,
+            ReceiptDailyRollup.category,
+            func.sum(ReceiptDailyRollup.spend)
+        ).filter(
+            ReceiptDailyRollup.category != RECEIPT_ROW,
+            ReceiptDailyRollup.day >= start_date,
+            ReceiptDailyRollup.day <= end_date
+        ).group_by(ReceiptDailyRollup.day, ReceiptDailyRollup.category)
+
+        context, rows = with_context(db, user_id, query)
+        if context is None:
+            return jsonify({'error': 'User not found'}), 404
+
+        # Group category totals by day
+        totals_by_day = {}
+        for day, category, total in rows:
+            totals_by_day.setdefault(day.strftime('%Y-%m-%d'), []).append((category, total or 0.0))
 
         # For each day, calculate category spending
-        result = []
-        for d in date_list:
-            day_str = d.strftime('%Y-%m-%d')
-            sum_fruits = 0.0
-            sum_vegetables = 0.0
-            sum_meat = 0.0
-            sum_seafood = 0.0
-            sum_snacks = 0.0
-            sum_dairy = 0.0
-            sum_other = 0.0
-            for receipt in receipts_by_day.get(day_str, []):
-                for item in receipt.items or []:
-                    try:
-                        total = float(item.get('total', 0))
-                    except Exception:
-                        total = 0.0
-                    category = item.get('category', 'Other')
-                    if category in FRUITS_CATEGORIES:
-                        sum_fruits += total
-                    elif category in VEGETABLES_CATEGORIES:
-                        sum_vegetables += total
-                    elif category in MEAT_CATEGORIES:
-                        sum_meat += total
-                    elif category in SEAFOOD_CATEGORIES:
-                        sum_seafood += total
-                    elif category in SNACKS_CATEGORIES:
-                        sum_snacks += total
-                    elif category in DAIRY_CATEGORIES:
-                        sum_dairy += total
-                    else:
-                        sum_other += total
-            total_spent = sum_fruits + sum_vegetables + sum_meat + sum_seafood + sum_snacks + sum_dairy + sum_other
-            fruits_percent = (sum_fruits / total_spent * 100) if total_spent > 0 else 0.0
-            vegetables_percent = (sum_vegetables / total_spent * 100) if total_spent > 0 else 0.0
-            meat_percent = (sum_meat / total_spent * 100) if total_spent > 0 else 0.0
-            seafood_percent = (sum_seafood / total_spent * 100) if total_spent > 0 else 0.0
-            snacks_percent = (sum_snacks / total_spent * 100) if total_spent > 0 else 0.0
-            dairy_percent = (sum_dairy / total_spent * 100) if total_spent > 0 else 0.0
-            result.append({
-                'period': day_str,
-                'fruits_percent': round(fruits_percent, 2),
-                'vegetables_percent': round(vegetables_percent, 2),
-                'meat_percent': round(meat_percent, 2),
-                'seafood_percent': round(seafood_percent, 2),
-                'snacks_percent': round(snacks_percent, 2),
-                'dairy_percent': round(dairy_percent, 2),
-                'total_spent': round(total_spent, 2),
-                'sum_fruits': round(sum_fruits, 2),
-                'sum_vegetables': round(sum_vegetables, 2),
-                'sum_meat': round(sum_meat, 2),
-                'sum_seafood': round(sum_seafood, 2),
-                'sum_snacks': round(sum_snacks, 2),
-                'sum_dairy': round(sum_dairy, 2),
-            })
+        result = widgets.diet_series(date_list, totals_by_day)
 
         return jsonify({
             'interval': interval,
             'group_by': 'day',
             'data': result,
-            'currency': user.currency if user and user.currency else 'USD',
+            'currency': context.currency,
         })
+
+@analytics_bp.route('/dashboard', methods=['GET'])
+@cross_origin()
+@token_required
+@cached_analytics('dashboard')
+def get_dashboard(user_id):
+    """
+    Every requested widget's payload in one response, computed from a single scan of the
+    user's receipts. Payloads have the same shapes as the standalone widget endpoints.
+    Query params:
+      - widgets: comma separated widget names (default: the user's saved widget order)
+      - store_name, store_category: optional filters applied to every widget
+      - <widget>.<option>: per-widget option with the standalone endpoint's default,
+        e.g. top_products.period=year, total_spent.interval=weekly, bill_stats.interval=All
+    """
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
+        store_name = request.args.get('store_name')
+        store_category = request.args.get('store_category')
+
+        requested = request.args.get('widgets')
+        if requested:
+            widget_names = [w.strip() for w in requested.split(',') if w.strip()]
+            unknown = [w for w in widget_names if w not in widgets.WIDGET_PARAMS]
+            if unknown:
+                return jsonify({'error': f"Unknown widgets: {', '.join(unknown)}"}), 400
+        else:
+            saved_order = db.session.query(WidgetOrder.order).filter_by(user_id=user_id).scalar()
+            widget_names = [w for w in saved_order or widgets.DEFAULT_WIDGETS if w in widgets.WIDGET_PARAMS]
+
+        params = {
+            widget: {
+                option: request.args.get(f'{widget}.{option}', default, type=type(default))
+                for option, default in widgets.WIDGET_PARAMS[widget].items()
+            }
+            for widget in widget_names
+        }
+
+        try:
+            today = datetime.utcnow().date()
+            start_date = widgets.scan_start(widget_names, params, today)
+
+            # The one receipt scan; item JSON is only loaded when a widget reads it
+            needs_items = any(w in widget_names for w in
+                              ('expenses_by_category', 'top_products', 'most_expensive', 'diet_composition'))
+            query = db.session.query(
+                Receipt.date,
+                Receipt.total,
+                Receipt.store_name,
+                Receipt.store_category,
+                Receipt.items if needs_items else null().label('items')
+            ).filter(Receipt.user_id == user_id)
+            if start_date:
+                query = query.filter(Receipt.date >= start_date)
+            context, rows = with_context(db, user_id, query, order_by=(Receipt.date, Receipt.id))
+            user_currency = context.currency if context else 'USD'
+            any_receipts = bool(context and context.has_data)
+
+            return jsonify({
+                'widgets': widgets.build_dashboard(
+                    widget_names, params, rows, store_name, store_category,
+                    user_currency, any_receipts, today,
+                    item_columns=dashboard_item_columns()
+                ),
+                'currency': user_currency,
+                'has_data': any_receipts
+            })
+        except Exception as e:
+            app.logger.error(f"Error building analytics dashboard: {e}")
+            return jsonify({'error': 'Internal server error'}), 500
+
+@analytics_bp.route('/cache-stats', methods=['GET'])
+@cross_origin()
+@token_required
+def get_cache_stats(user_id):
+    """Hit/miss counters of this worker's analytics result cache; 404 unless ANALYTICS_CACHE_STATS_ENABLED."""
+    if not app.config.get('ANALYTICS_CACHE_STATS_ENABLED'):
+        return jsonify({'error': 'Not found'}), 404
+    cache = app.extensions.get('analytics_cache')
+    return jsonify(cache.stats() if cache else {'backend': None})
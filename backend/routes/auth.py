@@ -11,11 +11,12 @@ from utils.decorators import token_required
 
 # Import necessary components from the backend application
 # We assume db, mail, User, ValidationError, AuthenticationError, APIError,
-# and send_confirmation_email, send_password_reset_email are available via app.config or context
+# and confirmation_message, password_reset_message are available via app.config or context
 # Import User model, but not db here; access db via app.extensions['sqlalchemy']
 from models import User
 from errors import ValidationError, AuthenticationError, APIError
-from email_utils import send_confirmation_email, send_password_reset_email
+from email_utils import confirmation_message, password_reset_message
+from utils.outbox import queue_email
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
@@ -38,8 +39,7 @@ def register():
         user.set_password(password)
         user.plan = 'basic' # Assign the basic plan by default
         db.session.add(user) # Use db from extensions
-        db.session.commit() # Use db from extensions
-        app.logger.info(f"Created new user: {email}")
+        db.session.flush() # Assigns user.id for the token
         
         # Generate confirmation token
         token = jwt.encode(
@@ -51,17 +51,12 @@ def register():
             app.config['JWT_SECRET'],
             algorithm='HS256'
         )
+        # The confirmation email is committed with the user and sent by the mail worker
+        queue_email(db.session, confirmation_message(email, email, token))
+        db.session.commit() # Use db from extensions
+        app.logger.info(f"Created new user: {email}")
     
-    # Send confirmation email (can be outside app context if mail is configured for it)
-    # Access mail from the app context implicitly via app.extensions['mail']
-    if send_confirmation_email(app.extensions['mail'], email, email, token):
-        return jsonify({'message': 'Registration successful! Please check your email to verify your account.'})
-    else:
-        with app.app_context(): # Also need context for logger in error case
-             app.logger.error(f"Failed to send confirmation email to {email}")
-        return jsonify({
-            'message': 'Registration successful, but failed to send confirmation email. Please contact support.'
-        }), 500
+    return jsonify({'message': 'Registration successful! Please check your email to verify your account.'})
 
 @auth_bp.route('/login', methods=['POST'])
 def login():
@@ -76,6 +71,9 @@ def login():
             return jsonify({'message': 'Email and password are required'}), 400
         user = db.session.query(User).filter_by(email=email).first() # Use db from extensions
         if user and user.check_password(password):
+            if db.session.is_modified(user):
+                # The hash was upgraded to the current parameters
+                db.session.commit()
             if not user.email_verified:
                 return jsonify({'message': 'Please verify your email before logging in'}), 403
             # Access JWT_SECRET from the app config
@@ -248,9 +246,10 @@ def request_password_reset():
                 app.config['JWT_SECRET'],
                 algorithm='HS256'
             )
-            # Access mail from the app context
-            result = send_password_reset_email(app.extensions['mail'], user.email, user.email, token)
-            print(f"send_password_reset_email result: {result}")
+            # Sent by the mail worker (utils/outbox.py)
+            queue_email(db.session, password_reset_message(user.email, user.email, token))
+            db.session.commit()
+            print(f"Password reset email queued for: {user.email}")
         else:
             print("No user found for this email.")
     
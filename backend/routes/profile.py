@@ -7,6 +7,7 @@ from errors import AuthenticationError, APIError, ValidationError
 
 # Import the token_required decorator
 from utils.decorators import token_required
+from utils.analytics_cache import bump_data_version
 
 profile_bp = Blueprint('profile', __name__, url_prefix='/api/user/profile')
 
@@ -68,7 +69,10 @@ def update_user_profile(user_id):
             # This case indicates a potential issue with the database or token data consistency
             app.logger.error(f"User with ID {user_id} not found in DB for update based on token data.")
             return jsonify({'error': 'User not found'}), 404
-        user.currency = currency
+        if user.currency != currency:
+            user.currency = currency
+            # Cached analytics carry the currency
+            bump_data_version(db.session, {user_id})
         db.session.commit() # Use db from extensions
         return jsonify({'success': True, 'currency': user.currency})
 
@@ -1,20 +1,38 @@
-from flask import Blueprint, request, jsonify, current_app as app
+from flask import Blueprint, request, jsonify, current_app as app, stream_with_context, g
 from flask_cors import cross_origin
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import func, extract, and_, or_
+from sqlalchemy.exc import IntegrityError
+import base64
+import csv
 import hashlib
+import io
 import json
 
 # Import necessary components from the backend application
-from models import User, Receipt
+from models import User, Receipt, ReceiptTombstone
 from errors import AuthenticationError, APIError, ValidationError
 
 # Import the token_required decorator
-from utils.decorators import token_required
+from utils.decorators import token_required, idempotent
+from utils.current_user import current_user
+from utils.usage import reserve_receipt_slots, release_receipt_slot
+from utils.search import search_receipt_ids, search_terms
 
 receipts_bp = Blueprint('receipts', __name__, url_prefix='/api/receipts')
 
 BASIC_MONTHLY_LIMIT = 8 # Define the monthly limit for basic users (now 8 per calendar month)
+RECEIPTS_DEFAULT_PAGE_SIZE = 50
+RECEIPTS_MAX_PAGE_SIZE = 200
+CHANGES_DEFAULT_PAGE_SIZE = 500
+BATCH_MAX_RECEIPTS = 500
+BATCH_LOOKUP_CHUNK = 500 # Fingerprints per IN (...) lookup
+SEARCH_DEFAULT_PAGE_SIZE = 20
+EXPORT_FETCH_SIZE = 500 # Rows per server-side cursor fetch
+EXPORT_FLUSH_ROWS = 200 # Output rows buffered before each chunk is sent
+
+EXPORT_RECEIPT_COLUMNS = ['id', 'date', 'store_name', 'store_category', 'total', 'tax_amount', 'total_discount', 'currency', 'item_count', 'created_at']
+EXPORT_ITEM_COLUMNS = ['item_name', 'item_category', 'item_quantity', 'item_price', 'item_total', 'item_discount']
 
 def canonicalize_receipt(data):
     # Ensure all relevant fields are present and items are sorted
@@ -44,42 +62,281 @@ def compute_fingerprint(receipt):
     canonical = json.dumps(receipt, sort_keys=True, separators=(',', ':'))
     return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
 
+def receipt_fingerprint(data):
+    """The fingerprint of a receipt payload; raises ValidationError for items it cannot canonicalize."""
+    items = data.get('items') or []
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValidationError('items must be a list of objects')
+    try:
+        # Sorting fails on items mixing types, e.g. a price given as a number and as a string
+        return compute_fingerprint(canonicalize_receipt(data))
+    except TypeError:
+        raise ValidationError('Invalid item name or price')
+
+def build_receipt(user_id, data, fingerprint):
+    """Validates a receipt payload and returns an unsaved Receipt with its line items."""
+    required_fields = ['date', 'total']
+    for field in required_fields:
+        if field not in data or data[field] is None:
+            raise ValidationError(f'Missing required field: {field}')
+    try:
+        receipt_date = datetime.strptime(data['date'], '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValidationError('Invalid date format')
+
+    receipt = Receipt(
+        user_id=user_id,
+        store_category=data.get('store_category'),
+        store_name=data.get('store_name'),
+        date=receipt_date,
+        total=data.get('total'),
+        tax_amount=data.get('tax_amount'),
+        total_discount=data.get('total_discount'),
+        items=data.get('items'),
+        fingerprint=fingerprint
+    )
+    receipt.sync_line_items()
+    return receipt
+
+def serialize_receipt(r, currency):
+    return {
+        'id': r.id,
+        'store_category': r.store_category,
+        'store_name': r.store_name,
+        'date': r.date.strftime('%Y-%m-%d'),
+        'total': r.total,
+        'currency': currency,
+        'tax_amount': r.tax_amount,
+        'total_discount': r.total_discount,
+        'items': r.items,
+        'fingerprint': '',  # not stored in DB but can be recalculated if needed
+        'timestamp': int(r.created_at.timestamp() * 1000),
+    }
+
+def encode_cursor(receipt_date, receipt_id):
+    raw = f"{receipt_date.strftime('%Y-%m-%d')}|{receipt_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Returns (date, id) from an opaque cursor, or raises ValueError."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        date_str, id_str = raw.split('|')
+        return datetime.strptime(date_str, '%Y-%m-%d').date(), int(id_str)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def encode_sync_cursor(changed_at, receipt_id):
+    raw = f"{changed_at.isoformat()}|{receipt_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_sync_cursor(cursor):
+    """Returns (timestamp, receipt id) from a sync cursor, or raises ValueError."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        ts_str, id_str = raw.split('|')
+        return datetime.fromisoformat(ts_str), int(id_str)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def receipts_version(db, user_id):
+    """
+    Returns (etag_basis, currency) for the user's receipt collection in one statement.
+    The basis changes whenever a receipt is inserted, updated or deleted, and is read
+    from the (user_id, updated_at) / (user_id, deleted_at) indexes, not the rows.
+    """
+    def scalar(column, model):
+        return db.session.query(column).filter(model.user_id == user_id).scalar_subquery()
+
+    row = db.session.query(
+        scalar(func.count(Receipt.id), Receipt),
+        scalar(func.max(Receipt.updated_at), Receipt),
+        scalar(func.count(ReceiptTombstone.id), ReceiptTombstone),
+        scalar(func.max(ReceiptTombstone.deleted_at), ReceiptTombstone),
+        db.session.query(User.currency).filter(User.id == user_id).scalar_subquery(),
+    ).one()
+    receipt_count, last_update, tombstone_count, last_delete, currency = row
+    basis = f"{user_id}:{receipt_count}:{last_update}:{tombstone_count}:{last_delete}:{currency}"
+    return basis, currency or 'USD'
+
+def make_etag(basis):
+    return hashlib.sha256(basis.encode('utf-8')).hexdigest()
+
+def not_modified(etag):
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
 @receipts_bp.route('', methods=['GET'])
 @token_required
 def get_receipts(user_id):
+    """
+    Returns the user's receipts, newest first.
+    Query params:
+      - limit: page size (max RECEIPTS_MAX_PAGE_SIZE); omitted with no cursor returns every receipt
+      - cursor: opaque next_cursor from the previous page
+      - sections: 'true' to include per-month headers (count and sum over the whole month)
+    """
     # Access db via app.extensions within context
     with app.app_context():
         db = app.extensions['sqlalchemy']
-        # user_id is now passed by the decorator
-        # user_id = request.args.get('user_id', type=int) # Removed
 
         if not user_id:
             # This should be caught by the decorator, but for safety:
             app.logger.warning("User ID missing (or None) passed to get_receipts.")
             raise AuthenticationError('User ID is required')
 
-        receipts = db.session.query(Receipt).filter_by(user_id=user_id).all() # Use the passed user_id
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', type=int)
+        with_sections = request.args.get('sections', 'false').lower() in ('1', 'true', 'yes')
+
+        if cursor and not limit:
+            limit = RECEIPTS_DEFAULT_PAGE_SIZE
+        if limit is not None:
+            if limit <= 0:
+                return jsonify({'error': 'limit must be positive'}), 400
+            limit = min(limit, RECEIPTS_MAX_PAGE_SIZE)
+
+        # One lookup instead of lazy-loading r.user per row; it also yields the
+        # collection version, so an unchanged list is answered with a 304.
+        basis, currency = receipts_version(db, user_id)
+        etag = make_etag(f"{basis}:{request.query_string.decode('utf-8')}")
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+
+        if with_sections:
+            # Month totals are computed by window functions over all of the user's
+            # receipts, before the keyset filter, so each page carries the full
+            # header for every month it touches.
+            month_key = extract('year', Receipt.date) * 100 + extract('month', Receipt.date)
+            monthly = db.session.query(
+                Receipt.id.label('id'),
+                func.count(Receipt.id).over(partition_by=month_key).label('month_count'),
+                func.sum(Receipt.total).over(partition_by=month_key).label('month_total'),
+            ).filter(Receipt.user_id == user_id).subquery()
+            query = db.session.query(Receipt, monthly.c.month_count, monthly.c.month_total)\
+                .join(monthly, monthly.c.id == Receipt.id)
+        else:
+            query = db.session.query(Receipt).filter(Receipt.user_id == user_id)
+
+        if cursor:
+            try:
+                cursor_date, cursor_id = decode_cursor(cursor)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            query = query.filter(or_(
+                Receipt.date < cursor_date,
+                and_(Receipt.date == cursor_date, Receipt.id < cursor_id)
+            ))
+
+        query = query.order_by(Receipt.date.desc(), Receipt.id.desc())
+        if limit is not None:
+            # Fetch one extra row to know whether another page exists
+            query = query.limit(limit + 1)
+        rows = query.all()
+
+        has_more = limit is not None and len(rows) > limit
+        if has_more:
+            rows = rows[:limit]
+
+        receipts = []
+        sections = []
+        for row in rows:
+            r = row[0] if with_sections else row
+            if with_sections:
+                month = r.date.strftime('%Y-%m')
+                if not sections or sections[-1]['month'] != month:
+                    sections.append({
+                        'month': month,
+                        'count': row.month_count,
+                        'total': round(row.month_total or 0, 2),
+                    })
+            receipts.append(serialize_receipt(r, currency))
+
+        response = {'receipts': receipts}
+        if limit is not None:
+            response['has_more'] = has_more
+            response['next_cursor'] = None
+            if has_more:
+                last = rows[-1][0] if with_sections else rows[-1]
+                response['next_cursor'] = encode_cursor(last.date, last.id)
+        if with_sections:
+            response['sections'] = sections
+        response = jsonify(response)
+        response.set_etag(etag)
+        return response
+
+@receipts_bp.route('/changes', methods=['GET'])
+@token_required
+def get_receipt_changes(user_id):
+    """
+    Delta sync: receipts created or updated after the cursor, plus ids of receipts deleted since.
+    Query params:
+      - since: next_cursor from the previous sync; omitted returns everything
+      - limit: max receipts per response (default CHANGES_DEFAULT_PAGE_SIZE)
+    Supports If-None-Match; an unchanged collection returns 304.
+    """
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
 
-        return jsonify({
-            'receipts': [
-                {
-                    'id': r.id,
-                    'store_category': r.store_category,
-                    'store_name': r.store_name,
-                    'date': r.date.strftime('%Y-%m-%d'),
-                    'total': r.total,
-                    'currency': r.user.currency if r.user and r.user.currency else 'USD',
-                    'tax_amount': r.tax_amount,
-                    'total_discount': r.total_discount,
-                    'items': r.items,
-                    'fingerprint': '',  # not stored in DB but can be recalculated if needed
-                    'timestamp': int(r.created_at.timestamp() * 1000),
-                } for r in receipts
-            ]
+        since = request.args.get('since')
+        limit = request.args.get('limit', CHANGES_DEFAULT_PAGE_SIZE, type=int)
+        if limit <= 0:
+            return jsonify({'error': 'limit must be positive'}), 400
+        limit = min(limit, CHANGES_DEFAULT_PAGE_SIZE)
+
+        since_ts, since_id = None, None
+        if since:
+            try:
+                since_ts, since_id = decode_sync_cursor(since)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+
+        basis, currency = receipts_version(db, user_id)
+        etag = make_etag(f"{basis}:changes:{since}:{limit}")
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+
+        query = db.session.query(Receipt).filter(Receipt.user_id == user_id)
+        if since_ts is not None:
+            query = query.filter(or_(
+                Receipt.updated_at > since_ts,
+                and_(Receipt.updated_at == since_ts, Receipt.id > since_id)
+            ))
+        changed = query.order_by(Receipt.updated_at, Receipt.id).limit(limit + 1).all()
+        has_more = len(changed) > limit
+        if has_more:
+            changed = changed[:limit]
+
+        tombstones = db.session.query(ReceiptTombstone.receipt_id, ReceiptTombstone.deleted_at)\
+            .filter(ReceiptTombstone.user_id == user_id)
+        if since_ts is not None:
+            tombstones = tombstones.filter(ReceiptTombstone.deleted_at > since_ts)
+        if has_more:
+            # Keep deletions in the same window as the receipts page
+            tombstones = tombstones.filter(ReceiptTombstone.deleted_at <= changed[-1].updated_at)
+        tombstones = tombstones.order_by(ReceiptTombstone.deleted_at).all()
+
+        # Advance the cursor to the newest change returned; a deletion-only
+        # advance uses id 0 so receipts updated at that instant are resent.
+        next_ts, next_id = since_ts, since_id
+        if changed:
+            next_ts, next_id = changed[-1].updated_at, changed[-1].id
+        if tombstones and (next_ts is None or tombstones[-1].deleted_at > next_ts):
+            next_ts, next_id = tombstones[-1].deleted_at, 0
+
+        response = jsonify({
+            'receipts': [serialize_receipt(r, currency) for r in changed],
+            'deleted': [t.receipt_id for t in tombstones],
+            'has_more': has_more,
+            'next_cursor': encode_sync_cursor(next_ts, next_id) if next_ts is not None else since,
         })
+        response.set_etag(etag)
+        return response
 
 @receipts_bp.route('', methods=['POST'])
-@token_required
+@token_required(load_user=True)
+@idempotent
 def add_receipt(user_id):
     data = request.get_json()
 
@@ -90,33 +347,27 @@ def add_receipt(user_id):
     if not data:
          return jsonify({'error': 'Request body is empty'}), 400
 
+    # Slim projection with the plan, loaded by token_required. Read before the app context
+    # below, which comes with a fresh flask.g.
+    user = g.current_user
+
     # Access db via app.extensions within context
     with app.app_context():
         db = app.extensions['sqlalchemy']
-        user = db.session.query(User).get(user_id) # Get the user to check their plan
         
         if not user:
             app.logger.error(f"User with ID {user_id} not found in DB during add_receipt.")
             return jsonify({'error': 'User not found'}), 404
 
         # --- Plan Restriction Check ----
-        if user.plan == 'basic':
-            # Only allow 8 scans per current calendar month
-            today = datetime.utcnow().date()
-            first_day = today.replace(day=1)
-            if today.month == 12:
-                next_month = today.replace(year=today.year + 1, month=1, day=1)
-            else:
-                next_month = today.replace(month=today.month + 1, day=1)
-            current_month_receipt_count = db.session.query(Receipt).filter(
-                Receipt.user_id == user_id,
-                Receipt.date >= first_day,
-                Receipt.date < next_month
-            ).count()
-
-            if current_month_receipt_count >= BASIC_MONTHLY_LIMIT:
-                app.logger.info(f"Basic user {user_id} reached monthly receipt limit.")
-                return jsonify({'error': f'Monthly receipt limit ({BASIC_MONTHLY_LIMIT}) reached for basic plan. Upgrade to add more.'}), 403 # Use 403 Forbidden
+        # Only allow 8 scans per current calendar month on the basic plan. The slot is
+        # taken with a conditional update on the usage counter and is only kept if the
+        # receipt is committed below.
+        limit = BASIC_MONTHLY_LIMIT if user.plan == 'basic' else None
+        if not reserve_receipt_slots(db.session, user_id, 1, limit):
+            db.session.rollback()
+            app.logger.info(f"Basic user {user_id} reached monthly receipt limit.")
+            return jsonify({'error': f'Monthly receipt limit ({BASIC_MONTHLY_LIMIT}) reached for basic plan. Upgrade to add more.'}), 403 # Use 403 Forbidden
         # --- End Plan Restriction Check ---
 
         # Canonicalize and compute fingerprint on backend (after plan check)
@@ -126,39 +377,265 @@ def add_receipt(user_id):
         # Check for duplicate (after plan check)
         existing = db.session.query(Receipt).filter_by(user_id=user_id, fingerprint=fingerprint).first()
         if existing:
+            db.session.rollback()
             app.logger.info(f"Duplicate receipt detected for user {user_id}.")
             return jsonify({'error': 'Receipt already saved'}), 409
 
         try:
-            # Validate required fields in data
-            required_fields = ['date', 'total']
-            for field in required_fields:
-                if field not in data or data[field] is None:
-                     raise ValidationError(f'Missing required field: {field}')
-
-            receipt = Receipt(
-                user_id=user_id,
-                store_category=data.get('store_category'),
-                store_name=data.get('store_name'),
-                date=datetime.strptime(data['date'], '%Y-%m-%d').date(),
-                total=data.get('total'),
-                tax_amount=data.get('tax_amount'),
-                total_discount=data.get('total_discount'),
-                items=data.get('items'),
-                fingerprint=fingerprint
-            )
+            receipt = build_receipt(user_id, data, fingerprint)
             db.session.add(receipt)
             db.session.commit() # Use db from extensions
             app.logger.info(f"Receipt saved successfully for user {user_id}.")
             return jsonify({'message': 'Receipt saved', 'id': receipt.id}), 201 # Use 201 Created
         except ValidationError as e:
-             app.logger.warning(f"Validation error saving receipt for user {user_id}: {e}")
-             return jsonify({'error': str(e)}), 400
+             db.session.rollback()
+             app.logger.warning(f"Validation error saving receipt for user {user_id}: {e.message}")
+             return jsonify({'error': e.message}), 400
         except Exception as e:
+            db.session.rollback()
             app.logger.error(f"Error saving receipt for user {user_id}: {e}")
             return jsonify({'error': 'Failed to save receipt'}), 500
 
 
+def export_rows(rows, currency, flatten):
+    """Yields one flat dict per receipt, or per item when `flatten` is set."""
+    for r in rows:
+        items = r.items or []
+        receipt_row = {
+            'id': r.id,
+            'date': r.date.strftime('%Y-%m-%d') if r.date else None,
+            'store_name': r.store_name,
+            'store_category': r.store_category,
+            'total': r.total,
+            'tax_amount': r.tax_amount,
+            'total_discount': r.total_discount,
+            'currency': currency,
+            'item_count': len(items),
+            'created_at': r.created_at.isoformat() if r.created_at else None,
+        }
+        if not flatten:
+            receipt_row['items'] = items
+            yield receipt_row
+            continue
+        for item in items or [{}]:
+            item = item if isinstance(item, dict) else {}
+            yield {
+                **receipt_row,
+                'item_name': item.get('name'),
+                'item_category': item.get('category'),
+                'item_quantity': item.get('quantity'),
+                'item_price': item.get('price'),
+                'item_total': item.get('total'),
+                'item_discount': item.get('discount'),
+            }
+
+@receipts_bp.route('/export', methods=['GET'])
+@token_required(load_user=True)
+def export_receipts(user_id):
+    """
+    Streams the user's full receipt history, oldest first.
+    Query params:
+      - format: 'csv' (default) or 'ndjson'
+      - flatten: 'true' for one row per item instead of one per receipt
+        (unflattened, CSV leaves items out and NDJSON embeds them)
+    Rows are read through a server-side cursor and written out in small chunks, so memory
+    use does not depend on the size of the history.
+    """
+    export_format = request.args.get('format', 'csv').lower()
+    flatten = request.args.get('flatten', 'false').lower() in ('1', 'true', 'yes')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': "format must be 'csv' or 'ndjson'"}), 400
+
+    db = app.extensions['sqlalchemy']
+    currency = g.current_user.currency if g.current_user else 'USD'
+    rows = db.session.query(
+        Receipt.id, Receipt.date, Receipt.store_name, Receipt.store_category, Receipt.total,
+        Receipt.tax_amount, Receipt.total_discount, Receipt.items, Receipt.created_at
+    ).filter(Receipt.user_id == user_id)\
+        .order_by(Receipt.date, Receipt.id)\
+        .yield_per(EXPORT_FETCH_SIZE)
+
+    def generate_csv():
+        buffer = io.StringIO()
+        columns = EXPORT_RECEIPT_COLUMNS + (EXPORT_ITEM_COLUMNS if flatten else [])
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        for count, row in enumerate(export_rows(rows, currency, flatten), start=1):
+            writer.writerow(row)
+            if count % EXPORT_FLUSH_ROWS == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    def generate_ndjson():
+        lines = []
+        for row in export_rows(rows, currency, flatten):
+            lines.append(json.dumps(row, default=str))
+            if len(lines) == EXPORT_FLUSH_ROWS:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    app.logger.info(f"Streaming {export_format} receipt export for user {user_id} (flatten={flatten}).")
+    filename = f"receipts_{datetime.utcnow().strftime('%Y-%m-%d')}.{export_format}"
+    if export_format == 'csv':
+        body, mimetype = generate_csv(), 'text/csv'
+    else:
+        body, mimetype = generate_ndjson(), 'application/x-ndjson'
+    response = app.response_class(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+@receipts_bp.route('/search', methods=['GET'])
+@token_required(load_user=True)
+def search_receipts(user_id):
+    """
+    Ranked full-text search over store names and item names.
+    Query params:
+      - q: search text; every word is matched as a prefix ('mil' finds 'milk')
+      - limit: page size (default SEARCH_DEFAULT_PAGE_SIZE, max RECEIPTS_MAX_PAGE_SIZE)
+      - offset: number of results to skip
+    """
+    q = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', SEARCH_DEFAULT_PAGE_SIZE, type=int), 1), RECEIPTS_MAX_PAGE_SIZE)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+
+    if not search_terms(q):
+        return jsonify({'error': 'Missing search query'}), 400
+
+    currency = g.current_user.currency if g.current_user else 'USD'
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
+        # Fetch one extra hit to know whether another page exists
+        hits = search_receipt_ids(db.session, user_id, q, limit + 1, offset)
+        has_more = len(hits) > limit
+        hits = hits[:limit]
+
+        receipts_by_id = {}
+        if hits:
+            receipts_by_id = {
+                r.id: r for r in db.session.query(Receipt).filter(
+                    Receipt.user_id == user_id,
+                    Receipt.id.in_([receipt_id for receipt_id, _ in hits])
+                )
+            }
+
+        results = []
+        for receipt_id, rank in hits:
+            receipt = receipts_by_id.get(receipt_id)
+            if receipt:
+                results.append({**serialize_receipt(receipt, currency), 'rank': round(float(rank), 4)})
+
+        return jsonify({
+            'query': q,
+            'receipts': results,
+            'has_more': has_more,
+            'next_offset': offset + limit if has_more else None,
+        })
+
+@receipts_bp.route('/batch', methods=['POST'])
+@token_required(load_user=True)
+@idempotent
+def add_receipts_batch(user_id):
+    """
+    Bulk import. Body: {"receipts": [<receipt>, ...]} (at most BATCH_MAX_RECEIPTS).
+    Plan quota is checked once, duplicates are found with one IN lookup per chunk and
+    all new receipts are inserted in a single transaction. Returns a status per receipt:
+    created, duplicate, invalid or limit_reached.
+    """
+    data = request.get_json() or {}
+    payloads = data.get('receipts')
+
+    if not isinstance(payloads, list) or not payloads:
+        return jsonify({'error': 'receipts must be a non-empty list'}), 400
+    if len(payloads) > BATCH_MAX_RECEIPTS:
+        return jsonify({'error': f'At most {BATCH_MAX_RECEIPTS} receipts per batch'}), 400
+
+    user = g.current_user  # read before the app context below, which has a fresh flask.g
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
+        if not user:
+            app.logger.error(f"User with ID {user_id} not found in DB during add_receipts_batch.")
+            return jsonify({'error': 'User not found'}), 404
+
+        results = [None] * len(payloads)
+        candidates = []  # (index, fingerprint, payload)
+        seen = set()
+        for index, payload in enumerate(payloads):
+            if not isinstance(payload, dict):
+                results[index] = {'index': index, 'status': 'invalid', 'error': 'Receipt must be an object'}
+                continue
+            try:
+                fingerprint = receipt_fingerprint(payload)
+            except ValidationError as e:
+                results[index] = {'index': index, 'status': 'invalid', 'error': e.message}
+                continue
+            if fingerprint in seen:
+                results[index] = {'index': index, 'status': 'duplicate'}
+                continue
+            seen.add(fingerprint)
+            candidates.append((index, fingerprint, payload))
+
+        # One retry covers a concurrent insert racing us on uix_user_fingerprint
+        for attempt in range(2):
+            existing = set()
+            fingerprints = [fingerprint for _, fingerprint, _ in candidates]
+            for start in range(0, len(fingerprints), BATCH_LOOKUP_CHUNK):
+                chunk = fingerprints[start:start + BATCH_LOOKUP_CHUNK]
+                existing.update(row.fingerprint for row in db.session.query(Receipt.fingerprint).filter(
+                    Receipt.user_id == user_id,
+                    Receipt.fingerprint.in_(chunk)
+                ))
+
+            batch_results = {}
+            new_receipts = []  # (index, Receipt)
+            for index, fingerprint, payload in candidates:
+                if fingerprint in existing:
+                    batch_results[index] = {'index': index, 'status': 'duplicate'}
+                    continue
+                try:
+                    receipt = build_receipt(user_id, payload, fingerprint)
+                except ValidationError as e:
+                    batch_results[index] = {'index': index, 'status': 'invalid', 'error': e.message}
+                    continue
+                new_receipts.append((index, receipt))
+
+            # --- Plan Restriction Check (once per batch) ----
+            limit = BASIC_MONTHLY_LIMIT if user.plan == 'basic' else None
+            granted = reserve_receipt_slots(db.session, user_id, len(new_receipts), limit)
+            for index, _ in new_receipts[granted:]:
+                batch_results[index] = {'index': index, 'status': 'limit_reached'}
+            new_receipts = new_receipts[:granted]
+
+            try:
+                # The ORM sends these as multi-row INSERT ... RETURNING batches
+                db.session.add_all([receipt for _, receipt in new_receipts])
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if attempt == 1:
+                    app.logger.error(f"Fingerprint conflict persisted in batch import for user {user_id}.")
+                    return jsonify({'error': 'Failed to save receipts'}), 409
+                app.logger.info(f"Concurrent insert during batch import for user {user_id}, retrying dedup.")
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Error saving receipt batch for user {user_id}: {e}")
+                return jsonify({'error': 'Failed to save receipts'}), 500
+
+        for index, receipt in new_receipts:
+            batch_results[index] = {'index': index, 'status': 'created', 'id': receipt.id}
+        for index, result in batch_results.items():
+            results[index] = result
+
+        summary = {}
+        for result in results:
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+        app.logger.info(f"Batch import for user {user_id}: {summary}")
+        return jsonify({'results': results, 'summary': summary})
+
 @receipts_bp.route('/<int:receipt_id>', methods=['DELETE'])
 @token_required
 def delete_receipt(user_id, receipt_id):
@@ -171,6 +648,8 @@ def delete_receipt(user_id, receipt_id):
                 return jsonify({'error': 'Receipt not found or does not belong to user'}), 404
 
             db.session.delete(receipt) # Use db from extensions
+            db.session.add(ReceiptTombstone(user_id=user_id, receipt_id=receipt_id))
+            release_receipt_slot(db.session, user_id, receipt.created_at)
             db.session.commit() # Use db from extensions
             app.logger.info(f"Receipt {receipt_id} deleted successfully for user {user_id}.")
             return jsonify({'message': 'Receipt deleted'})
@@ -178,6 +657,92 @@ def delete_receipt(user_id, receipt_id):
         app.logger.error(f"Error deleting receipt {receipt_id} for user {user_id}: {e}")
         return jsonify({'error': 'Failed to delete receipt'}), 500
 
+def parse_price(value):
+    """Parses a user-entered price, accepting a decimal comma. Raises ValueError/TypeError."""
+    if isinstance(value, str):
+        value = value.replace(',', '.')
+    return float(value)
+
+def recalculate_total(items):
+    # Recalculate receipt total - handle None values properly
+    return sum(
+        float(i.get('total', 0)) if i.get('total') is not None else 0
+        for i in items
+    )
+
+def apply_field_edit(receipt, field, value):
+    """Applies a header edit (store_name, date, store_category). Raises ValidationError."""
+    if field == 'store_name':
+        if not isinstance(value, str) or not value.strip():
+            raise ValidationError('Invalid store name')
+        receipt.store_name = value.strip()
+    elif field == 'date':
+        # Accept both YYYY-MM-DD and ISO format
+        if not isinstance(value, str):
+            raise ValidationError('Invalid date format')
+        try:
+            receipt.date = datetime.strptime(value.split('T')[0], '%Y-%m-%d').date()
+        except ValueError:
+            raise ValidationError('Invalid date format')
+    elif field == 'store_category':
+        if not isinstance(value, str) or not value.strip():
+            raise ValidationError('Invalid store category')
+        receipt.store_category = value.strip()
+    else:
+        raise ValidationError('Invalid update request')
+
+def apply_item_edit(item, item_field, item_value):
+    """Applies an edit to one item dict in place (name, quantity, category, price). Raises ValidationError."""
+    if item_field == 'name':
+        if not isinstance(item_value, str) or not item_value.strip():
+            raise ValidationError('Invalid item name')
+        item['name'] = item_value.strip()
+    elif item_field == 'quantity':
+        try:
+            qty = float(item_value)
+        except Exception:
+            raise ValidationError('Invalid quantity')
+        if qty <= 0:
+            raise ValidationError('Quantity must be positive')
+        # Recalculate total for this item - handle None values properly
+        try:
+            price = float(item.get('price', 0)) if item.get('price') is not None else 0
+        except Exception:
+            raise ValidationError('Invalid quantity')
+        item['quantity'] = qty
+        item['total'] = price * qty
+    elif item_field == 'category':
+        if not isinstance(item_value, str) or not item_value.strip():
+            raise ValidationError('Invalid category')
+        item['category'] = item_value.strip()
+    elif item_field == 'price':
+        try:
+            new_price = parse_price(item_value)
+        except Exception:
+            raise ValidationError('Invalid price format')
+        try:
+            quantity = float(item.get('quantity', 1))
+        except Exception:
+            quantity = 1
+        item['price'] = new_price
+        item['total'] = new_price * quantity
+    else:
+        raise ValidationError('Invalid update request')
+
+def receipt_edit_response(receipt):
+    user = current_user(receipt.user_id)
+    return {
+        'id': receipt.id,
+        'store_category': receipt.store_category,
+        'store_name': receipt.store_name,
+        'date': receipt.date.strftime('%Y-%m-%d'),
+        'total': receipt.total,
+        'currency': user.currency if user else 'USD',
+        'tax_amount': receipt.tax_amount,
+        'total_discount': receipt.total_discount,
+        'items': receipt.items,
+    }
+
 @receipts_bp.route('/<int:receipt_id>/item-price', methods=['PATCH'])
 @token_required
 def update_item_price(user_id, receipt_id):
@@ -188,14 +753,6 @@ def update_item_price(user_id, receipt_id):
     if item_index is None or new_price is None:
         return jsonify({'error': 'Missing item_index or new_price'}), 400
 
-    # Robust float conversion
-    try:
-        if isinstance(new_price, str):
-            new_price = new_price.replace(',', '.')
-        new_price = float(new_price)
-    except Exception:
-        return jsonify({'error': 'Invalid price format'}), 400
-
     with app.app_context():
         db = app.extensions['sqlalchemy']
         receipt = db.session.query(Receipt).filter_by(id=receipt_id, user_id=user_id).first()
@@ -207,31 +764,16 @@ def update_item_price(user_id, receipt_id):
         # Update the price and total for the item
         item = receipt.items[item_index]
         try:
-            quantity = float(item.get('quantity', 1))
-        except Exception:
-            quantity = 1
-        item['price'] = new_price
-        item['total'] = new_price * quantity
+            apply_item_edit(item, 'price', new_price)
+        except ValidationError as e:
+            return jsonify({'error': e.message}), 400
         receipt.items[item_index] = item
 
-        # Recalculate receipt total - handle None values properly
-        receipt.total = sum(
-            float(i.get('total', 0)) if i.get('total') is not None else 0 
-            for i in receipt.items
-        )
+        receipt.total = recalculate_total(receipt.items)
+        receipt.sync_line_items()
 
         db.session.commit()
-        return jsonify({'success': True, 'receipt': {
-            'id': receipt.id,
-            'store_category': receipt.store_category,
-            'store_name': receipt.store_name,
-            'date': receipt.date.strftime('%Y-%m-%d'),
-            'total': receipt.total,
-            'currency': receipt.user.currency if receipt.user and receipt.user.currency else 'USD',
-            'tax_amount': receipt.tax_amount,
-            'total_discount': receipt.total_discount,
-            'items': receipt.items,
-        }})
+        return jsonify({'success': True, 'receipt': receipt_edit_response(receipt)})
 
 @receipts_bp.route('/<int:receipt_id>/update-field', methods=['PATCH'])
 @token_required
@@ -251,80 +793,101 @@ def update_receipt_field(user_id, receipt_id):
 
         # Update store_name or date
         if field in ['store_name', 'date', 'store_category']:
-            if field == 'store_name':
-                if not isinstance(value, str) or not value.strip():
-                    return jsonify({'error': 'Invalid store name'}), 400
-                receipt.store_name = value.strip()
-            elif field == 'date':
-                try:
-                    # Accept both YYYY-MM-DD and ISO format
-                    if isinstance(value, str):
-                        if 'T' in value:
-                            value = value.split('T')[0]
-                        receipt.date = datetime.strptime(value, '%Y-%m-%d').date()
-                    else:
-                        return jsonify({'error': 'Invalid date format'}), 400
-                except Exception:
-                    return jsonify({'error': 'Invalid date format'}), 400
-            elif field == 'store_category':
-                if not isinstance(value, str) or not value.strip():
-                    return jsonify({'error': 'Invalid store category'}), 400
-                receipt.store_category = value.strip()
+            try:
+                apply_field_edit(receipt, field, value)
+            except ValidationError as e:
+                return jsonify({'error': e.message}), 400
+            if field == 'date':
+                receipt.sync_line_items()  # item rows carry the receipt date
             db.session.commit()
-            return jsonify({'success': True, 'receipt': {
-                'id': receipt.id,
-                'store_category': receipt.store_category,
-                'store_name': receipt.store_name,
-                'date': receipt.date.strftime('%Y-%m-%d'),
-                'total': receipt.total,
-                'currency': receipt.user.currency if receipt.user and receipt.user.currency else 'USD',
-                'tax_amount': receipt.tax_amount,
-                'total_discount': receipt.total_discount,
-                'items': receipt.items,
-                'store_category': receipt.store_category,
-            }})
+            return jsonify({'success': True, 'receipt': receipt_edit_response(receipt)})
 
         # Update item fields (name, quantity)
         if item_index is not None and item_field in ['name', 'quantity', 'category']:
             if not receipt.items or not (0 <= item_index < len(receipt.items)):
                 return jsonify({'error': 'Invalid item index'}), 400
             item = receipt.items[item_index]
-            if item_field == 'name':
-                if not isinstance(item_value, str) or not item_value.strip():
-                    return jsonify({'error': 'Invalid item name'}), 400
-                item['name'] = item_value.strip()
-            elif item_field == 'quantity':
-                try:
-                    qty = float(item_value)
-                    if qty <= 0:
-                        return jsonify({'error': 'Quantity must be positive'}), 400
-                    item['quantity'] = qty
-                    # Recalculate total for this item - handle None values properly
-                    price = float(item.get('price', 0)) if item.get('price') is not None else 0
-                    item['total'] = price * qty
-                except Exception:
-                    return jsonify({'error': 'Invalid quantity'}), 400
-            elif item_field == 'category':
-                if not isinstance(item_value, str) or not item_value.strip():
-                    return jsonify({'error': 'Invalid category'}), 400
-                item['category'] = item_value.strip()
+            try:
+                apply_item_edit(item, item_field, item_value)
+            except ValidationError as e:
+                return jsonify({'error': e.message}), 400
             receipt.items[item_index] = item
-            # Recalculate receipt total - handle None values properly
-            receipt.total = sum(
-                float(i.get('total', 0)) if i.get('total') is not None else 0 
-                for i in receipt.items
-            )
+            receipt.total = recalculate_total(receipt.items)
+            receipt.sync_line_items()
             db.session.commit()
-            return jsonify({'success': True, 'receipt': {
-                'id': receipt.id,
-                'store_category': receipt.store_category,
-                'store_name': receipt.store_name,
-                'date': receipt.date.strftime('%Y-%m-%d'),
-                'total': receipt.total,
-                'currency': receipt.user.currency if receipt.user and receipt.user.currency else 'USD',
-                'tax_amount': receipt.tax_amount,
-                'total_discount': receipt.total_discount,
-                'items': receipt.items,
-            }})
+            return jsonify({'success': True, 'receipt': receipt_edit_response(receipt)})
 
         return jsonify({'error': 'Invalid update request'}), 400
+
+@receipts_bp.route('/<int:receipt_id>/edits', methods=['PATCH'])
+@token_required
+def apply_receipt_edits(user_id, receipt_id):
+    """
+    Applies a list of edits in order with one load and one commit. Body:
+      {"operations": [
+        {"op": "set_field", "field": "store_name" | "date" | "store_category", "value": ...},
+        {"op": "set_item", "item_index": 0, "item_field": "name" | "quantity" | "category" | "price", "item_value": ...},
+        {"op": "add_item", "item": {"name", "quantity", "price", "category", "discount"}},
+        {"op": "remove_item", "item_index": 0}
+      ]}
+    Item indexes refer to the list as left by the preceding operations. If any operation
+    is invalid nothing is saved and the error names the failing operation.
+    """
+    data = request.get_json() or {}
+    operations = data.get('operations')
+
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'operations must be a non-empty list'}), 400
+
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
+        receipt = db.session.query(Receipt).filter_by(id=receipt_id, user_id=user_id).first()
+        if not receipt:
+            return jsonify({'error': 'Receipt not found or does not belong to user'}), 404
+
+        # Work on a detached copy so the items column is rewritten once
+        items = [dict(item) for item in receipt.items or []]
+        items_changed = False
+        date_changed = False
+        try:
+            for position, operation in enumerate(operations):
+                op = operation.get('op') if isinstance(operation, dict) else None
+                if op == 'set_field':
+                    apply_field_edit(receipt, operation.get('field'), operation.get('value'))
+                    date_changed = date_changed or operation.get('field') == 'date'
+                elif op in ('set_item', 'remove_item'):
+                    item_index = operation.get('item_index')
+                    if not isinstance(item_index, int) or not (0 <= item_index < len(items)):
+                        raise ValidationError('Invalid item index')
+                    if op == 'set_item':
+                        apply_item_edit(items[item_index], operation.get('item_field'), operation.get('item_value'))
+                    else:
+                        items.pop(item_index)
+                    items_changed = True
+                elif op == 'add_item':
+                    new_item = operation.get('item')
+                    if not isinstance(new_item, dict):
+                        raise ValidationError('Invalid item')
+                    item = {'name': None, 'quantity': 1, 'price': 0, 'category': 'Other', 'discount': None}
+                    apply_item_edit(item, 'name', new_item.get('name'))
+                    apply_item_edit(item, 'price', new_item.get('price', 0))
+                    apply_item_edit(item, 'quantity', new_item.get('quantity', 1))
+                    if new_item.get('category') is not None:
+                        apply_item_edit(item, 'category', new_item.get('category'))
+                    item['discount'] = new_item.get('discount')
+                    items.append(item)
+                    items_changed = True
+                else:
+                    raise ValidationError('Invalid update request')
+        except ValidationError as e:
+            db.session.rollback()
+            return jsonify({'error': e.message, 'operation_index': position}), 400
+
+        if items_changed:
+            receipt.items = items
+            receipt.total = recalculate_total(items)
+        if items_changed or date_changed:
+            receipt.sync_line_items()
+
+        db.session.commit()
+        return jsonify({'success': True, 'receipt': receipt_edit_response(receipt)})
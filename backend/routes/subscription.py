@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, current_app as app, request, redirect
-from utils.decorators import token_required
-from models import Receipt, User
+from utils.decorators import token_required, idempotent
+from utils.usage import get_monthly_usage, get_receipt_total
+from models import User
 from datetime import datetime, timedelta
 import stripe
 import os
@@ -30,23 +31,12 @@ def get_receipt_count(user_id):
                 app.logger.error(f"User with ID {user_id} not found in DB for receipt count.")
                 return jsonify({'message': 'User not found'}), 404
 
-            total_receipt_count = db.session.query(Receipt).filter_by(user_id=user_id).count()
+            total_receipt_count = get_receipt_total(db.session, user_id)
             
             current_month_receipt_count = None
             if user.plan == 'basic':
-                # Get the first and last day of the current month (UTC)
-                today = datetime.utcnow().date()
-                first_day = today.replace(day=1)
-                if today.month == 12:
-                    next_month = today.replace(year=today.year + 1, month=1, day=1)
-                else:
-                    next_month = today.replace(month=today.month + 1, day=1)
-                # Count receipts uploaded in the current month (use created_at)
-                current_month_receipt_count = db.session.query(Receipt).filter(
-                    Receipt.user_id == user_id,
-                    Receipt.created_at >= first_day,
-                    Receipt.created_at < next_month
-                ).count()
+                # Receipts uploaded in the current month, from the usage counter
+                current_month_receipt_count = get_monthly_usage(db.session, user_id)
             
             # Prepare subscription details
             subscription_details = {
@@ -90,6 +80,7 @@ def set_user_plan(user_id):
 
 @subscription_bp.route('/api/subscription/create-subscription-setup', methods=['POST'])
 @token_required
+@idempotent
 def create_subscription_setup(user_id):
     data = request.get_json()
     plan = data.get('plan')
@@ -211,6 +202,7 @@ def create_subscription_setup(user_id):
 
 @subscription_bp.route('/api/subscription/complete-subscription-payment', methods=['POST'])
 @token_required
+@idempotent
 def complete_subscription_payment(user_id):
     data = request.get_json()
     payment_intent_id = data.get('payment_intent_id')
@@ -296,6 +288,7 @@ def complete_subscription_payment(user_id):
 
 @subscription_bp.route('/api/subscription/complete-trial-setup', methods=['POST'])
 @token_required
+@idempotent
 def complete_trial_setup(user_id):
     data = request.get_json()
     setup_intent_id = data.get('setup_intent_id')
@@ -525,6 +518,7 @@ def stripe_webhook():
 
 @subscription_bp.route('/api/subscription/complete-custom-payment', methods=['POST'])
 @token_required
+@idempotent
 def complete_custom_payment(user_id):
     data = request.get_json()
     client_secret = data.get('client_secret')
@@ -0,0 +1,166 @@
+import importlib.util
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import jwt
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import event
+
+# application.py reads its settings from the environment when it is imported
+TEST_DIR = tempfile.mkdtemp(prefix='receipt-tests-')
+os.environ.update(
+    API_BASE_URL='http://localhost:5001',
+    JWT_SECRET='test-secret-of-at-least-32-bytes-long',
+    SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(TEST_DIR, 'app.db'),
+    ANALYTICS_CACHE_BACKEND='memory',
+    EXPORT_CACHE_DIR=os.path.join(TEST_DIR, 'exports'),
+    RATE_LIMIT_STORAGE='none',
+    PASSWORD_HASH_WORKERS='0',
+    EXPORT_RENDER_WORKERS='0',
+    PASSWORD_BCRYPT_ROUNDS='4',
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(TEST_DIR)  # logs/ and uploads/ are relative to the working directory
+
+from application import app as flask_app  # noqa: E402
+from models import db, Receipt, User  # noqa: E402
+from utils.analytics_cache import init_analytics_cache  # noqa: E402
+from utils.current_user import init_user_cache  # noqa: E402
+from utils.decorators import init_token_cache  # noqa: E402
+from utils.passwords import hash_password_now  # noqa: E402
+from utils.spend_index import init_spend_index  # noqa: E402
+
+PASSWORD = 'correct horse battery staple'
+
+# Receipt payloads shared by the test modules
+RECEIPT = {
+    'store_name': 'Corner Shop',
+    'store_category': 'Groceries',
+    'date': '2026-03-02',
+    'total': 4.5,
+    'items': [{'name': 'Milk', 'price': 1.5, 'category': 'Dairy'}, {'name': 'Bread', 'price': 3.0, 'category': 'Bakery'}],
+}
+
+TODAY = date(2026, 3, 31)
+
+# Messy items the app has stored: padded names, prices as strings, missing, null or
+# non-numeric values, missing categories and ties in every ranking
+RECEIPTS = [
+    (0, 'Corner Shop', [
+        {'name': 'Milk', 'price': 1.5, 'quantity': 2, 'total': 3.0, 'category': 'Dairy'},
+        {'name': ' Bread ', 'price': '2.50', 'category': 'Bakery'},
+        {'name': 'Milk', 'price': 1.5, 'category': 'Drinks'},
+    ]),
+    (0, 'Market', [
+        {'name': 'Cheese', 'price': 7.249, 'quantity': 1, 'total': 7.25, 'category': 'Dairy'},
+        {'name': 'Bread', 'price': ' 3 ', 'quantity': '2', 'total': 6, 'category': 'Bakery'},
+        # Ranks with Cheese once rounded, after it as Cheese was bought first
+        {'name': 'Wine', 'price': 7.254, 'category': 'Drinks'},
+        {'name': 'Apples', 'price': 'abc', 'category': 'Fruit'},
+    ]),
+    (2, 'Corner Shop', [
+        {'name': 'Milk', 'price': 1.75, 'quantity': None, 'total': 1.75, 'category': 'Dairy'},
+        {'name': 'Yoghurt', 'price': None, 'category': 'Dairy'},
+        {'name': '', 'price': 4.0, 'category': 'Dairy'},
+        {'name': 'Soap', 'price': 2.0},
+    ]),
+    (9, 'Market', [
+        {'name': 'Cheese', 'price': 7.25, 'quantity': 2, 'total': 14.5, 'category': 'Dairy'},
+        {'name': 'Apples', 'price': 0.5, 'quantity': 6, 'total': 3.0, 'category': 'Fruit'},
+        {'name': 'Butter', 'price': True, 'category': 'Dairy'},
+        {'price': 9.0, 'category': 'Dairy'},
+    ]),
+    (40, 'Corner Shop', [
+        {'name': 'Milk', 'price': 1.5, 'quantity': 1, 'total': 1.5, 'category': 'Dairy'},
+        {'name': 'Bread', 'price': 2.5, 'category': None},
+        # The last mention on a product's first receipt gives its category
+        {'name': 'Milk ', 'price': 1.5, 'category': 'Drinks'},
+    ]),
+    (45, 'Market', []),
+]
+
+
+@pytest.fixture
+def app():
+    flask_app.config.update(TESTING=True)
+    # Every test starts with empty per-worker caches, as user ids repeat between tests
+    for init in (init_token_cache, init_user_cache, init_analytics_cache, init_spend_index):
+        init(flask_app)
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user(app):
+    user = User(
+        email='user@example.com',
+        password_hash=hash_password_now(PASSWORD, 'bcrypt', 4),
+        email_verified=True,
+        currency='EUR',
+        plan='pro',
+    )
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def connection(app, user):
+    db.session.add_all(
+        Receipt(
+            user_id=user.id, store_name=store, store_category='Groceries', date=TODAY - timedelta(days=days),
+            total=0, items=items, fingerprint=f'receipt-{index}'
+        )
+        for index, (days, store, items) in enumerate(RECEIPTS)
+    )
+    db.session.commit()
+    return db.session.connection()
+
+
+def auth_headers(user_id):
+    token = jwt.encode(
+        {'user_id': user_id, 'exp': int((datetime.utcnow() + timedelta(hours=1)).timestamp())},
+        os.environ['JWT_SECRET'],
+        algorithm='HS256',
+    )
+    return {'Authorization': f'Bearer {token}'}
+
+
+@contextmanager
+def count_statements():
+    """Collects the SQL statements sent while the block runs."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def run_migration(filename):
+    """Runs one migration's upgrade() (migrations/versions/<filename>) on the test database."""
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations', 'versions', filename)
+    spec = importlib.util.spec_from_file_location(filename[:-3], path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    with db.engine.begin() as connection:
+        with Operations.context(MigrationContext.configure(connection)):
+            migration.upgrade()
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from tests.conftest import auth_headers, count_statements
+
+# Statements per analytics request with the result cache off. The context (currency,
+# has_data, data_version) shares a statement with the view's aggregate; the item
+# widgets also run the item aggregation of utils/item_queries.py, bill-stats loads the
+# spend index when the worker has none for the user's data_version, and the dashboard
+# reads the saved widget order when ?widgets is not given.
+STATEMENTS = [
+    ('/api/analytics/spend?interval=daily', 1),
+    ('/api/analytics/expenses-by-category?period=month', 1),
+    ('/api/analytics/receipts-by-date?date=2026-03&interval=monthly', 1),
+    ('/api/analytics/shopping-days', 1),
+    ('/api/analytics/diet-composition?interval=month', 1),
+    ('/api/analytics/dashboard?widgets=total_spent,top_products,bill_stats', 1),
+    ('/api/analytics/dashboard', 2),
+    ('/api/analytics/top-products?period=month', 2),
+    ('/api/analytics/most-expensive-products?period=month', 2),
+    ('/api/analytics/products-by-category?category=Dairy&period=month', 2),
+    ('/api/analytics/bill-stats?interval=M', 2),
+]
+
+
+@pytest.fixture
+def receipts(client, user):
+    today = datetime.utcnow().date()
+    payloads = [
+        {
+            'store_name': store,
+            'store_category': 'Groceries',
+            'date': (today - timedelta(days=days)).isoformat(),
+            'total': 6.5 + days,
+            'items': [
+                {'name': 'Milk', 'price': 1.5, 'quantity': 2, 'total': 3.0, 'category': 'Dairy'},
+                {'name': 'Bread', 'price': 3.5 + days, 'category': 'Bakery'},
+            ],
+        }
+        for days, store in [(1, 'Corner Shop'), (3, 'Market'), (12, 'Corner Shop'), (40, 'Market')]
+    ]
+    response = client.post('/api/receipts/batch', json={'receipts': payloads}, headers=auth_headers(user.id))
+    assert response.get_json()['summary'] == {'created': len(payloads)}
+
+
+@pytest.mark.parametrize('path, expected', STATEMENTS)
+def test_statements_per_request(app, client, user, receipts, monkeypatch, path, expected):
+    monkeypatch.setitem(app.extensions, 'analytics_cache', None)
+    with count_statements() as statements:
+        response = client.get(path, headers=auth_headers(user.id))
+    assert response.status_code == 200, response.get_json()
+    assert len(statements) == expected, statements
+
+
+def test_bill_stats_reuses_the_spend_index(app, client, user, receipts, monkeypatch):
+    monkeypatch.setitem(app.extensions, 'analytics_cache', None)
+    client.get('/api/analytics/bill-stats?interval=M', headers=auth_headers(user.id))
+    with count_statements() as statements:
+        client.get('/api/analytics/bill-stats?interval=M', headers=auth_headers(user.id))
+    assert len(statements) == 1, statements
+
+
+@pytest.mark.parametrize('path, expected', STATEMENTS)
+def test_cached_views_add_the_data_version_lookup(client, user, receipts, path, expected):
+    with count_statements() as statements:
+        miss = client.get(path, headers=auth_headers(user.id))
+    assert miss.headers['X-Cache'] == 'MISS'
+    assert len(statements) == expected + 1, statements
+
+    with count_statements() as statements:
+        hit = client.get(path, headers=auth_headers(user.id))
+    assert hit.headers['X-Cache'] == 'HIT'
+    assert hit.get_data() == miss.get_data()
+    assert len(statements) == 1, statements
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from tests.conftest import auth_headers
+
+
+def add_receipts(client, user, receipts):
+    payloads = [
+        {
+            'store_name': store,
+            'store_category': 'Groceries',
+            'date': str(day),
+            'total': total,
+            'items': items,
+        }
+        for day, store, total, items in receipts
+    ]
+    response = client.post('/api/receipts/batch', json={'receipts': payloads}, headers=auth_headers(user.id))
+    assert response.get_json()['summary'] == {'created': len(payloads)}
+
+
+def get(client, user, path):
+    response = client.get(path, headers=auth_headers(user.id))
+    return response.status_code, response.get_json()
+
+
+@pytest.fixture
+def january(client, user):
+    add_receipts(client, user, [
+        ('2026-01-05', 'Corner Shop', 10.0, []),
+        ('2026-01-10', 'Market', 20.0, [
+            {'name': 'Apples', 'price': 3.0, 'total': 3.0, 'category': 'Fruits'},
+            {'name': 'Chicken', 'price': 9.0, 'total': 9.0, 'category': 'Meat & poultry'},
+            {'name': 'Soap', 'price': 8.0, 'total': 8.0, 'category': 'Household'},
+        ]),
+        ('2026-01-20', 'Corner Shop', 30.0, []),
+        ('2026-02-05', 'Market', 40.0, []),
+    ])
+
+
+@pytest.mark.parametrize('query, expected', [
+    # The window of the same length before a start is the previous period
+    ('start=2026-01-10&end=2026-01-20', {'total_receipts': 2, 'average_bill': 25.0, 'average_bill_delta': 15.0,
+                                         'start': '2026-01-10', 'end': '2026-01-20'}),
+    ('start=2026-01-10&end=2026-01-20&store_name=Corner Shop',
+     {'total_receipts': 1, 'average_bill': 30.0, 'average_bill_delta': 20.0, 'start': '2026-01-10', 'end': '2026-01-20'}),
+    # Without a start there is no previous period
+    ('end=2026-01-10', {'total_receipts': 2, 'average_bill': 15.0, 'average_bill_delta': None,
+                        'start': None, 'end': '2026-01-10'}),
+    ('start=2026-01-20', {'total_receipts': 2, 'average_bill': 35.0, 'average_bill_delta': 20.0,
+                          'start': '2026-01-20', 'end': datetime.utcnow().date().isoformat()}),
+    ('start=2026-01-06&end=2026-01-09', {'total_receipts': 0, 'average_bill': 0, 'average_bill_delta': None,
+                                         'start': '2026-01-06', 'end': '2026-01-09'}),
+])
+def test_bill_stats_custom_window(client, user, january, query, expected):
+    status, body = get(client, user, f'/api/analytics/bill-stats?{query}')
+
+    assert status == 200, body
+    assert {key: body[key] for key in expected} == expected
+
+
+@pytest.mark.parametrize('query', ['start=2026-01-20&end=2026-01-10', 'start=20-01-2026'])
+def test_bill_stats_rejects_bad_windows(client, user, query):
+    status, body = get(client, user, f'/api/analytics/bill-stats?{query}')
+    assert status == 400, body
+
+
+def test_bill_stats_compares_the_month_with_the_one_before(client, user):
+    today = datetime.utcnow().date()
+    add_receipts(client, user, [
+        (today - timedelta(days=5), 'Corner Shop', 26.0, []),
+        (today - timedelta(days=10), 'Market', 30.0, []),
+        (today - timedelta(days=40), 'Corner Shop', 10.0, []),
+        (today - timedelta(days=45), 'Market', 30.0, []),
+        (today - timedelta(days=70), 'Market', 500.0, []),  # before both periods
+    ])
+
+    status, body = get(client, user, '/api/analytics/bill-stats?interval=M')
+    assert status == 200, body
+    assert (body['total_receipts'], body['average_bill'], body['average_bill_delta']) == (2, 28.0, 8.0)
+
+    # A store filter applies to this month only; the previous one is over every store
+    status, body = get(client, user, '/api/analytics/bill-stats?interval=M&store_name=Corner Shop')
+    assert status == 200, body
+    assert (body['total_receipts'], body['average_bill'], body['average_bill_delta']) == (1, 26.0, 6.0)
+
+    status, body = get(client, user, '/api/analytics/bill-stats?interval=All')
+    assert (body['total_receipts'], body['average_bill_delta']) == (5, None)
+
+
+def test_diet_composition_custom_window(client, user, january):
+    status, body = get(client, user, '/api/analytics/diet-composition?start=2026-01-09&end=2026-01-11')
+
+    assert status == 200, body
+    assert body['interval'] == 'custom'
+    assert [point['period'] for point in body['data']] == ['2026-01-09', '2026-01-10', '2026-01-11']
+    empty, day, _ = body['data']
+    assert (empty['total_spent'], empty['fruits_percent']) == (0.0, 0.0)
+    assert (day['total_spent'], day['sum_fruits'], day['sum_meat']) == (20.0, 3.0, 9.0)
+    assert (day['fruits_percent'], day['meat_percent']) == (15.0, 45.0)
+
+
+def test_diet_composition_window_defaults(client, user, january):
+    status, body = get(client, user, '/api/analytics/diet-composition?end=2026-01-10')
+    assert status == 200, body
+    periods = [point['period'] for point in body['data']]
+    assert (len(periods), periods[0], periods[-1]) == (30, '2025-12-12', '2026-01-10')
+    assert body['data'][-1]['sum_meat'] == 9.0
+
+    status, body = get(client, user, '/api/analytics/diet-composition?start=2026-01-10&end=2026-01-10&store_name=Corner Shop')
+    assert status == 200, body
+    assert body['data'] == [{**body['data'][0], 'total_spent': 0.0}]
+
+
+@pytest.mark.parametrize('query', ['start=2025-01-01&end=2026-01-10', 'start=2026-01-11&end=2026-01-10', 'end=2026/01/10'])
+def test_diet_composition_rejects_bad_windows(client, user, query):
+    status, body = get(client, user, f'/api/analytics/diet-composition?{query}')
+    assert status == 400, body
@@ -0,0 +1,15 @@
+from tests.conftest import auth_headers
+
+
+def test_cache_stats_hidden_by_default(client, user):
+    assert client.get('/api/analytics/cache-stats', headers=auth_headers(user.id)).status_code == 404
+
+
+def test_cache_stats_when_enabled(app, client, user, monkeypatch):
+    monkeypatch.setitem(app.config, 'ANALYTICS_CACHE_STATS_ENABLED', True)
+    client.get('/api/analytics/shopping-days', headers=auth_headers(user.id))
+
+    response = client.get('/api/analytics/cache-stats', headers=auth_headers(user.id))
+
+    assert response.status_code == 200
+    assert response.get_json()['misses'] == 1
@@ -0,0 +1,53 @@
+from collections import namedtuple
+from datetime import timedelta
+
+import pytest
+
+from tests.conftest import RECEIPTS, TODAY, auth_headers
+from utils import columnar, item_queries, widgets
+
+pytestmark = pytest.mark.skipif(not columnar.available(), reason='NumPy is not installed')
+
+DashboardRow = namedtuple('DashboardRow', 'date total store_name store_category items')
+
+
+@pytest.fixture
+def rows(connection, user):
+    return item_queries.receipt_rows(connection, user.id)
+
+
+@pytest.mark.parametrize('name, args', [
+    ('top_products', (10,)),
+    ('top_products', (2,)),
+    ('most_expensive_products', (8,)),
+    ('category_totals', ()),
+    ('products_by_category', ('Dairy',)),
+    ('products_by_category', ('Bakery',)),
+])
+def test_engines_agree(rows, name, args):
+    assert getattr(columnar, name)(rows, *args) == getattr(widgets, name)(rows, *args)
+
+
+def test_dashboard_engines_agree():
+    rows = [
+        DashboardRow(TODAY - timedelta(days=days), 10.0, store, 'Groceries', items)
+        for days, store, items in sorted(RECEIPTS, key=lambda receipt: -receipt[0])
+    ]
+    params = {widget: dict(options) for widget, options in widgets.WIDGET_PARAMS.items()}
+    for widget in ('expenses_by_category', 'top_products', 'most_expensive', 'diet_composition'):
+        params[widget]['period'] = 'year'
+    args = (list(widgets.WIDGET_PARAMS), params, rows, None, None, 'USD', True, TODAY)
+    assert widgets.build_dashboard(*args, item_columns=columnar.ItemColumns) == widgets.build_dashboard(*args)
+
+
+def test_dashboard_without_numpy(app, client, user, connection, monkeypatch):
+    path = '/api/analytics/dashboard?widgets=top_products,most_expensive&top_products.period=all&most_expensive.period=all'
+    expected = client.get(path, headers=auth_headers(user.id)).get_json()
+    monkeypatch.setitem(app.extensions, 'analytics_cache', None)
+
+    monkeypatch.setattr(columnar, 'np', None)
+    response = client.get(path, headers=auth_headers(user.id))
+
+    assert response.status_code == 200
+    assert response.get_json() == expected
+    assert response.get_json()['widgets']['top_products']['products']
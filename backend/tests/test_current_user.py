@@ -0,0 +1,30 @@
+from tests.conftest import RECEIPT, auth_headers
+
+
+def test_add_receipt_uses_loaded_user(client, user):
+    response = client.post('/api/receipts', json=RECEIPT, headers=auth_headers(user.id))
+    assert response.status_code == 201, response.get_json()
+
+
+def test_add_receipts_batch_uses_loaded_user(client, user):
+    response = client.post('/api/receipts/batch', json={'receipts': [RECEIPT]}, headers=auth_headers(user.id))
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['summary'] == {'created': 1}
+
+
+def test_search_uses_loaded_user(client, user):
+    response = client.get('/api/receipts/search?q=milk', headers=auth_headers(user.id))
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['receipts'] == []
+
+
+def test_analytics_export_uses_loaded_user(app, client, user, monkeypatch):
+    from utils import exports
+    monkeypatch.setattr(exports, 'start_job', lambda *args: None)
+    response = client.post('/api/analytics/exports', headers=auth_headers(user.id))
+    assert response.status_code == 202, response.get_json()
+
+
+def test_unknown_user_is_not_found(client, user):
+    response = client.post('/api/receipts', json=RECEIPT, headers=auth_headers(user.id + 1))
+    assert response.status_code == 404
@@ -0,0 +1,156 @@
+import os
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, AnalyticsExport
+from tests.conftest import auth_headers
+from utils import exports, pdf_export
+
+RECEIPT = {
+    'store_name': 'Corner Shop',
+    'store_category': 'Groceries',
+    'date': datetime.utcnow().date().isoformat(),
+    'total': 4.5,
+    'items': [{'name': 'Milk', 'price': 1.5, 'category': 'Dairy'}, {'name': 'Bread', 'price': 3.0, 'category': 'Bakery'}],
+}
+
+
+class StalledPool:
+    """A render pool whose renders never finish."""
+
+    def submit(self, fn, *args):
+        return Future()
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(app, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, 'EXPORT_CACHE_DIR', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def started(monkeypatch):
+    """Job ids the export endpoint started; the tests run them with exports.run_job."""
+    job_ids = []
+    monkeypatch.setattr(exports, 'start_job', lambda app, job_id, item_columns=None: job_ids.append(job_id))
+    return job_ids
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """The job status seen by each PDF render."""
+    statuses = []
+    build_pdf = pdf_export.build_pdf
+
+    def counting_build_pdf(output, *args):
+        job_id = output.rsplit('.', 2)[1]  # <digest>.pdf.<job id>.tmp
+        statuses.append(db.session.get(AnalyticsExport, job_id).status)
+        return build_pdf(output, *args)
+
+    monkeypatch.setattr(pdf_export, 'build_pdf', counting_build_pdf)
+    return statuses
+
+
+def export(client, user):
+    response = client.post('/api/analytics/exports', headers=auth_headers(user.id))
+    assert response.status_code == 202, response.get_json()
+    return response.get_json()
+
+
+def status(client, user, job_id):
+    return client.get(f'/api/analytics/exports/{job_id}', headers=auth_headers(user.id)).get_json()
+
+
+def download(client, user, job_id):
+    return client.get(f'/api/analytics/exports/{job_id}/download', headers=auth_headers(user.id))
+
+
+def test_export_is_queued_rendered_and_downloaded(app, client, user, started, renders):
+    client.post('/api/receipts', json=RECEIPT, headers=auth_headers(user.id))
+
+    job = export(client, user)
+    assert job['status'] == 'queued'
+    assert started == [job['id']]
+    assert status(client, user, job['id'])['status'] == 'queued'
+    assert download(client, user, job['id']).status_code == 409
+
+    exports.run_job(app, job['id'])
+
+    assert renders == ['running']
+    assert status(client, user, job['id'])['status'] == 'completed'
+    response = download(client, user, job['id'])
+    assert response.status_code == 200
+    assert response.mimetype == 'application/pdf'
+    assert response.data.startswith(b'%PDF')
+    assert [name.endswith('.pdf') for name in os.listdir(app.config['EXPORT_CACHE_DIR'])] == [True]
+
+
+def test_job_in_progress_is_reused(app, client, user, started):
+    first = export(client, user)
+    second = export(client, user)
+
+    assert second['id'] == first['id']
+    assert started == [first['id']]
+
+
+def test_export_of_unchanged_data_reuses_the_pdf(app, client, user, started, renders):
+    client.post('/api/receipts', json=RECEIPT, headers=auth_headers(user.id))
+    first = export(client, user)
+    exports.run_job(app, first['id'])
+    second = export(client, user)
+    exports.run_job(app, second['id'])
+
+    assert second['id'] != first['id']
+    assert status(client, user, second['id'])['status'] == 'completed'
+    assert len(renders) == 1
+    db.session.expire_all()
+    assert db.session.get(AnalyticsExport, first['id']).content_hash == \
+        db.session.get(AnalyticsExport, second['id']).content_hash
+
+    client.post('/api/receipts', json={**RECEIPT, 'store_name': 'Market'}, headers=auth_headers(user.id))
+    third = export(client, user)
+    exports.run_job(app, third['id'])
+    assert len(renders) == 2
+
+
+def test_render_timeout_fails_the_job(app, client, user, started, monkeypatch):
+    monkeypatch.setitem(app.extensions, 'analytics_exports', StalledPool())
+    job = export(client, user)
+    db.session.query(AnalyticsExport).filter_by(id=job['id']).update(
+        {'created_at': datetime.utcnow() - timedelta(seconds=app.config['EXPORT_JOB_TIMEOUT_SECONDS'])}
+    )
+    db.session.commit()
+
+    exports.run_job(app, job['id'])  # waits the minimum second for the render
+
+    result = status(client, user, job['id'])
+    assert result['status'] == 'failed'
+    assert result['error'] == 'Failed to generate PDF'
+    response = download(client, user, job['id'])
+    assert response.status_code == 409
+    assert response.get_json()['status'] == 'failed'
+
+
+def test_evicted_pdf_is_gone(app, client, user, started):
+    job = export(client, user)
+    exports.run_job(app, job['id'])
+    db.session.expire_all()
+    os.remove(exports.pdf_path(app, db.session.get(AnalyticsExport, job['id']).content_hash))
+
+    assert download(client, user, job['id']).status_code == 410
+
+
+def test_eviction_removes_abandoned_partial_renders(app, cache_dir, monkeypatch):
+    monkeypatch.setitem(app.config, 'EXPORT_CACHE_MAX_FILES', 1)
+    abandoned = time.time() - app.config['EXPORT_JOB_TIMEOUT_SECONDS'] - 1
+    for name in ('a.pdf.job1.tmp', 'b.pdf.job2.tmp', 'c.pdf', 'd.pdf'):
+        (cache_dir / name).touch()
+    for name in ('a.pdf.job1.tmp', 'c.pdf'):
+        os.utime(cache_dir / name, (abandoned, abandoned))
+
+    exports.evict_cached_pdfs(app)
+
+    assert sorted(os.listdir(cache_dir)) == ['b.pdf.job2.tmp', 'd.pdf']
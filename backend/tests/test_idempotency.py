@@ -0,0 +1,57 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from models import db, IdempotencyRecord, Receipt
+from tests.conftest import RECEIPT, auth_headers
+
+KEY = 'retry-after-crash'
+
+
+def claim(user_id, age):
+    """An in_progress record as left by a worker that claimed the key `age` ago."""
+    body = json.dumps(RECEIPT).encode('utf-8')
+    now = datetime.utcnow()
+    db.session.add(IdempotencyRecord(
+        user_id=user_id,
+        key=KEY,
+        request_hash=hashlib.sha256(b'POST /api/receipts\n' + body).hexdigest(),
+        status='in_progress',
+        created_at=now - age,
+        expires_at=now + timedelta(hours=24),
+    ))
+    db.session.commit()
+    return body
+
+
+def post(client, user, body):
+    headers = {**auth_headers(user.id), 'Idempotency-Key': KEY, 'Content-Type': 'application/json'}
+    return client.post('/api/receipts', data=body, headers=headers)
+
+
+def test_abandoned_claim_is_taken_over(app, client, user):
+    body = claim(user.id, timedelta(seconds=app.config['IDEMPOTENCY_LEASE_SECONDS'] + 1))
+
+    response = post(client, user, body)
+    assert response.status_code == 201, response.get_json()
+    assert db.session.query(Receipt).filter_by(user_id=user.id).count() == 1
+
+    db.session.expire_all()
+    record = db.session.query(IdempotencyRecord).filter_by(user_id=user.id, key=KEY).one()
+    assert record.status == 'completed'
+    assert record.response_status == 201
+
+    replay = post(client, user, body)
+    assert replay.status_code == 201
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert db.session.query(Receipt).filter_by(user_id=user.id).count() == 1
+
+
+def test_claim_within_its_lease_is_still_in_progress(app, client, user, monkeypatch):
+    monkeypatch.setitem(app.config, 'IDEMPOTENCY_WAIT_SECONDS', 0)
+    body = claim(user.id, timedelta(seconds=1))
+
+    response = post(client, user, body)
+    assert response.status_code == 409
+    assert 'still in progress' in response.get_json()['error']
+    assert db.session.query(Receipt).filter_by(user_id=user.id).count() == 0
@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+import pytest
+
+from tests.conftest import TODAY
+from utils import item_queries
+
+FILTERS = [
+    {},
+    {'start_date': TODAY - timedelta(days=30)},
+    {'store_name': 'Corner Shop'},
+    {'store_category': 'Groceries', 'start_date': TODAY - timedelta(days=5)},
+]
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+@pytest.mark.parametrize('limit', [2, 10])
+def test_top_products_sql_matches_python(connection, user, filters, limit):
+    # The endpoint passes the number of receipts matching the filters
+    total_receipts = len(item_queries.receipt_rows(connection, user.id, **filters))
+    sql = item_queries.top_products(connection, user.id, limit, total_receipts, sql=True, **filters)
+    python = item_queries.top_products(connection, user.id, limit, total_receipts, sql=False, **filters)
+    assert sql == python
+    assert sql
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+@pytest.mark.parametrize('limit', [2, 8])
+def test_most_expensive_products_sql_matches_python(connection, user, filters, limit):
+    sql = item_queries.most_expensive_products(connection, user.id, limit, sql=True, **filters)
+    python = item_queries.most_expensive_products(connection, user.id, limit, sql=False, **filters)
+    assert sql == python
+    assert sql
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+@pytest.mark.parametrize('category, limit', [('Dairy', None), ('Dairy', 2), ('Bakery', None), ('Fruit', None)])
+def test_products_by_category_sql_matches_python(connection, user, filters, category, limit):
+    sql = item_queries.products_by_category(connection, user.id, category, limit, sql=True, **filters)
+    python = item_queries.products_by_category(connection, user.id, category, limit, sql=False, **filters)
+    assert sql == python
+
+
+def test_sqlite_pushes_down(connection):
+    assert item_queries.pushdown(connection)
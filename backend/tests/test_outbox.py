@@ -0,0 +1,181 @@
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+from aiosmtpd.controller import Controller
+from flask_mail import Mail
+from sqlalchemy import update
+
+from models import db, EmailOutbox
+from utils import outbox
+from utils.outbox import send_due_emails
+
+REFUSED = 'refused@example.com'
+DISCONNECT = 'disconnect@example.com'
+
+
+class Handler:
+    """Accepts every email except those to REFUSED; closes the connection on DISCONNECT."""
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address == REFUSED:
+            return '550 No such user'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        if DISCONNECT in envelope.rcpt_tos:
+            return '421 Closing connection'
+        self.messages.append((envelope.rcpt_tos, envelope.content))
+        return '250 Message accepted'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def use_mail_server(app, monkeypatch, port):
+    mail = Mail().init_mail({'MAIL_SERVER': '127.0.0.1', 'MAIL_PORT': port, 'MAIL_DEFAULT_SENDER': 'noreply@example.com'})
+    monkeypatch.setitem(app.extensions, 'mail', mail)
+
+
+@pytest.fixture
+def smtp(app, monkeypatch):
+    handler = Handler()
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    use_mail_server(app, monkeypatch, controller.port)
+    yield handler
+    controller.stop()
+
+
+def queue(*recipients, **fields):
+    rows = [EmailOutbox(recipients=[recipient], subject='Hello', body=f'To {recipient}', **fields) for recipient in recipients]
+    db.session.add_all(rows)
+    db.session.commit()
+    return [row.id for row in rows]
+
+
+def outbox_row(row_id):
+    db.session.expire_all()
+    return db.session.get(EmailOutbox, row_id)
+
+
+def test_sent_emails_are_marked_sent(app, smtp):
+    ids = queue('a@example.com', 'b@example.com')
+
+    assert send_due_emails(app) == (2, 0)
+
+    assert sorted(rcpt_tos for rcpt_tos, _ in smtp.messages) == [['a@example.com'], ['b@example.com']]
+    for row_id in ids:
+        row = outbox_row(row_id)
+        assert (row.status, row.attempts) == ('sent', 1)
+        assert row.sent_at is not None
+    assert send_due_emails(app) == (0, 0)
+    assert len(smtp.messages) == 2
+
+
+def test_refused_recipient_is_retried_with_backoff(app, smtp):
+    refused, accepted = queue(REFUSED, 'a@example.com')
+    before = datetime.utcnow()
+
+    assert send_due_emails(app) == (1, 1)
+
+    row = outbox_row(refused)
+    assert (row.status, row.attempts) == ('pending', 1)
+    assert 'No such user' in row.last_error
+    base = app.config['OUTBOX_RETRY_BASE_SECONDS']
+    assert before + timedelta(seconds=base) <= row.next_attempt_at <= datetime.utcnow() + timedelta(seconds=base)
+    assert outbox_row(accepted).status == 'sent'
+
+    # Not due yet
+    assert send_due_emails(app) == (0, 0)
+
+    # The delay doubles with every failed attempt
+    row.next_attempt_at = datetime.utcnow()
+    db.session.commit()
+    before = datetime.utcnow()
+    assert send_due_emails(app) == (0, 1)
+    row = outbox_row(refused)
+    assert row.attempts == 2
+    assert row.next_attempt_at >= before + timedelta(seconds=2 * base)
+
+
+def test_disconnect_defers_the_rest_of_the_batch(app, smtp):
+    ids = queue(DISCONNECT, 'a@example.com', 'b@example.com')
+
+    assert send_due_emails(app) == (0, 3)
+
+    assert smtp.messages == []
+    for row_id in ids:
+        row = outbox_row(row_id)
+        assert (row.status, row.attempts) == ('pending', 1)
+        assert row.next_attempt_at > datetime.utcnow()
+
+
+def test_unreachable_server_defers_the_batch(app, monkeypatch):
+    use_mail_server(app, monkeypatch, free_port())
+    (row_id,) = queue('a@example.com')
+
+    assert send_due_emails(app) == (0, 1)
+
+    row = outbox_row(row_id)
+    assert (row.status, row.attempts) == ('pending', 1)
+
+
+def test_email_is_failed_after_max_attempts(app, smtp):
+    max_attempts = app.config['OUTBOX_MAX_ATTEMPTS']
+    (row_id,) = queue(REFUSED, attempts=max_attempts - 1)
+
+    assert send_due_emails(app) == (0, 1)
+
+    row = outbox_row(row_id)
+    assert (row.status, row.attempts) == ('failed', max_attempts)
+    row.next_attempt_at = datetime.utcnow() - timedelta(days=1)
+    db.session.commit()
+    assert send_due_emails(app) == (0, 0)
+
+
+def test_claimed_emails_are_not_sent_twice(app, smtp):
+    claimed, free = queue('claimed@example.com', 'free@example.com')
+    # Another worker is sending the first email
+    row = outbox_row(claimed)
+    row.status = 'sending'
+    row.next_attempt_at = datetime.utcnow() + timedelta(seconds=app.config['OUTBOX_CLAIM_SECONDS'])
+    db.session.commit()
+
+    assert send_due_emails(app) == (1, 0)
+
+    assert [rcpt_tos for rcpt_tos, _ in smtp.messages] == [['free@example.com']]
+    assert outbox_row(claimed).status == 'sending'
+
+
+def test_expired_claim_is_sent_again(app, smtp):
+    (row_id,) = queue('a@example.com', status='sending', next_attempt_at=datetime.utcnow() - timedelta(seconds=1))
+
+    assert send_due_emails(app) == (1, 0)
+
+    assert outbox_row(row_id).status == 'sent'
+
+
+def test_claim_conditional_on_the_due_time_read(app, smtp, monkeypatch):
+    (row_id,) = queue('a@example.com')
+
+    def claimed_by_another_worker(table):
+        # Another worker claims the row between this worker's read and its update
+        with db.engine.begin() as connection:
+            connection.execute(update(EmailOutbox).values(
+                status='sending', next_attempt_at=datetime.utcnow() + timedelta(minutes=5)
+            ))
+        return update(table)
+
+    monkeypatch.setattr(outbox, 'update', claimed_by_another_worker)
+
+    assert send_due_emails(app) == (0, 0)
+
+    assert smtp.messages == []
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from models import db, User
+from tests.conftest import PASSWORD
+from utils.passwords import HashPool, hash_password_now
+
+
+def login(client, password=PASSWORD):
+    return client.post('/api/auth/login', json={'email': 'user@example.com', 'password': password})
+
+
+def stored_hash(user_id):
+    db.session.expire_all()
+    return db.session.get(User, user_id).password_hash
+
+
+@pytest.fixture
+def pool(app, monkeypatch):
+    pool = HashPool(workers=1, max_pending=1, timeout=10)
+    monkeypatch.setitem(app.extensions, 'password_pool', pool)
+    yield pool
+    pool.reset()
+
+
+def test_pbkdf2_hash_upgraded_to_bcrypt_on_login(app, client, user):
+    user.password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256')
+    db.session.commit()
+
+    assert login(client).status_code == 200
+
+    upgraded = stored_hash(user.id)
+    assert upgraded.startswith(f"$2b${app.config['PASSWORD_BCRYPT_ROUNDS']:02d}$")
+    assert login(client).status_code == 200
+    assert stored_hash(user.id) == upgraded
+
+
+def test_bcrypt_hash_with_other_rounds_rehashed_on_login(app, client, user):
+    user.password_hash = hash_password_now(PASSWORD, 'bcrypt', app.config['PASSWORD_BCRYPT_ROUNDS'] + 1)
+    db.session.commit()
+
+    assert login(client).status_code == 200
+
+    assert stored_hash(user.id).startswith(f"$2b${app.config['PASSWORD_BCRYPT_ROUNDS']:02d}$")
+
+
+def test_wrong_password_keeps_the_old_hash(client, user):
+    user.password_hash = old = generate_password_hash(PASSWORD, method='pbkdf2:sha256')
+    db.session.commit()
+
+    assert login(client, 'wrong password').status_code == 401
+
+    assert stored_hash(user.id) == old
+
+
+def test_login_verifies_in_the_pool(client, user, pool):
+    assert login(client).status_code == 200
+    assert login(client, 'wrong password').status_code == 401
+
+
+def test_saturated_pool_fails_fast_with_503(client, user, pool):
+    # Takes the pool's only slot for a while
+    busy = threading.Thread(target=pool.run, args=(time.sleep, 3))
+    busy.start()
+    try:
+        deadline = time.monotonic() + 5
+        while pool._slots._value and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        start = time.monotonic()
+        response = login(client)
+        elapsed = time.monotonic() - start
+
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert elapsed < 0.5
+    finally:
+        busy.join()
+    assert login(client).status_code == 200
@@ -0,0 +1,117 @@
+import pytest
+from flask import Flask, Blueprint
+
+from errors import register_error_handlers
+from tests.conftest import auth_headers
+from utils.decorators import init_token_cache
+from utils.rate_limit import init_rate_limiter
+
+WINDOW = 60
+START = 1_000 * WINDOW  # a window boundary
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_app(rules, trusted_proxies=0):
+    app = Flask(__name__)
+    app.config.update(
+        JWT_SECRET='test-secret-of-at-least-32-bytes-long',
+        RATE_LIMIT_STORAGE='memory',
+        RATE_LIMITS=rules,
+        RATE_LIMIT_TRUSTED_PROXIES=trusted_proxies,
+    )
+    register_error_handlers(app)
+    init_token_cache(app)
+    init_rate_limiter(app)
+    blueprint = Blueprint('auth', __name__, url_prefix='/auth')
+    blueprint.add_url_rule('/login', 'login', lambda: 'ok', methods=['POST'])
+    blueprint.add_url_rule('/other', 'other', lambda: 'ok', methods=['POST'])
+    app.register_blueprint(blueprint)
+    app.add_url_rule('/health', 'health', lambda: 'ok')
+    return app
+
+
+@pytest.fixture
+def clock():
+    return FakeClock(START + 10)
+
+
+def limited_app(clock, rules, trusted_proxies=0):
+    app = make_app(rules, trusted_proxies)
+    app.extensions['rate_limiter'].clock = clock
+    return app.test_client()
+
+
+def statuses(client, path, count, **kwargs):
+    return [client.post(path, **kwargs).status_code for _ in range(count)]
+
+
+def test_over_limit_gets_429_with_retry_after(clock):
+    client = limited_app(clock, {'auth': [(2, WINDOW, 'ip')]})
+
+    assert statuses(client, '/auth/login', 2) == [200, 200]
+    response = client.post('/auth/login')
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == str(WINDOW - 10)
+    assert response.get_json()['message'] == 'Too many requests, please slow down'
+
+
+def test_previous_window_is_weighted_by_its_overlap(clock):
+    client = limited_app(clock, {'auth': [(2, WINDOW, 'ip')]})
+    assert statuses(client, '/auth/login', 3) == [200, 200, 429]
+
+    # Half of the previous window's 3 hits still count: 1.5 + 1 > 2
+    clock.now = START + WINDOW + WINDOW // 2
+    assert statuses(client, '/auth/login', 1) == [429]
+    # A sixth of the previous window's hit counts: 1/6 + 1, then 1/6 + 2 > 2
+    clock.now = START + 2 * WINDOW + 50
+    assert statuses(client, '/auth/login', 2) == [200, 429]
+    # The counts are gone two windows later
+    clock.now = START + 4 * WINDOW
+    assert statuses(client, '/auth/login', 2) == [200, 200]
+
+
+def test_endpoint_rules_replace_blueprint_rules(clock):
+    client = limited_app(clock, {'auth.login': [(1, WINDOW, 'ip')], 'auth': [(3, WINDOW, 'ip')]})
+
+    assert statuses(client, '/auth/login', 2) == [200, 429]
+    # Login hits do not count against the blueprint's limit
+    assert statuses(client, '/auth/other', 4) == [200, 200, 200, 429]
+    assert statuses(client, '/auth/login', 1) == [429]
+
+
+def test_routes_without_rules_are_not_limited(clock):
+    client = limited_app(clock, {'auth': [(1, WINDOW, 'ip')]})
+    assert [client.get('/health').status_code for _ in range(3)] == [200, 200, 200]
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies(clock):
+    client = limited_app(clock, {'auth': [(1, WINDOW, 'ip')]})
+
+    assert statuses(client, '/auth/login', 1, headers={'X-Forwarded-For': '203.0.113.1'}) == [200]
+    assert statuses(client, '/auth/login', 1, headers={'X-Forwarded-For': '203.0.113.2'}) == [429]
+
+
+def test_trusted_proxy_address_is_used(clock):
+    client = limited_app(clock, {'auth': [(1, WINDOW, 'ip')]}, trusted_proxies=1)
+
+    # The client may prepend anything; the address the load balancer appended counts
+    assert statuses(client, '/auth/login', 1, headers={'X-Forwarded-For': '198.51.100.9, 203.0.113.1'}) == [200]
+    assert statuses(client, '/auth/login', 1, headers={'X-Forwarded-For': '198.51.100.8, 203.0.113.1'}) == [429]
+    assert statuses(client, '/auth/login', 1, headers={'X-Forwarded-For': '203.0.113.2'}) == [200]
+
+
+def test_user_scope_counts_per_token_user(clock):
+    client = limited_app(clock, {'auth': [(1, WINDOW, 'user')]})
+
+    assert statuses(client, '/auth/login', 2, headers=auth_headers(1)) == [200, 429]
+    assert statuses(client, '/auth/login', 1, headers=auth_headers(2)) == [200]
+    # Without a valid token the IP is counted
+    assert statuses(client, '/auth/login', 2) == [200, 429]
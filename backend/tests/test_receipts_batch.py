@@ -0,0 +1,26 @@
+from tests.conftest import RECEIPT, auth_headers
+
+
+def test_malformed_receipts_are_invalid_without_failing_the_batch(client, user):
+    payloads = [
+        RECEIPT,
+        {**RECEIPT, 'items': 'milk'},
+        {**RECEIPT, 'items': {'name': 'Milk'}},
+        {**RECEIPT, 'items': ['Milk']},
+        {**RECEIPT, 'items': [{'name': 'Milk', 'price': 1.5}, {'name': 'Milk', 'price': '1.50'}]},
+        'not a receipt',
+        {**RECEIPT, 'total': 9.0, 'items': []},
+    ]
+    response = client.post('/api/receipts/batch', json={'receipts': payloads}, headers=auth_headers(user.id))
+
+    assert response.status_code == 200, response.get_json()
+    results = response.get_json()['results']
+    assert [r['index'] for r in results] == list(range(len(payloads)))
+    assert [r['status'] for r in results] == ['created', 'invalid', 'invalid', 'invalid', 'invalid', 'invalid', 'created']
+    assert results[1]['error'] == 'items must be a list of objects'
+    assert results[4]['error'] == 'Invalid item name or price'
+
+
+def test_duplicates_in_one_batch(client, user):
+    response = client.post('/api/receipts/batch', json={'receipts': [RECEIPT, RECEIPT]}, headers=auth_headers(user.id))
+    assert [r['status'] for r in response.get_json()['results']] == ['created', 'duplicate']
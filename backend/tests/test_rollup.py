@@ -0,0 +1,61 @@
+from models import db, ReceiptDailyRollup
+from tests.conftest import auth_headers
+
+# Values clients have sent that the receipt endpoints accept as they are
+MESSY_RECEIPT = {
+    'store_name': 'Corner Shop',
+    'store_category': 'Groceries',
+    'date': '2026-03-02',
+    'total': '12.5',
+    'items': [
+        {'name': 'Milk', 'price': 1.5, 'total': '1.5', 'category': ['x']},
+        {'name': 'Bread', 'price': 3.0, 'total': 3.0, 'category': ' ' + 'B' * 150},
+        {'name': 'Soap', 'price': 2.0, 'total': 2.0, 'category': '  '},
+    ],
+}
+
+
+def rollup():
+    return {
+        row.category: (row.spend, row.item_count, row.receipt_count)
+        for row in db.session.query(ReceiptDailyRollup)
+    }
+
+
+def expected(receipts=1):
+    return {
+        '': (12.5 * receipts, 0, receipts),
+        "['x']": (1.5 * receipts, receipts, 0),
+        'B' * 100: (3.0 * receipts, receipts, 0),
+        'Other': (2.0 * receipts, receipts, 0),
+    }
+
+
+def test_receipt_with_messy_total_and_categories(client, user):
+    response = client.post('/api/receipts', json=MESSY_RECEIPT, headers=auth_headers(user.id))
+
+    assert response.status_code == 201, response.get_json()
+    assert rollup() == expected()
+
+
+def test_batch_with_messy_total_and_categories(client, user):
+    payloads = [MESSY_RECEIPT, {**MESSY_RECEIPT, 'store_name': 'Market', 'total': ' 8 '}]
+    response = client.post('/api/receipts/batch', json={'receipts': payloads}, headers=auth_headers(user.id))
+
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['summary'] == {'created': 2}
+    assert {row.store_name: row.spend for row in db.session.query(ReceiptDailyRollup).filter_by(category='')} == {
+        'Corner Shop': 12.5, 'Market': 8.0
+    }
+
+
+def test_edit_of_receipt_with_messy_total_and_categories(client, user):
+    receipt_id = client.post('/api/receipts', json=MESSY_RECEIPT, headers=auth_headers(user.id)).get_json()['id']
+
+    response = client.patch(f'/api/receipts/{receipt_id}/edits', headers=auth_headers(user.id), json={
+        'operations': [{'op': 'set_field', 'field': 'store_name', 'value': 'Market'}]
+    })
+
+    assert response.status_code == 200, response.get_json()
+    assert rollup() == expected()
+    assert {row.store_name for row in db.session.query(ReceiptDailyRollup)} == {'Market'}
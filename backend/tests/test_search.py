@@ -0,0 +1,143 @@
+import pytest
+from sqlalchemy import text
+
+from models import db, User
+from tests.conftest import auth_headers, run_migration
+from utils import search
+
+
+def create_search_index():
+    """Runs the migration that creates (and backfills) the index on the test database."""
+    run_migration('e7a9d1c4f6b2_receipt_search_index.py')
+
+
+@pytest.fixture
+def search_index(app, monkeypatch):
+    monkeypatch.setattr(search, '_table_present', {})
+    create_search_index()
+    yield
+    db.session.remove()
+    with db.engine.begin() as connection:
+        connection.execute(text('DROP TABLE IF EXISTS receipt_search'))
+
+
+def add_receipt(client, user, store_name, items=(), day=1):
+    receipt = {
+        'store_name': store_name,
+        'date': f'2026-03-{day:02d}',
+        'total': 1.0 + day,
+        'items': [{'name': name, 'price': 1.0, 'category': 'Other'} for name in items],
+    }
+    response = client.post('/api/receipts', json=receipt, headers=auth_headers(user.id))
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['id']
+
+
+def find(client, user, q, **params):
+    response = client.get('/api/receipts/search', query_string={'q': q, **params}, headers=auth_headers(user.id))
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def found_ids(client, user, q):
+    return [receipt['id'] for receipt in find(client, user, q)['receipts']]
+
+
+def test_store_name_match_outranks_item_match(client, user, search_index):
+    item_hit = add_receipt(client, user, 'Corner Shop', ['Milk', 'Bread'], day=1)
+    store_hit = add_receipt(client, user, 'Milk Bar', ['Coffee'], day=2)
+    for day in range(3, 7):  # bm25 only scores terms that are rare in the user's receipts
+        add_receipt(client, user, 'Bakery', ['Bread'], day=day)
+
+    result = find(client, user, 'milk')
+
+    assert [receipt['id'] for receipt in result['receipts']] == [store_hit, item_hit]
+    ranks = [receipt['rank'] for receipt in result['receipts']]
+    assert ranks[0] > ranks[1]
+
+
+def test_every_term_is_a_prefix_match(client, user, search_index):
+    corner = add_receipt(client, user, 'Corner Shop', ['Semi-skimmed milk'], day=1)
+    add_receipt(client, user, 'Corner Bakery', ['Bread'], day=2)
+
+    assert found_ids(client, user, 'mil') == [corner]
+    assert found_ids(client, user, 'corn semi') == [corner]
+    assert found_ids(client, user, 'corn mil bread') == []
+
+
+def test_other_users_receipts_are_not_found(app, client, user, search_index):
+    other = User(email='other@example.com', password_hash='x', email_verified=True, plan='pro')
+    db.session.add(other)
+    db.session.commit()
+    add_receipt(client, other, 'Corner Shop', ['Milk'])
+
+    assert found_ids(client, user, 'milk') == []
+    assert len(found_ids(client, other, 'milk')) == 1
+
+
+def test_pagination(client, user, search_index):
+    ids = [add_receipt(client, user, 'Corner Shop', ['Milk'], day=day) for day in range(1, 6)]
+
+    first = find(client, user, 'milk', limit=2)
+    second = find(client, user, 'milk', limit=2, offset=first['next_offset'])
+    last = find(client, user, 'milk', limit=2, offset=second['next_offset'])
+
+    assert (first['has_more'], second['has_more'], last['has_more']) == (True, True, False)
+    assert (first['next_offset'], second['next_offset'], last['next_offset']) == (2, 4, None)
+    pages = [receipt['id'] for page in (first, second, last) for receipt in page['receipts']]
+    assert pages == sorted(ids, reverse=True)  # equal ranks: newest receipt first
+
+
+def test_index_follows_inserts_edits_and_deletes(client, user, search_index):
+    receipt_id = add_receipt(client, user, 'Corner Shop', ['Milk'])
+    assert found_ids(client, user, 'corner') == [receipt_id]
+
+    response = client.patch(f'/api/receipts/{receipt_id}/update-field', headers=auth_headers(user.id),
+                            json={'field': 'store_name', 'value': 'Market'})
+    assert response.status_code == 200, response.get_json()
+    assert found_ids(client, user, 'corner') == []
+    assert found_ids(client, user, 'market') == [receipt_id]
+
+    response = client.patch(f'/api/receipts/{receipt_id}/edits', headers=auth_headers(user.id), json={
+        'operations': [{'op': 'set_item', 'item_index': 0, 'item_field': 'name', 'item_value': 'Oat drink'}]
+    })
+    assert response.status_code == 200, response.get_json()
+    assert found_ids(client, user, 'milk') == []
+    assert found_ids(client, user, 'oat') == [receipt_id]
+
+    response = client.delete(f'/api/receipts/{receipt_id}', headers=auth_headers(user.id))
+    assert response.status_code == 200, response.get_json()
+    assert found_ids(client, user, 'market') == []
+    assert db.session.execute(text('SELECT count(*) FROM receipt_search')).scalar() == 0
+
+
+def test_migration_indexes_existing_receipts(app, client, user, monkeypatch):
+    monkeypatch.setattr(search, '_table_present', {})
+    try:
+        receipt_id = add_receipt(client, user, 'Corner Shop', ['Milk'])
+        assert found_ids(client, user, 'milk') == []  # no index yet
+
+        create_search_index()
+        monkeypatch.setattr(search, 'SEARCH_TABLE_RECHECK_SECONDS', 0)
+
+        assert found_ids(client, user, 'milk') == [receipt_id]
+    finally:
+        db.session.remove()
+        with db.engine.begin() as connection:
+            connection.execute(text('DROP TABLE IF EXISTS receipt_search'))
+
+
+def test_missing_index_is_checked_again_after_a_while(app, monkeypatch):
+    monkeypatch.setattr(search, '_table_present', {})
+    try:
+        assert not search.search_index_available(db.session.connection())
+        db.session.commit()
+        create_search_index()
+
+        assert not search.search_index_available(db.session.connection())
+        monkeypatch.setattr(search, 'SEARCH_TABLE_RECHECK_SECONDS', 0)
+        assert search.search_index_available(db.session.connection())
+    finally:
+        db.session.remove()
+        with db.engine.begin() as connection:
+            connection.execute(text('DROP TABLE IF EXISTS receipt_search'))
@@ -0,0 +1,54 @@
+from datetime import datetime
+
+from models import db, Receipt, ReceiptUsage
+from tests.conftest import auth_headers, run_migration
+from utils.usage import month_start
+
+
+def add_receipt(client, user, day):
+    receipt = {'store_name': 'Corner Shop', 'date': f'2026-03-{day:02d}', 'total': 1.0 + day, 'items': []}
+    response = client.post('/api/receipts', json=receipt, headers=auth_headers(user.id))
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['id']
+
+
+def receipt_count(client, user):
+    response = client.get('/api/subscription/receipt-count', headers=auth_headers(user.id))
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_total_follows_uploads_and_deletes(client, user):
+    ids = [add_receipt(client, user, day) for day in (1, 2, 3)]
+    client.delete(f'/api/receipts/{ids[0]}', headers=auth_headers(user.id))
+
+    assert receipt_count(client, user)['total_receipt_count'] == 2
+
+
+def test_reading_the_count_writes_nothing(app, client, user):
+    user.plan = 'basic'
+    db.session.add(Receipt(user_id=user.id, store_name='Corner Shop', total=1.0, fingerprint='a'))
+    db.session.commit()
+
+    result = receipt_count(client, user)
+
+    assert result['current_month_receipt_count'] == 1  # counted, as the month has no counter yet
+    assert db.session.query(ReceiptUsage).count() == 0
+
+
+def test_migration_fills_the_counters_of_earlier_months(app, client, user):
+    this_month = month_start()
+    for fingerprint, created_at in [('a', datetime(2025, 1, 5)), ('b', datetime(2025, 1, 31, 23)), ('c', datetime(2025, 3, 1))]:
+        db.session.add(Receipt(user_id=user.id, store_name='Corner Shop', total=1.0,
+                               fingerprint=fingerprint, created_at=created_at))
+    db.session.commit()
+    add_receipt(client, user, 1)  # creates this month's counter
+
+    run_migration('d1f7a3c5b9e0_backfill_receipt_usage.py')
+    run_migration('d1f7a3c5b9e0_backfill_receipt_usage.py')  # rows already present are kept
+
+    db.session.expire_all()
+    assert {(row.month, row.count) for row in db.session.query(ReceiptUsage)} == {
+        (datetime(2025, 1, 1).date(), 2), (datetime(2025, 3, 1).date(), 1), (this_month, 1)
+    }
+    assert receipt_count(client, user)['total_receipt_count'] == 4
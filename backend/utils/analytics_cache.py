@@ -0,0 +1,283 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+
+from flask import request, current_app as app, copy_current_request_context
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session, object_session
+
+from models import User, Receipt
+
+# Analytics responses cached per (user, endpoint, normalized query args, data version, day).
+# User.data_version is bumped in the same transaction as every receipt write (flush events
+# below) and by currency changes, so a write makes the old entries unreachable instead of
+# having to find and delete them; the LRU bound drops them later. The UTC day is part of
+# the key because "last 30 days" style windows move at midnight without any write.
+#
+# Entries younger than ANALYTICS_CACHE_FRESH_SECONDS are served as is. Older ones, up to
+# ANALYTICS_CACHE_STALE_SECONDS, are served while a background thread recomputes them.
+CHANGED_USERS_KEY = 'analytics_changed_users'
+IGNORED_ARGS = {'user_id'}  # sent by the app, but the token decides whose data is read
+
+
+class MemoryCacheBackend:
+    """Per-process LRU."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, stored_at):
+        with self._lock:
+            self._entries[key] = (value, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def size(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """LRU in a local SQLite file, shared by every gunicorn worker on the host."""
+
+    EVICT_EVERY = 64  # writes between size checks
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS analytics_cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_analytics_cache_accessed_at ON analytics_cache (accessed_at)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute('SELECT value, stored_at FROM analytics_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE analytics_cache SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return bytes(row[0]), row[1]
+
+    def set(self, key, value, stored_at):
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO analytics_cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)',
+            (key, value, stored_at, time.time())
+        )
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            conn.execute(
+                'DELETE FROM analytics_cache WHERE key IN ('
+                'SELECT key FROM analytics_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def size(self):
+        return self._connection().execute('SELECT COUNT(*) FROM analytics_cache').fetchone()[0]
+
+
+class AnalyticsCache:
+    def __init__(self, backend, fresh_seconds, stale_seconds):
+        self.backend = backend
+        self.fresh_seconds = fresh_seconds
+        self.stale_seconds = stale_seconds
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        """Returns (value, state) with state 'fresh', 'stale' or None for a miss."""
+        entry = self.backend.get(key)
+        age = time.time() - entry[1] if entry is not None else None
+        with self._lock:
+            if age is not None and age < self.fresh_seconds:
+                self.hits += 1
+                return entry[0], 'fresh'
+            if age is not None and age < self.stale_seconds:
+                self.stale_hits += 1
+                return entry[0], 'stale'
+            self.misses += 1
+            return None, None
+
+    def store(self, key, value):
+        self.backend.set(key, value, time.time())
+
+    def claim_refresh(self, key):
+        """True for the one caller that should recompute a stale entry."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def release_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': self.backend.size(),
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+        }
+
+
+def init_analytics_cache(app):
+    """Builds the cache from ANALYTICS_CACHE_* settings; backend 'none' disables it."""
+    backend_name = app.config.get('ANALYTICS_CACHE_BACKEND', 'memory')
+    max_entries = app.config.get('ANALYTICS_CACHE_MAX_ENTRIES', 2048)
+    if backend_name == 'none':
+        backend = None
+    elif backend_name == 'sqlite':
+        backend = SQLiteCacheBackend(app.config['ANALYTICS_CACHE_PATH'], max_entries)
+    else:
+        backend = MemoryCacheBackend(max_entries)
+    app.extensions['analytics_cache'] = backend and AnalyticsCache(
+        backend,
+        app.config.get('ANALYTICS_CACHE_FRESH_SECONDS', 300),
+        app.config.get('ANALYTICS_CACHE_STALE_SECONDS', 3600),
+    )
+    register_version_bumps()
+
+
+def normalized_args(args):
+    """Query args in a stable order, without blanks (the endpoints treat '' as absent)."""
+    return '&'.join(
+        f'{name}={value}'
+        for name in sorted(args)
+        if name not in IGNORED_ARGS
+        for value in sorted(args.getlist(name))
+        if value != ''
+    )
+
+
+def cache_key(user_id, endpoint, args, version):
+    digest = hashlib.sha256(normalized_args(args).encode('utf-8')).hexdigest()[:32]
+    return f'{user_id}:{endpoint}:{version}:{datetime.utcnow().date().isoformat()}:{digest}'
+
+
+def data_version(user_id):
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
+        return db.session.query(User.data_version).filter(User.id == user_id).scalar()
+
+
+def cached_analytics(endpoint):
+    """
+    Caches a GET analytics view's 200 JSON response. Goes below @token_required:
+    the wrapped view is called as view(user_id, ...) like any other route.
+    The user's data_version is read first, so a hit is one statement and a miss is one
+    more than the view's own.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(user_id, *args, **kwargs):
+            cache = app.extensions.get('analytics_cache')
+            version = data_version(user_id) if cache else None
+            if version is None:
+                return f(user_id, *args, **kwargs)
+
+            key = cache_key(user_id, endpoint, request.args, version)
+            body, state = cache.lookup(key)
+            if state == 'stale' and cache.claim_refresh(key):
+                @copy_current_request_context
+                def refresh():
+                    try:
+                        store_response(cache, key, f(user_id, *args, **kwargs))
+                    except Exception as e:
+                        app.logger.error(f"[Analytics cache] Refresh of {endpoint} failed: {e}")
+                    finally:
+                        cache.release_refresh(key)
+                threading.Thread(target=refresh, daemon=True).start()
+            if body is not None:
+                response = app.response_class(body, mimetype='application/json')
+                response.headers['X-Cache'] = 'HIT' if state == 'fresh' else 'STALE'
+                return response
+
+            return store_response(cache, key, f(user_id, *args, **kwargs))
+        return decorated
+    return decorator
+
+
+def store_response(cache, key, result):
+    response = app.make_response(result)
+    if response.status_code == 200 and response.mimetype == 'application/json':
+        cache.store(key, response.get_data())
+        response.headers['X-Cache'] = 'MISS'
+    return response
+
+
+def bump_data_version(session, user_ids):
+    """Invalidates cached analytics for these users as part of the current transaction."""
+    if user_ids:
+        table = User.__table__
+        session.connection().execute(
+            update(table).where(table.c.id.in_(list(user_ids))).values(data_version=table.c.data_version + 1)
+        )
+
+
+def changed_users(target):
+    return object_session(target).info.setdefault(CHANGED_USERS_KEY, set())
+
+
+def _after_receipt_write(mapper, connection, target):
+    changed_users(target).add(target.user_id)
+
+
+def _before_receipt_update(mapper, connection, target):
+    if object_session(target).is_modified(target, include_collections=False):
+        changed_users(target).add(target.user_id)
+
+
+def _before_flush(session, flush_context, instances):
+    session.info.pop(CHANGED_USERS_KEY, None)
+
+
+def _after_flush(session, flush_context):
+    bump_data_version(session, session.info.pop(CHANGED_USERS_KEY, None))
+
+
+def register_version_bumps():
+    """Bumps User.data_version from Receipt inserts, updates and deletes."""
+    if not event.contains(Receipt, 'after_insert', _after_receipt_write):
+        event.listen(Receipt, 'after_insert', _after_receipt_write)
+        event.listen(Receipt, 'before_update', _before_receipt_update)
+        event.listen(Receipt, 'after_delete', _after_receipt_write)
+        event.listen(Session, 'before_flush', _before_flush)
+        event.listen(Session, 'after_flush', _after_flush)
@@ -0,0 +1,68 @@
+import time
+from collections import namedtuple
+
+from flask import g, has_app_context, current_app as app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import User
+from utils.analytics_cache import MemoryCacheBackend
+
+# The authenticated user's id, plan, currency and subscription status, loaded once per
+# request into flask.g by @token_required(load_user=True) or on the first current_user()
+# call. Projections are cached per worker for USER_CACHE_TTL_SECONDS. ORM updates of a
+# user (profile, plan and Stripe webhook handlers) evict it from this worker's cache when
+# they commit; other workers pick the change up when their entry expires.
+CHANGED_USERS_KEY = 'current_user_changed'
+
+CurrentUser = namedtuple('CurrentUser', 'id plan currency subscription_status')
+
+
+def init_user_cache(app):
+    """Per-worker cache of CurrentUser projections; USER_CACHE_TTL_SECONDS = 0 disables it."""
+    ttl = app.config.get('USER_CACHE_TTL_SECONDS', 30)
+    app.extensions['user_cache'] = MemoryCacheBackend(app.config.get('USER_CACHE_MAX_ENTRIES', 4096)) if ttl else None
+    register_user_cache_eviction()
+
+
+def load_user(db, user_id):
+    """The user's CurrentUser from the worker's cache when fresh, else from the database; None if unknown."""
+    cache = app.extensions.get('user_cache')
+    entry = cache.get(user_id) if cache else None
+    if entry is not None and time.time() - entry[1] < app.config.get('USER_CACHE_TTL_SECONDS', 30):
+        return entry[0]
+
+    row = db.session.query(User.id, User.plan, User.currency, User.subscription_status)\
+        .filter(User.id == user_id).first()
+    user = CurrentUser(row.id, row.plan or 'basic', row.currency or 'USD', row.subscription_status) if row else None
+    if cache and user:
+        cache.set(user_id, user, time.time())
+    return user
+
+
+def current_user(user_id):
+    """The request's CurrentUser, loaded at most once per request."""
+    if 'current_user' not in g:
+        g.current_user = load_user(app.extensions['sqlalchemy'], user_id)
+    return g.current_user
+
+
+def _after_user_update(mapper, connection, target):
+    object_session(target).info.setdefault(CHANGED_USERS_KEY, set()).add(target.id)
+
+
+def _after_commit(session):
+    user_ids = session.info.pop(CHANGED_USERS_KEY, None)
+    if not user_ids or not has_app_context():
+        return
+    cache = app.extensions.get('user_cache')
+    if cache:
+        for user_id in user_ids:
+            cache.delete(user_id)
+
+
+def register_user_cache_eviction():
+    """Evicts a user's cached projection when an ORM update of the user commits."""
+    if not event.contains(User, 'after_update', _after_user_update):
+        event.listen(User, 'after_update', _after_user_update)
+        event.listen(Session, 'after_commit', _after_commit)
@@ -1,53 +1,210 @@
 from flask import request, jsonify, current_app as app
 from functools import wraps
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+import hashlib
 import jwt
+import time
 from datetime import datetime, timedelta
 
 # Import necessary components that the decorator needs
-from errors import AuthenticationError
+from errors import AuthenticationError, ValidationError
+from models import IdempotencyRecord
+from utils.analytics_cache import MemoryCacheBackend
+from utils.current_user import current_user
+
+IDEMPOTENCY_POLL_INTERVAL = 0.1 # seconds between checks while a duplicate waits
+
+def init_token_cache(app):
+    """Per-worker cache of verified tokens; TOKEN_CACHE_MAX_ENTRIES = 0 disables it."""
+    max_entries = app.config.get('TOKEN_CACHE_MAX_ENTRIES', 4096)
+    app.extensions['token_cache'] = MemoryCacheBackend(max_entries) if max_entries else None
+
+def verified_user_id(token):
+    """
+    The user_id claim of a valid HS256 token. Verified tokens are cached by their digest
+    until their `exp` or for TOKEN_CACHE_TTL_SECONDS, whichever comes first, so the screens
+    that send many requests with one token verify it once.
+    """
+    cache = app.extensions.get('token_cache')
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    now = time.time()
+    entry = cache.get(key) if cache else None
+    if entry is not None:
+        user_id, expires_at = entry[0]
+        if now < expires_at:
+            return user_id
+
+    data = jwt.decode(token, app.config['JWT_SECRET'], algorithms=["HS256"])
+    user_id = data.get('user_id')
+    if user_id is None:
+        raise AuthenticationError('User ID not found in token!')
+
+    if cache:
+        expires_at = now + app.config.get('TOKEN_CACHE_TTL_SECONDS', 300)
+        if isinstance(data.get('exp'), (int, float)):
+            expires_at = min(expires_at, data['exp'])
+        cache.set(key, (user_id, expires_at), None)
+    return user_id
+
+def token_required(f=None, load_user=False):
+    """
+    Passes the token's user_id to the view as its first argument. With load_user=True
+    (used as @token_required(load_user=True)) the user's CurrentUser projection is also
+    loaded into flask.g.current_user, None for an unknown user (see utils/current_user.py).
+    """
+    if f is None:
+        return lambda f: token_required(f, load_user)
 
-def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         token = None
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
+        auth_header = request.headers.get('Authorization')
+        if auth_header:
             parts = auth_header.split()
             if len(parts) == 2 and parts[0].lower() == 'bearer':
                 token = parts[1]
             elif len(parts) > 1:
-                 with app.app_context():
-                      app.logger.warning(f'Malformed Authorization header: {auth_header}')
+                app.logger.warning(f'Malformed Authorization header: {auth_header}')
 
         if not token:
-            # Use app.app_context() to ensure logger and config are accessible
-            with app.app_context():
-                 app.logger.warning('Token is missing!')
+            app.logger.warning('Token is missing!')
             raise AuthenticationError('Token is missing!')
         try:
-            # Access JWT_SECRET from the app config using current_app
-            # Ensure this is within an app context if run outside a request
-            with app.app_context():
-                data = jwt.decode(token, app.config['JWT_SECRET'], algorithms=["HS256"])
-
-            # Pass the user_id to the decorated function
-            user_id = data.get('user_id')
-            if user_id is None:
-                 raise AuthenticationError('User ID not found in token!')
-
+            user_id = verified_user_id(token)
         except jwt.ExpiredSignatureError:
-            with app.app_context():
-                app.logger.error("Token validation error: Signature has expired")
+            app.logger.error("Token validation error: Signature has expired")
             raise AuthenticationError('Token has expired!')
         except jwt.InvalidTokenError:
-            with app.app_context():
-                app.logger.error("Token validation error: Invalid token")
+            app.logger.error("Token validation error: Invalid token")
             raise AuthenticationError('Token is invalid!')
         except Exception as e:
-            with app.app_context():
-                app.logger.error(f"Token validation error: {str(e)}")
+            app.logger.error(f"Token validation error: {str(e)}")
             raise AuthenticationError('Token is invalid!')
 
+        if load_user:
+            current_user(user_id)
         return f(user_id, *args, **kwargs) # Pass user_id as the first argument
     return decorated
 
+def idempotent(f):
+    """
+    Honours an Idempotency-Key header on a token_required POST handler.
+
+    The first request with a key claims it by inserting an IdempotencyRecord, runs the
+    handler and stores the response. Retries with the same key get the stored response
+    without running the handler; a retry that arrives while the first request is still
+    running waits for it (up to IDEMPOTENCY_WAIT_SECONDS). Server errors release the key
+    so the client can retry. A claim still in progress after IDEMPOTENCY_LEASE_SECONDS
+    belongs to a worker that died mid-handler (e.g. killed by gunicorn's timeout); the
+    next retry takes it over and runs the handler. Requests without the header are not affected.
+    """
+    @wraps(f)
+    def decorated(user_id, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return f(user_id, *args, **kwargs)
+        if len(key) > 255:
+            raise ValidationError('Idempotency-Key must be at most 255 characters')
+
+        db = app.extensions['sqlalchemy']
+        request_hash = hashlib.sha256(
+            request.method.encode('utf-8') + b' ' + request.path.encode('utf-8') + b'\n' + request.get_data()
+        ).hexdigest()
+        now = datetime.utcnow()
+
+        # Expired records are dropped here, which keeps the table bounded by the TTL
+        db.session.query(IdempotencyRecord).filter(IdempotencyRecord.expires_at < now)\
+            .delete(synchronize_session=False)
+        db.session.add(IdempotencyRecord(
+            user_id=user_id,
+            key=key,
+            request_hash=request_hash,
+            status='in_progress',
+            expires_at=now + timedelta(hours=app.config.get('IDEMPOTENCY_TTL_HOURS', 24))
+        ))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            replay = replay_idempotent_response(db, user_id, key, request_hash)
+            if replay is not None:
+                return replay
+
+        try:
+            response = app.make_response(f(user_id, *args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            release_idempotency_key(db, user_id, key)
+            raise
+
+        if response.status_code >= 500 or response.is_streamed:
+            release_idempotency_key(db, user_id, key)
+            return response
+
+        body = response.get_data(as_text=True)
+        record = db.session.query(IdempotencyRecord).filter_by(user_id=user_id, key=key).first()
+        if record:
+            record.status = 'completed'
+            record.response_status = response.status_code
+            record.response_mimetype = response.mimetype
+            if len(body.encode('utf-8')) <= app.config.get('IDEMPOTENCY_MAX_BODY_BYTES', 64 * 1024):
+                record.response_body = body
+            db.session.commit()
+        return response
+    return decorated
+
+def release_idempotency_key(db, user_id, key):
+    db.session.query(IdempotencyRecord).filter_by(user_id=user_id, key=key)\
+        .delete(synchronize_session=False)
+    db.session.commit()
+
+def take_over_abandoned_claim(db, record):
+    """
+    Claims an in_progress record whose lease ran out; True if this request now owns it.
+    created_at is the claim time, and the update only matches the claim that was read,
+    so one of several concurrent retries wins.
+    """
+    now = datetime.utcnow()
+    if record.created_at is None or now - record.created_at < timedelta(seconds=app.config.get('IDEMPOTENCY_LEASE_SECONDS', 60)):
+        return False
+    result = db.session.execute(
+        update(IdempotencyRecord)
+        .where(
+            IdempotencyRecord.id == record.id,
+            IdempotencyRecord.status == 'in_progress',
+            IdempotencyRecord.created_at == record.created_at
+        )
+        .values(created_at=now, expires_at=now + timedelta(hours=app.config.get('IDEMPOTENCY_TTL_HOURS', 24)))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+def replay_idempotent_response(db, user_id, key, request_hash):
+    """The response for a retry of a claimed key; None when the retry took over an abandoned claim."""
+    deadline = time.monotonic() + app.config.get('IDEMPOTENCY_WAIT_SECONDS', 10)
+    while True:
+        record = db.session.query(IdempotencyRecord).filter_by(user_id=user_id, key=key).first()
+        if record is None:
+            # The first request failed and released the key; let the client retry
+            return jsonify({'error': 'The original request with this Idempotency-Key failed, retry it'}), 409
+        if record.request_hash != request_hash:
+            return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+        if record.status == 'completed':
+            break
+        if take_over_abandoned_claim(db, record):
+            app.logger.warning(f"Taking over an abandoned Idempotency-Key claim of user {user_id}.")
+            return None
+        if time.monotonic() >= deadline:
+            return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409
+        # End the read transaction so the next poll sees the other worker's commit
+        db.session.rollback()
+        time.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+    if record.response_body is None:
+        return jsonify({'error': 'The response for this Idempotency-Key is too large to replay'}), 409
+    app.logger.info(f"Replaying stored response for Idempotency-Key of user {user_id}.")
+    response = app.response_class(record.response_body, status=record.response_status, mimetype=record.response_mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
@@ -0,0 +1,258 @@
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from sqlalchemy import null
+
+from models import AnalyticsExport, Receipt, User
+from utils import pdf_export, widgets
+
+# Analytics PDF exports as background jobs. POST /api/analytics/exports stores a queued
+# AnalyticsExport row and returns; a thread then computes every chart the user's plan
+# includes from one scan of their receipts (utils/widgets.py, like the dashboard) and
+# hands the ReportLab rendering to a process pool, so neither the scan nor the render
+# holds a gunicorn worker. Rendered files are named by the SHA256 of what they show, so
+# exporting unchanged data again (the same day) reuses the PDF already on disk.
+ACTIVE_STATUSES = ('queued', 'running')
+
+# chart: (dashboard widget, option, values), the windows the app's export shows per chart
+EXPORT_CHARTS = {
+    'bill_stats': ('bill_stats', 'interval', ['M', 'All']),
+    'total_spent': ('total_spent', 'interval', ['daily', 'weekly', 'monthly']),
+    'by_category': ('expenses_by_category', 'period', ['week', 'month', 'all']),
+    'top_products': ('top_products', 'period', ['month', 'year', 'all']),
+    'most_expensive': ('most_expensive', 'period', ['month', 'year', 'all']),
+    'shopping_days': ('shopping_days', 'period', ['month', 'all']),
+    'diet_composition': ('diet_composition', 'interval', ['3months']),
+}
+ITEM_WIDGETS = {'expenses_by_category', 'top_products', 'most_expensive', 'diet_composition'}
+
+
+class RenderPool:
+    """Process pool for the PDF rendering, started on first use in each (forked) worker."""
+
+    def __init__(self, workers, tasks_per_child):
+        self.workers = workers
+        self.tasks_per_child = tasks_per_child
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # spawn: the workers do not inherit the parent's threads, sockets or sessions
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    max_tasks_per_child=self.tasks_per_child,
+                )
+                self._pid = os.getpid()
+            return self._executor.submit(fn, *args)
+
+    def reset(self):
+        """Drops a pool whose worker died; the next submit starts a new one."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def init_exports(app):
+    """
+    Sets up the render pool and the PDF cache directory from the EXPORT_* settings;
+    0 workers renders in the job's thread.
+    """
+    os.makedirs(app.config['EXPORT_CACHE_DIR'], exist_ok=True)
+    workers = app.config.get('EXPORT_RENDER_WORKERS', 2)
+    app.extensions['analytics_exports'] = workers and RenderPool(
+        workers,
+        app.config.get('EXPORT_RENDER_TASKS_PER_CHILD', 20),
+    )
+
+
+def export_charts(user_plan):
+    return pdf_export.plan_charts(user_plan) + (['diet_composition'] if user_plan == 'pro' else [])
+
+
+def export_data(db, user_id, user_plan, today, item_columns=None):
+    """{chart: {interval: payload}} for the plan's charts, in the shapes of the analytics endpoints."""
+    charts = export_charts(user_plan)
+    needs_items = any(EXPORT_CHARTS[chart][0] in ITEM_WIDGETS for chart in charts)
+    rows = db.session.query(
+        Receipt.date,
+        Receipt.total,
+        Receipt.store_name,
+        Receipt.store_category,
+        Receipt.items if needs_items else null().label('items')
+    ).filter(Receipt.user_id == user_id).order_by(Receipt.date, Receipt.id).all()
+    currency = db.session.query(User.currency).filter(User.id == user_id).scalar() or 'USD'
+
+    # The dashboard builder takes one option value per widget, so the windows are
+    # computed in rounds (the first value of every chart, then the second, ...)
+    data = {chart: {} for chart in charts}
+    rounds = max(len(EXPORT_CHARTS[chart][2]) for chart in charts)
+    for i in range(rounds):
+        params, targets = {}, {}
+        for chart in charts:
+            widget, option, values = EXPORT_CHARTS[chart]
+            if i < len(values):
+                params[widget] = {**widgets.WIDGET_PARAMS[widget], option: values[i]}
+                targets[widget] = (chart, values[i])
+        payloads = widgets.build_dashboard(
+            list(params), params, rows, None, None, currency, bool(rows), today, item_columns=item_columns
+        )
+        for widget, payload in payloads.items():
+            chart, value = targets[widget]
+            data[chart][value] = payload
+    return data
+
+
+def render_mode(app):
+    mode = app.config.get('EXPORT_RENDER_MODE', 'chunked')
+    return mode if mode in pdf_export.RENDER_MODES else 'chunked'
+
+
+def content_hash(user_plan, export_date, data, mode):
+    body = json.dumps([pdf_export.LAYOUT_VERSION, mode, user_plan, export_date, data],
+                      sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def pdf_path(app, digest):
+    return os.path.join(app.config['EXPORT_CACHE_DIR'], f'{digest}.pdf')
+
+
+def evict_cached_pdfs(app):
+    """
+    Keeps the EXPORT_CACHE_MAX_FILES most recently used PDFs, and removes the partial
+    renders of jobs that timed out: a render outlives its job's timeout in the pool and
+    leaves its .tmp file behind, so one not written to for the timeout is abandoned.
+    """
+    cache_dir = app.config['EXPORT_CACHE_DIR']
+    abandoned = datetime.utcnow().timestamp() - app.config.get('EXPORT_JOB_TIMEOUT_SECONDS', 300)
+    for path in glob.glob(os.path.join(cache_dir, '*.tmp')):
+        try:
+            if os.path.getmtime(path) < abandoned:
+                os.remove(path)
+        except OSError:
+            pass  # renamed or removed by its job or another worker
+
+    paths = glob.glob(os.path.join(cache_dir, '*.pdf'))
+    excess = len(paths) - app.config.get('EXPORT_CACHE_MAX_FILES', 500)
+    if excess > 0:
+        for path in sorted(paths, key=os.path.getmtime)[:excess]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # already evicted by another worker
+
+
+def is_expired(app, job):
+    """A job still active after the timeout was lost with the worker running it."""
+    timeout = timedelta(seconds=app.config.get('EXPORT_JOB_TIMEOUT_SECONDS', 300))
+    return job.status in ACTIVE_STATUSES and job.created_at < datetime.utcnow() - timeout
+
+
+def create_job(db, app, user_id):
+    """
+    A new queued export for the user, or the one already in progress. Jobs older than
+    EXPORT_JOB_RETENTION_HOURS are deleted on the way.
+    """
+    now = datetime.utcnow()
+    retention = timedelta(hours=app.config.get('EXPORT_JOB_RETENTION_HOURS', 24))
+    db.session.query(AnalyticsExport).filter(
+        AnalyticsExport.user_id == user_id,
+        AnalyticsExport.created_at < now - retention
+    ).delete(synchronize_session=False)
+
+    active = db.session.query(AnalyticsExport).filter(
+        AnalyticsExport.user_id == user_id,
+        AnalyticsExport.status.in_(ACTIVE_STATUSES)
+    ).order_by(AnalyticsExport.created_at.desc()).first()
+    if active is not None and not is_expired(app, active):
+        db.session.commit()
+        return active, False
+
+    job = AnalyticsExport(id=uuid.uuid4().hex, user_id=user_id, status='queued', created_at=now)
+    db.session.add(job)
+    db.session.commit()
+    return job, True
+
+
+def start_job(app, job_id, item_columns=None):
+    threading.Thread(target=run_job, args=(app, job_id, item_columns), daemon=True).start()
+
+
+def run_job(app, job_id, item_columns=None):
+    """Computes and renders one export; runs in a background thread with its own app context."""
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
+        job = db.session.get(AnalyticsExport, job_id)
+        temp_path = None
+        try:
+            job.status = 'running'
+            db.session.commit()
+
+            user_plan = db.session.query(User.plan).filter(User.id == job.user_id).scalar() or 'basic'
+            today = datetime.utcnow().date()
+            data = export_data(db, job.user_id, user_plan, today, item_columns)
+            export_date = today.isoformat()
+            mode = render_mode(app)
+            digest = content_hash(user_plan, export_date, data, mode)
+            path = pdf_path(app, digest)
+
+            if os.path.exists(path):
+                os.utime(path)  # most recently used
+                app.logger.info(f"[Export] Job {job_id} served from the PDF cache")
+            else:
+                temp_path = f'{path}.{job_id}.tmp'
+                pool = app.extensions['analytics_exports']
+                if pool:
+                    timeout = app.config.get('EXPORT_JOB_TIMEOUT_SECONDS', 300)
+                    remaining = timeout - (datetime.utcnow() - job.created_at).total_seconds()
+                    try:
+                        pool.submit(pdf_export.build_pdf, temp_path, user_plan, data, export_date, mode).result(
+                            timeout=max(remaining, 1)
+                        )
+                    except BrokenProcessPool:
+                        pool.reset()
+                        raise
+                else:
+                    pdf_export.build_pdf(temp_path, user_plan, data, export_date, mode)
+                os.replace(temp_path, path)
+                evict_cached_pdfs(app)
+
+            job.status = 'completed'
+            job.content_hash = digest
+            job.completed_at = datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            app.logger.error(f"[Export] Job {job_id} failed: {e}")
+            db.session.rollback()
+            job = db.session.get(AnalyticsExport, job_id)
+            job.status = 'failed'
+            job.error = 'Failed to generate PDF'
+            job.completed_at = datetime.utcnow()
+            db.session.commit()
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)  # a render that timed out may still recreate it; evicted later
+            evict_cached_pdfs(app)
+
+
+def job_payload(app, job):
+    status = 'failed' if is_expired(app, job) else job.status
+    return {
+        'id': job.id,
+        'status': status,
+        'error': 'Export timed out' if status != job.status else job.error,
+        'created_at': job.created_at.isoformat(),
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None,
+    }
@@ -0,0 +1,122 @@
+import smtplib
+from datetime import datetime, timedelta
+
+from flask_mail import Message
+from sqlalchemy import update
+
+from models import EmailOutbox
+
+# Transactional email outbox. Routes add an EmailOutbox row in the same transaction as the
+# change that triggers the email (a new user, a reset request) instead of talking to SMTP
+# in the request; `flask mail-worker` sends due rows in batches over one SMTP connection
+# per batch. A failed send is retried after OUTBOX_RETRY_BASE_SECONDS, doubling per
+# attempt up to OUTBOX_RETRY_MAX_SECONDS, and marked failed after OUTBOX_MAX_ATTEMPTS.
+#
+# A worker first claims its batch: each due row is moved to 'sending' with next_attempt_at
+# set OUTBOX_CLAIM_SECONDS ahead, by an UPDATE conditional on the due time it read, and
+# the claim is committed before any email goes out. A row another worker claimed in the
+# meantime is skipped, on every dialect (SKIP LOCKED, where supported, only saves the
+# wait). Delivery is at least once: a worker that dies while sending leaves its rows in
+# 'sending', and they are claimed again once their claim expires.
+# Refusals of one email; any other error fails the connection and defers the rest of the batch
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+CLAIMABLE = ('pending', 'sending')
+
+
+def queue_email(session, message):
+    """Adds a flask_mail Message to the outbox; it is sent once the session commits."""
+    session.add(EmailOutbox(
+        recipients=list(message.recipients),
+        subject=message.subject,
+        body=message.body,
+        html=message.html,
+    ))
+
+
+def retry_delay(app, attempts):
+    base = app.config.get('OUTBOX_RETRY_BASE_SECONDS', 30)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), app.config.get('OUTBOX_RETRY_MAX_SECONDS', 3600)))
+
+
+def record_failure(app, row, error, now):
+    row.attempts += 1
+    row.last_error = str(error)[:255]
+    if row.attempts >= app.config.get('OUTBOX_MAX_ATTEMPTS', 8):
+        row.status = 'failed'
+        app.logger.error(f"[Outbox] Giving up on email {row.id} after {row.attempts} attempts: {error}")
+    else:
+        row.status = 'pending'
+        row.next_attempt_at = now + retry_delay(app, row.attempts)
+
+
+def claim_due_emails(app, batch_size):
+    """Claims up to `batch_size` due emails for this worker and commits the claim; returns the rows."""
+    db = app.extensions['sqlalchemy']
+    now = datetime.utcnow()
+    claimed_until = now + timedelta(seconds=app.config.get('OUTBOX_CLAIM_SECONDS', 300))
+    due = db.session.query(EmailOutbox.id, EmailOutbox.next_attempt_at).filter(
+        EmailOutbox.status.in_(CLAIMABLE),
+        EmailOutbox.next_attempt_at <= now
+    ).order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)\
+        .limit(batch_size).with_for_update(skip_locked=True).all()
+    claimed = []
+    for row_id, due_at in due:
+        result = db.session.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id == row_id, EmailOutbox.status.in_(CLAIMABLE), EmailOutbox.next_attempt_at == due_at)
+            .values(status='sending', next_attempt_at=claimed_until)
+        )
+        if result.rowcount:
+            claimed.append(row_id)
+    db.session.commit()
+    if not claimed:
+        return []
+    return db.session.query(EmailOutbox).filter(EmailOutbox.id.in_(claimed))\
+        .order_by(EmailOutbox.id).all()
+
+
+def send_due_emails(app, batch_size=50):
+    """Sends up to `batch_size` due emails over one SMTP connection; returns (sent, failed)."""
+    db = app.extensions['sqlalchemy']
+    rows = claim_due_emails(app, batch_size)
+    if not rows:
+        return 0, 0
+
+    now = datetime.utcnow()
+    sent = failed = 0
+    unsent = list(rows)
+    try:
+        with app.extensions['mail'].connect() as connection:
+            while unsent:
+                row = unsent[0]
+                message = Message(subject=row.subject, recipients=row.recipients, body=row.body, html=row.html)
+                try:
+                    connection.send(message)
+                except MESSAGE_ERRORS as e:
+                    record_failure(app, row, e, now)
+                    failed += 1
+                else:
+                    row.status = 'sent'
+                    row.attempts += 1
+                    row.sent_at = datetime.utcnow()
+                    sent += 1
+                unsent.pop(0)
+    except Exception as e:
+        app.logger.warning(f"[Outbox] SMTP connection failed, {len(unsent)} emails deferred: {e}")
+        for row in unsent:
+            record_failure(app, row, e, now)
+            failed += 1
+    db.session.commit()
+    return sent, failed
+
+
+def purge_sent_emails(app):
+    """Deletes sent emails older than OUTBOX_KEEP_SENT_DAYS; returns how many."""
+    db = app.extensions['sqlalchemy']
+    cutoff = datetime.utcnow() - timedelta(days=app.config.get('OUTBOX_KEEP_SENT_DAYS', 7))
+    count = db.session.query(EmailOutbox).filter(
+        EmailOutbox.status == 'sent',
+        EmailOutbox.sent_at < cutoff
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return count
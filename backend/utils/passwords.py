@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+from flask import current_app as app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from errors import ServiceUnavailableError
+
+# Password hashing and verification off the gunicorn worker. Both are CPU bound (bcrypt,
+# or pbkdf2 for hashes stored before bcrypt), so a burst of logins used to stall every
+# other request of the worker. They now run in a small per-worker process pool; at most
+# PASSWORD_HASH_MAX_PENDING calls wait for it, further ones fail fast with a 503. The pool
+# only pays off with threaded workers (gunicorn.conf.py), whose other threads keep serving
+# while one waits for a hash.
+#
+# New hashes use PASSWORD_HASH_SCHEME ('bcrypt' with PASSWORD_BCRYPT_ROUNDS, or 'pbkdf2'
+# with werkzeug's default). A successful login with a hash made with other parameters
+# returns the password rehashed with the current ones, in the same pool call.
+BCRYPT_PREFIXES = ('$2a$', '$2b$', '$2y$')
+BCRYPT_MAX_BYTES = 72  # bcrypt ignores anything longer
+
+
+def bcrypt_bytes(password):
+    return password.encode('utf-8')[:BCRYPT_MAX_BYTES]
+
+
+def hash_password_now(password, scheme, rounds):
+    """The password's hash with the given parameters, computed in this process."""
+    if scheme == 'bcrypt':
+        return bcrypt.hashpw(bcrypt_bytes(password), bcrypt.gensalt(rounds)).decode('ascii')
+    return generate_password_hash(password, method='pbkdf2:sha256')
+
+
+def needs_rehash(stored_hash, scheme, rounds):
+    if not stored_hash.startswith(BCRYPT_PREFIXES):
+        return scheme == 'bcrypt'
+    return scheme != 'bcrypt' or stored_hash[4:6] != f'{rounds:02d}'
+
+
+def verify_password_now(stored_hash, password, scheme, rounds):
+    """(valid, new_hash) in this process; new_hash is set when a valid hash is outdated."""
+    if not stored_hash:
+        return False, None
+    if stored_hash.startswith(BCRYPT_PREFIXES):
+        valid = bcrypt.checkpw(bcrypt_bytes(password), stored_hash.encode('ascii'))
+    else:
+        valid = check_password_hash(stored_hash, password)
+    if valid and needs_rehash(stored_hash, scheme, rounds):
+        return True, hash_password_now(password, scheme, rounds)
+    return valid, None
+
+
+class HashPool:
+    """Process pool for password hashing with a bound on waiting calls, started on first use in each worker."""
+
+    def __init__(self, workers, max_pending, timeout):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise ServiceUnavailableError('Server is busy, please try again')
+        try:
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    # spawn: the workers do not inherit the parent's threads, sockets or sessions
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                    )
+                    self._pid = os.getpid()
+                future = self._executor.submit(fn, *args)
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise ServiceUnavailableError('Server is busy, please try again')
+        except BrokenProcessPool:
+            self.reset()
+            raise
+        finally:
+            self._slots.release()
+
+    def reset(self):
+        """Drops a pool whose worker died; the next call starts a new one."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def init_password_hashing(app):
+    """Sets up the hash pool from the PASSWORD_HASH_* settings; 0 workers hashes in the request."""
+    workers = app.config.get('PASSWORD_HASH_WORKERS', 2)
+    app.extensions['password_pool'] = workers and HashPool(
+        workers,
+        app.config.get('PASSWORD_HASH_MAX_PENDING', 32),
+        app.config.get('PASSWORD_HASH_TIMEOUT_SECONDS', 10),
+    )
+
+
+def run_hashing(fn, *args):
+    pool = app.extensions.get('password_pool')
+    return pool.run(fn, *args) if pool else fn(*args)
+
+
+def hashing_parameters():
+    return app.config.get('PASSWORD_HASH_SCHEME', 'bcrypt'), app.config.get('PASSWORD_BCRYPT_ROUNDS', 12)
+
+
+def hash_password(password):
+    """The password's hash with the configured parameters."""
+    return run_hashing(hash_password_now, password, *hashing_parameters())
+
+
+def verify_password(stored_hash, password):
+    """(valid, new_hash); new_hash replaces a valid stored hash made with outdated parameters."""
+    return run_hashing(verify_password_now, stored_hash, password, *hashing_parameters())
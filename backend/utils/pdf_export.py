@@ -0,0 +1,288 @@
+from functools import lru_cache
+
+from reportlab.lib import colors
+from reportlab.lib.colors import HexColor
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import Flowable, Table, TableStyle, SimpleDocTemplate, Paragraph, Spacer
+
+# ReportLab rendering of the analytics export. Kept free of Flask and the database so it
+# can run in the export process pool (utils/exports.py) as well as in a request.
+
+LAYOUT_VERSION = 2  # part of the export cache key; bump when the rendered output changes
+
+# Render modes:
+#   'chunked'  styles built once per process; tables are laid out in page-sized chunks that
+#              only become ReportLab Tables while they are being placed and drawn. Same pages
+#              as 'simple', but memory no longer grows with the tables' row counts (only the
+#              canvas's finished pages remain) and long tables are not re-split page by page
+#   'simple'   styles rebuilt per export and one Table per chart (the original renderer)
+RENDER_MODES = ('chunked', 'simple')
+CHUNK_ROWS = 35  # body rows of a letter page at the export's table font and padding
+
+BACKGROUND_COLOR = HexColor('#202338')  # Soft dark blue
+
+# Charts in the export, by plan; 'pro' also gets the diet composition
+CHARTS = ['bill_stats', 'total_spent', 'by_category', 'top_products', 'most_expensive', 'shopping_days']
+BASIC_CHARTS = ['bill_stats', 'total_spent', 'by_category']
+
+
+def plan_charts(user_plan):
+    return BASIC_CHARTS if user_plan == 'basic' else CHARTS
+
+
+def make_styles():
+    """Paragraph styles and the table style of the export."""
+    styles = getSampleStyleSheet()
+    title_style = styles['Title']
+    h2_style = styles['Heading2']
+    normal_style = styles['BodyText']
+    return {
+        'normal': normal_style,
+        'app_name': ParagraphStyle(
+            'AppName',
+            parent=title_style,
+            fontSize=28,
+            leading=34,
+            alignment=TA_CENTER,
+            textColor=colors.white,
+            spaceAfter=12,
+            spaceBefore=0,
+        ),
+        'export_title': ParagraphStyle(
+            'ExportTitle',
+            parent=title_style,
+            fontSize=20,
+            leading=26,
+            alignment=TA_CENTER,
+            textColor=colors.white,
+            spaceAfter=8,
+            spaceBefore=0,
+        ),
+        # h2 for table titles, in white
+        'h2_white': ParagraphStyle(
+            'H2White',
+            parent=h2_style,
+            textColor=colors.white
+        ),
+        'export_date': ParagraphStyle(
+            'ExportDate',
+            parent=normal_style,
+            textColor=colors.white
+        ),
+        'table': TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), HexColor('#7e5cff')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+            ('BACKGROUND', (0, 1), (-1, -1), HexColor('#232642')),
+            ('TEXTCOLOR', (0, 1), (-1, -1), colors.white),  # Body text white
+            ('GRID', (0, 0), (-1, -1), 0.5, HexColor('#2d3748')),
+        ]),
+        # Chunks after the first one continue the table without the header row
+        'table_body': TableStyle([
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('BACKGROUND', (0, 0), (-1, -1), HexColor('#232642')),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.white),
+            ('GRID', (0, 0), (-1, -1), 0.5, HexColor('#2d3748')),
+        ]),
+    }
+
+
+@lru_cache(maxsize=None)
+def shared_styles():
+    """make_styles() built once per process, for the chunked mode (styles are not modified)."""
+    return make_styles()
+
+
+def draw_background(canvas, doc):
+    canvas.saveState()
+    canvas.setFillColor(BACKGROUND_COLOR)
+    canvas.rect(0, 0, doc.pagesize[0], doc.pagesize[1], fill=1, stroke=0)
+    canvas.restoreState()
+
+
+def cell_width(value, font):
+    # As Table sizes a text cell: the widest line in its font plus the default 6pt padding each side
+    lines = str(value).split('\n') if value is not None else ['']
+    return max(stringWidth(line, font, 10) for line in lines) + 12
+
+
+def column_widths(headers, rows):
+    """The widths Table would give the whole table's columns, so that its chunks line up."""
+    widths = [cell_width(header, 'Helvetica-Bold') for header in headers]
+    for row in rows:
+        widths = [max(width, cell_width(value, 'Helvetica')) for width, value in zip(widths, row)]
+    return widths
+
+
+class TableChunk(Flowable):
+    """
+    Up to CHUNK_ROWS rows of a table, with the header row for the first chunk. The Table is
+    only built while the chunk is wrapped and drawn and is dropped afterwards, so queued
+    chunks hold just references to their payload entries.
+    """
+
+    def __init__(self, headers, entries, cells, style, col_widths):
+        super().__init__()
+        self.headers = headers
+        self.entries = entries
+        self.cells = cells
+        self.style = style
+        self.col_widths = col_widths
+        self.hAlign = 'LEFT'
+        self._table = None
+
+    def table(self):
+        rows = ([self.headers] if self.headers else []) + [self.cells(entry) for entry in self.entries]
+        return Table(rows, colWidths=self.col_widths, hAlign='LEFT', style=self.style)
+
+    def wrap(self, availWidth, availHeight):
+        if self._table is None:
+            self._table = self.table()
+        self.width, self.height = self._table.wrap(availWidth, availHeight)
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        self._table = None
+        return self.table().split(availWidth, availHeight)
+
+    def drawOn(self, canvas, x, y, _sW=0):
+        self._table.drawOn(canvas, x, y, _sW)
+        self._table = None
+
+
+def diet_cells(row):
+    fruits_veggies = round((row.get('fruits_percent', 0) or 0) + (row.get('vegetables_percent', 0) or 0), 2)
+    return [
+        row.get('period', ''),
+        fruits_veggies,
+        row.get('meat_percent', 0),
+        row.get('seafood_percent', 0),
+        row.get('snacks_percent', 0),
+        row.get('dairy_percent', 0),
+    ]
+
+
+def build_pdf(output, user_plan, analytics_data, export_date, mode='chunked'):
+    """
+    Renders the export into `output` (a path or binary file object). `analytics_data` is
+    {chart: {interval: payload}} with the analytics endpoints' payloads; `mode` is one of
+    RENDER_MODES.
+    """
+    chunked = mode == 'chunked'
+    styles = shared_styles() if chunked else make_styles()
+
+    # Build content
+    elements = []
+    # App name at the top
+    elements.append(Paragraph('Recipta', styles['app_name']))
+    # Export title and date
+    elements.append(Paragraph('Analytics Export', styles['export_title']))
+    elements.append(Paragraph(f'Exported: {export_date[:10]}', styles['export_date']))
+    elements.append(Spacer(1, 18))
+
+    charts = plan_charts(user_plan)
+
+    # Helper to add a table for a chart/interval; `cells` turns one payload entry into a row
+    def add_table(title, headers, entries, cells):
+        elements.append(Paragraph(title, styles['h2_white']))
+        if chunked:
+            # Chunks keep slices of the payload; rows are built when a chunk is drawn
+            col_widths = column_widths(headers, map(cells, entries))
+            for start in range(0, len(entries), CHUNK_ROWS):
+                elements.append(TableChunk(
+                    headers if start == 0 else None,
+                    entries[start:start + CHUNK_ROWS],
+                    cells,
+                    styles['table'] if start == 0 else styles['table_body'],
+                    col_widths
+                ))
+        else:
+            elements.append(Table([headers] + [cells(entry) for entry in entries], hAlign='LEFT', style=styles['table']))
+        elements.append(Spacer(1, 16))
+
+    # Bill Stats
+    if 'bill_stats' in charts:
+        for interval, stats in analytics_data.get('bill_stats', {}).items():
+            if stats.get('error') or not stats.get('has_data'):
+                continue
+            headers = ['Interval', 'Total Receipts', 'Average Bill', 'Delta (vs prev)']
+            add_table(f'Bill Stats ({interval})', headers, [stats], lambda row, interval=interval: [
+                interval, row.get('total_receipts', ''), row.get('average_bill', ''), row.get('average_bill_delta', '')
+            ])
+
+    # Total Spent
+    if 'total_spent' in charts:
+        for interval, data in analytics_data.get('total_spent', {}).items():
+            if data.get('error') or not data.get('data'):
+                continue
+            headers = ['Period', 'Total Spent']
+            add_table(f'Total Spent ({interval})', headers, data['data'], lambda row: [
+                row.get('period', ''), row.get('total_spent', '')
+            ])
+
+    # By Category
+    if 'by_category' in charts:
+        for interval, data in analytics_data.get('by_category', {}).items():
+            if data.get('error') or not data.get('categories'):
+                continue
+            headers = ['Category', 'Total']
+            add_table(f'By Category ({interval})', headers, data['categories'], lambda row: [
+                row.get('category', ''), row.get('total', '')
+            ])
+
+    # Top Products
+    if 'top_products' in charts:
+        for interval, data in analytics_data.get('top_products', {}).items():
+            if data.get('error') or not data.get('products'):
+                continue
+            headers = ['Product', 'Count', 'Percentage', 'Category']
+            add_table(f'Top Products ({interval})', headers, data['products'], lambda row: [
+                row.get('name', ''), row.get('count', ''), row.get('percentage', ''), row.get('category', '')
+            ])
+
+    # Most Expensive Products
+    if 'most_expensive' in charts:
+        for interval, data in analytics_data.get('most_expensive', {}).items():
+            if data.get('error') or not data.get('products'):
+                continue
+            headers = ['Product', 'Max Price', 'Count', 'Category']
+            add_table(f'Most Expensive Products ({interval})', headers, data['products'], lambda row: [
+                row.get('name', ''), row.get('price', ''), row.get('count', ''), row.get('category', '')
+            ])
+
+    # Shopping Days
+    if 'shopping_days' in charts:
+        for interval, data in analytics_data.get('shopping_days', {}).items():
+            if data.get('error') or not data.get('data'):
+                continue
+            headers = ['Day', 'Count']
+            add_table(f'Shopping Days ({interval})', headers, data['data'], lambda row: [
+                row.get('day', ''), row.get('count', '')
+            ])
+
+    # Diet Composition (Pro only, 3months interval only)
+    if user_plan == 'pro' and 'diet_composition' in analytics_data:
+        data = analytics_data['diet_composition'].get('3months')
+        if data and not data.get('error') and data.get('data'):
+            headers = [
+                'Date',
+                'Fruits & Veggies %',
+                'Meat & Poultry %',
+                'Seafood %',
+                'Snacks %',
+                'Dairy & Eggs %',
+            ]
+            add_table(f'Diet Composition (3M)', headers, data['data'], diet_cells)
+
+    # If no data, add a message
+    if len(elements) <= 4:
+        elements.append(Paragraph('No analytics data available for export.', styles['normal']))
+
+    # Build PDF with background on each page
+    doc = SimpleDocTemplate(output, pagesize=letter, rightMargin=36, leftMargin=36, topMargin=36, bottomMargin=36)
+    doc.build(elements, onFirstPage=draw_background, onLaterPages=draw_background)
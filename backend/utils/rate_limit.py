@@ -0,0 +1,184 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from flask import request, current_app as app
+
+from errors import RateLimitError
+from utils.decorators import verified_user_id
+
+# Sliding-window rate limits per client IP and per user, checked before every request.
+# RATE_LIMITS maps an endpoint ('auth.login') or a blueprint ('analytics') to rules
+# (limit, window_seconds, scope); an endpoint's rules replace its blueprint's. Scope 'user'
+# counts per token user and falls back to the IP for requests without a valid token.
+#
+# Each rule keeps a counter per fixed window; a request is allowed while
+#   previous window's count * (share of the previous window still in the sliding window)
+#   + current window's count
+# stays within the limit, which approximates a true sliding window with two counters.
+# The counters live in a local SQLite file shared by every gunicorn worker on the host
+# (one upsert per rule and request) or, with RATE_LIMIT_STORAGE = 'memory', per worker.
+# Storage errors let the request through.
+SCOPES = ('ip', 'user')
+
+
+class MemoryRateLimitStorage:
+    """Window counters of this process."""
+
+    PURGE_EVERY = 1024  # hits between removals of expired windows
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+
+    def hit(self, key, window, expires_at):
+        """Counts a hit in `window`; returns (count in window, count in window - 1)."""
+        with self._lock:
+            entry = self._counts.get((key, window))
+            count = entry[0] + 1 if entry else 1
+            self._counts[(key, window)] = (count, expires_at)
+            previous = self._counts.get((key, window - 1))
+            self._hits += 1
+            if self._hits % self.PURGE_EVERY == 0:
+                now = time.time()
+                self._counts = {k: v for k, v in self._counts.items() if v[1] >= now}
+        return count, previous[0] if previous else 0
+
+
+class SQLiteRateLimitStorage:
+    """Window counters in a local SQLite file, shared by every gunicorn worker on the host."""
+
+    PURGE_EVERY = 1024  # hits between removals of expired windows (per worker)
+    RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._hits = 0
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Counters are disposable, so they are not synced to disk
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_limit ('
+                'key TEXT NOT NULL, window INTEGER NOT NULL, count INTEGER NOT NULL, expires_at REAL NOT NULL, '
+                'PRIMARY KEY (key, window)) WITHOUT ROWID'
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def hit(self, key, window, expires_at):
+        """Counts a hit in `window`; returns (count in window, count in window - 1)."""
+        conn = self._connection()
+        if self.RETURNING:
+            count, previous = conn.execute(
+                'INSERT INTO rate_limit (key, window, count, expires_at) VALUES (?, ?, 1, ?) '
+                'ON CONFLICT (key, window) DO UPDATE SET count = count + 1 '
+                'RETURNING count, (SELECT p.count FROM rate_limit AS p WHERE p.key = ? AND p.window = ?)',
+                (key, window, expires_at, key, window - 1)
+            ).fetchone()
+        else:
+            conn.execute(
+                'INSERT INTO rate_limit (key, window, count, expires_at) VALUES (?, ?, 1, ?) '
+                'ON CONFLICT (key, window) DO UPDATE SET count = count + 1',
+                (key, window, expires_at)
+            )
+            counts = dict(conn.execute(
+                'SELECT window, count FROM rate_limit WHERE key = ? AND window IN (?, ?)', (key, window, window - 1)
+            ).fetchall())
+            count, previous = counts.get(window, 1), counts.get(window - 1)
+        self._hits += 1
+        if self._hits % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM rate_limit WHERE expires_at < ?', (time.time(),))
+        return count, previous or 0
+
+
+class RateLimiter:
+    def __init__(self, storage, rules, trusted_proxies=0, clock=time.time):
+        self.storage = storage
+        self.rules = rules
+        self.trusted_proxies = trusted_proxies
+        self.clock = clock
+
+    def rules_for(self, endpoint, blueprint):
+        """(name, rules) of the endpoint's own rules, else of its blueprint's."""
+        name = endpoint if endpoint in self.rules else blueprint
+        return name, self.rules.get(name, ())
+
+    def client_ip(self):
+        """The client address, skipping the TRUSTED_PROXIES load balancers in front of the app."""
+        if self.trusted_proxies:
+            forwarded = request.headers.get('X-Forwarded-For', '').split(',')
+            if len(forwarded) >= self.trusted_proxies and forwarded[-self.trusted_proxies].strip():
+                return forwarded[-self.trusted_proxies].strip()
+        return request.remote_addr or ''
+
+    def token_user(self):
+        parts = request.headers.get('Authorization', '').split()
+        if len(parts) != 2 or parts[0].lower() != 'bearer':
+            return None
+        try:
+            return verified_user_id(parts[1])
+        except Exception:
+            return None
+
+    def check(self, now=None):
+        """Counts the request against its rules; raises RateLimitError when one is exceeded."""
+        name, rules = self.rules_for(request.endpoint, request.blueprint)
+        if not rules or request.method == 'OPTIONS':
+            return
+        now = now or self.clock()
+        identities = {}
+        for index, (limit, seconds, scope) in enumerate(rules):
+            if scope == 'user' and 'user' not in identities:
+                user = self.token_user()
+                identities['user'] = f'user:{user}' if user is not None else None
+            if not identities.get(scope):
+                scope = 'ip'
+                identities.setdefault('ip', f'ip:{self.client_ip()}')
+            window, elapsed = divmod(now, seconds)
+            count, previous = self.storage.hit(f'{name}:{index}:{identities[scope]}', int(window), (window + 2) * seconds)
+            if previous * (1 - elapsed / seconds) + count > limit:
+                raise RateLimitError('Too many requests, please slow down', retry_after=math.ceil(seconds - elapsed))
+
+
+def init_rate_limiter(app):
+    """Checks RATE_LIMITS before every request; RATE_LIMIT_STORAGE 'none' disables it."""
+    storage_name = app.config.get('RATE_LIMIT_STORAGE', 'sqlite')
+    rules = app.config.get('RATE_LIMITS', {})
+    for name, name_rules in rules.items():
+        for _, _, scope in name_rules:
+            if scope not in SCOPES:
+                raise ValueError(f"Unknown rate limit scope {scope!r} for {name}")
+    if storage_name == 'none' or not rules:
+        app.extensions['rate_limiter'] = None
+        return
+    if storage_name == 'sqlite':
+        os.makedirs(os.path.dirname(app.config['RATE_LIMIT_PATH']) or '.', exist_ok=True)
+        storage = SQLiteRateLimitStorage(app.config['RATE_LIMIT_PATH'])
+    else:
+        storage = MemoryRateLimitStorage()
+    limiter = RateLimiter(storage, rules, app.config.get('RATE_LIMIT_TRUSTED_PROXIES', 0))
+    app.extensions['rate_limiter'] = limiter
+    app.before_request(check_rate_limits)
+
+
+def check_rate_limits():
+    limiter = app.extensions.get('rate_limiter')
+    if limiter is None:
+        return
+    try:
+        limiter.check()
+    except RateLimitError:
+        raise
+    except Exception as e:
+        app.logger.error(f"[Rate limit] Check failed, letting the request through: {e}")
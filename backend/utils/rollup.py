@@ -0,0 +1,164 @@
+from sqlalchemy import event, select, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, object_session
+
+from models import Receipt, ReceiptDailyRollup, parse_number, parse_text
+
+# Daily analytics rollup, one row per (user, day, store_name, store_category, category).
+#   category == RECEIPT_ROW:  receipt-level row, spend = sum of receipt totals, receipt_count
+#   any other category:       item-level row, spend = sum of item totals, item_count
+# Missing store fields are stored as '' so they can be part of the primary key.
+# Receipt flush events turn every insert/update/delete into +/- deltas that are
+# upserted in the same flush, so the rollup commits or rolls back with the receipt.
+RECEIPT_ROW = ''
+DEFAULT_ITEM_CATEGORY = 'Other'
+CATEGORY_MAX_LENGTH = 100  # ReceiptDailyRollup.category
+PENDING_KEY = 'rollup_pending'
+
+KEY_COLUMNS = ('user_id', 'day', 'store_name', 'store_category', 'category')
+
+
+def item_amount(item):
+    """Item spend as the analytics endpoints have always read it: float(total) or 0."""
+    try:
+        return float(item.get('total', 0))
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def item_category(item):
+    """The item's category as ReceiptItem stores it (stripped, length-limited text), else 'Other'."""
+    return parse_text(item.get('category'), CATEGORY_MAX_LENGTH) or DEFAULT_ITEM_CATEGORY
+
+
+def contribution(user_id, day, store_name, store_category, total, items):
+    """Rollup rows contributed by one receipt as {key: [spend, item_count, receipt_count]}."""
+    if day is None:
+        return {}
+    store = (user_id, day, store_name or '', store_category or '')
+    # Totals arrive as clients sent them ("12.5", null, ...); one that is not a number counts as 0
+    rows = {store + (RECEIPT_ROW,): [parse_number(total) or 0.0, 0, 1]}
+    for item in items or []:
+        if not isinstance(item, dict):
+            continue
+        row = rows.setdefault(store + (item_category(item),), [0.0, 0, 0])
+        row[0] += item_amount(item)
+        row[1] += 1
+    return rows
+
+
+def merge(pending, rows, sign):
+    for key, (spend, item_count, receipt_count) in rows.items():
+        row = pending.setdefault(key, [0.0, 0, 0])
+        row[0] += sign * spend
+        row[1] += sign * item_count
+        row[2] += sign * receipt_count
+
+
+def stored_contribution(connection, receipt_id):
+    """Contribution of the receipt row as currently stored (before this flush changes it)."""
+    table = Receipt.__table__
+    row = connection.execute(
+        select(table.c.user_id, table.c.date, table.c.store_name, table.c.store_category,
+               table.c.total, table.c['items']).where(table.c.id == receipt_id)
+    ).first()
+    if row is None:
+        return {}
+    return contribution(row.user_id, row.date, row.store_name, row.store_category, row.total, row.items)
+
+
+def apply_deltas(connection, pending):
+    """Upserts accumulated deltas and drops rows that no longer count anything."""
+    params = [
+        dict(zip(KEY_COLUMNS, key), spend=spend, item_count=item_count, receipt_count=receipt_count)
+        for key, (spend, item_count, receipt_count) in pending.items()
+        if spend or item_count or receipt_count
+    ]
+    if not params:
+        return
+    table = ReceiptDailyRollup.__table__
+    insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(KEY_COLUMNS),
+        set_={
+            'spend': table.c.spend + stmt.excluded.spend,
+            'item_count': table.c.item_count + stmt.excluded.item_count,
+            'receipt_count': table.c.receipt_count + stmt.excluded.receipt_count,
+        },
+    )
+    connection.execute(stmt, params)
+    if any(p['item_count'] < 0 or p['receipt_count'] < 0 for p in params):
+        connection.execute(delete(table).where(
+            table.c.user_id.in_({p['user_id'] for p in params}),
+            table.c.item_count <= 0,
+            table.c.receipt_count <= 0,
+        ))
+
+
+def rebuild_rollup(connection, user_id=None, batch_size=500):
+    """Recomputes the rollup (for everyone or one user) from the receipt table. Returns the receipt count."""
+    table = Receipt.__table__
+    rollup = ReceiptDailyRollup.__table__
+    connection.execute(delete(rollup).where(rollup.c.user_id == user_id) if user_id is not None else delete(rollup))
+
+    query = select(table.c.id, table.c.user_id, table.c.date, table.c.store_name,
+                   table.c.store_category, table.c.total, table.c['items']).order_by(table.c.id).limit(batch_size)
+    if user_id is not None:
+        query = query.where(table.c.user_id == user_id)
+    count = 0
+    last_id = 0
+    while True:
+        rows = connection.execute(query.where(table.c.id > last_id)).all()
+        if not rows:
+            return count
+        pending = {}
+        for row in rows:
+            merge(pending, contribution(row.user_id, row.date, row.store_name,
+                                        row.store_category, row.total, row.items), 1)
+        apply_deltas(connection, pending)
+        count += len(rows)
+        last_id = rows[-1].id
+
+
+def pending_deltas(target):
+    return object_session(target).info.setdefault(PENDING_KEY, {})
+
+
+def _after_receipt_insert(mapper, connection, target):
+    merge(pending_deltas(target), contribution(target.user_id, target.date, target.store_name,
+                                               target.store_category, target.total, target.items), 1)
+
+
+def _before_receipt_update(mapper, connection, target):
+    # Relationship-only changes (e.g. sync_line_items) leave the receipt row as it is
+    if not object_session(target).is_modified(target, include_collections=False):
+        return
+    pending = pending_deltas(target)
+    merge(pending, stored_contribution(connection, target.id), -1)
+    merge(pending, contribution(target.user_id, target.date, target.store_name,
+                                target.store_category, target.total, target.items), 1)
+
+
+def _before_receipt_delete(mapper, connection, target):
+    merge(pending_deltas(target), stored_contribution(connection, target.id), -1)
+
+
+def _before_flush(session, flush_context, instances):
+    session.info.pop(PENDING_KEY, None)  # leftovers from a flush that failed
+
+
+def _after_flush(session, flush_context):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        apply_deltas(session.connection(), pending)
+
+
+def register_rollup():
+    """Hooks rollup maintenance into Receipt inserts, updates and deletes."""
+    if not event.contains(Receipt, 'after_insert', _after_receipt_insert):
+        event.listen(Receipt, 'after_insert', _after_receipt_insert)
+        event.listen(Receipt, 'before_update', _before_receipt_update)
+        event.listen(Receipt, 'before_delete', _before_receipt_delete)
+        event.listen(Session, 'before_flush', _before_flush)
+        event.listen(Session, 'after_flush', _after_flush)
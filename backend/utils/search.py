@@ -0,0 +1,138 @@
+import re
+import time
+from sqlalchemy import event, inspect, text
+
+from models import Receipt
+
+# Full-text index over store_name and item names, kept in its own table:
+#   SQLite:     FTS5 virtual table, rowid = receipt id, `owner` column scopes matches to a user
+#   PostgreSQL: receipt_search(receipt_id, user_id, document tsvector) with a GIN index
+# Both are created by migrations/versions/e7a9d1c4f6b2_receipt_search_index.py and updated
+# from Receipt flush events, so every write path keeps the index in the same transaction.
+SEARCH_TABLE = 'receipt_search'
+SEARCH_MAX_TERMS = 8
+SEARCH_TABLE_RECHECK_SECONDS = 60  # a missing index is looked for again after this
+
+_table_present = {}  # {database url: (present, monotonic time of the check)}
+
+
+def search_terms(q):
+    """Lowercased word tokens of a query; punctuation and operators are dropped."""
+    return re.findall(r'\w+', (q or '').lower())[:SEARCH_MAX_TERMS]
+
+
+def item_names(items):
+    return ' '.join(
+        str(item.get('name')).strip()
+        for item in items or []
+        if isinstance(item, dict) and item.get('name')
+    )
+
+
+def owner_token(user_id):
+    return f'u{user_id}'
+
+
+def search_index_available(connection):
+    # Checked per database so a schema without the migration keeps working. A present
+    # table is remembered; a missing one is checked again, so running the migration
+    # while the workers are up turns the index on without a restart.
+    key = str(connection.engine.url)
+    checked = _table_present.get(key)
+    if checked is None or (not checked[0] and time.monotonic() - checked[1] >= SEARCH_TABLE_RECHECK_SECONDS):
+        checked = _table_present[key] = (inspect(connection).has_table(SEARCH_TABLE), time.monotonic())
+    return checked[0]
+
+
+def index_receipt(connection, receipt_id, user_id, store_name, items):
+    if not search_index_available(connection):
+        return
+    params = {
+        'id': receipt_id,
+        'user_id': user_id,
+        'owner': owner_token(user_id),
+        'store_name': store_name or '',
+        'item_names': item_names(items),
+    }
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(
+            "INSERT INTO receipt_search (receipt_id, user_id, document) VALUES (:id, :user_id, "
+            "setweight(to_tsvector('simple', :store_name), 'A') || setweight(to_tsvector('simple', :item_names), 'B')) "
+            "ON CONFLICT (receipt_id) DO UPDATE SET user_id = EXCLUDED.user_id, document = EXCLUDED.document"
+        ), params)
+    else:
+        connection.execute(text("DELETE FROM receipt_search WHERE rowid = :id"), params)
+        connection.execute(text(
+            "INSERT INTO receipt_search (rowid, owner, store_name, item_names) "
+            "VALUES (:id, :owner, :store_name, :item_names)"
+        ), params)
+
+
+def unindex_receipt(connection, receipt_id):
+    if not search_index_available(connection):
+        return
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("DELETE FROM receipt_search WHERE receipt_id = :id"), {'id': receipt_id})
+    else:
+        connection.execute(text("DELETE FROM receipt_search WHERE rowid = :id"), {'id': receipt_id})
+
+
+def search_receipt_ids(session, user_id, q, limit, offset):
+    """
+    Returns [(receipt_id, rank)] best match first. Every term is a prefix match, so
+    'mil' finds 'milk' while the user is still typing. Store name hits outrank item hits.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return []
+    connection = session.connection()
+    if not search_index_available(connection):
+        return []
+    params = {'user_id': user_id, 'limit': limit, 'offset': offset}
+    if connection.dialect.name == 'postgresql':
+        params['query'] = ' & '.join(f'{term}:*' for term in terms)
+        rows = session.execute(text(
+            "SELECT receipt_id, ts_rank(document, to_tsquery('simple', :query)) AS rank "
+            "FROM receipt_search "
+            "WHERE user_id = :user_id AND document @@ to_tsquery('simple', :query) "
+            "ORDER BY rank DESC, receipt_id DESC LIMIT :limit OFFSET :offset"
+        ), params)
+    else:
+        # bm25() is lower-is-better; negate it so both dialects return higher-is-better
+        terms_expr = ' AND '.join(f'"{term}"*' for term in terms)
+        params['match'] = f'owner:"{owner_token(user_id)}" AND {{store_name item_names}}: ({terms_expr})'
+        rows = session.execute(text(
+            "SELECT rowid AS receipt_id, -bm25(receipt_search, 0.0, 2.0, 1.0) AS rank "
+            "FROM receipt_search WHERE receipt_search MATCH :match "
+            "ORDER BY rank DESC, rowid DESC LIMIT :limit OFFSET :offset"
+        ), params)
+    return [(row.receipt_id, row.rank) for row in rows]
+
+
+def rebuild_search_index(session, user_id=None, batch_size=500):
+    """Reindexes every receipt (or one user's) from the receipt table. Returns the count."""
+    query = session.query(Receipt.id, Receipt.user_id, Receipt.store_name, Receipt.items).order_by(Receipt.id)
+    if user_id is not None:
+        query = query.filter(Receipt.user_id == user_id)
+    connection = session.connection()
+    count = 0
+    for row in query.yield_per(batch_size):
+        index_receipt(connection, row.id, row.user_id, row.store_name, row.items)
+        count += 1
+    return count
+
+
+def _after_receipt_write(mapper, connection, target):
+    index_receipt(connection, target.id, target.user_id, target.store_name, target.items)
+
+
+def _after_receipt_delete(mapper, connection, target):
+    unindex_receipt(connection, target.id)
+
+
+def register_search_index():
+    """Hooks index maintenance into Receipt inserts, updates and deletes."""
+    if not event.contains(Receipt, 'after_insert', _after_receipt_write):
+        event.listen(Receipt, 'after_insert', _after_receipt_write)
+        event.listen(Receipt, 'after_update', _after_receipt_write)
+        event.listen(Receipt, 'after_delete', _after_receipt_delete)
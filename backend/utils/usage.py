@@ -0,0 +1,104 @@
+from datetime import datetime
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+
+from models import Receipt, ReceiptUsage
+
+
+def month_start(moment=None):
+    """First day of the (UTC) month containing `moment` (defaults to now)."""
+    moment = moment or datetime.utcnow()
+    if isinstance(moment, datetime):
+        moment = moment.date()
+    return moment.replace(day=1)
+
+
+def next_month_start(month):
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+
+def uploaded_in_month(session, user_id, month):
+    """Receipts the user uploaded in the month, counted from the receipt table."""
+    return session.query(Receipt).filter(
+        Receipt.user_id == user_id,
+        Receipt.created_at >= month,
+        Receipt.created_at < next_month_start(month)
+    ).count()
+
+
+def ensure_usage_row(session, user_id, month):
+    """
+    Creates the (user, month) counter if it is missing, seeded from the receipts
+    already uploaded that month so existing users keep their count.
+    """
+    if session.get(ReceiptUsage, (user_id, month)) is not None:
+        return
+    seeded = uploaded_in_month(session, user_id, month)
+    try:
+        # Savepoint so losing the insert race to another worker keeps our transaction usable
+        with session.begin_nested():
+            session.add(ReceiptUsage(user_id=user_id, month=month, count=seeded))
+    except IntegrityError:
+        pass
+
+
+def reserve_receipt_slots(session, user_id, requested=1, limit=None):
+    """
+    Increments this month's counter by up to `requested` and returns how many were granted.
+    With a limit each slot is a single-row conditional UPDATE, so concurrent requests cannot
+    both take the last slot. Runs in the caller's transaction: roll back to release the slots.
+    """
+    month = month_start()
+    ensure_usage_row(session, user_id, month)
+    counter = update(ReceiptUsage).where(
+        ReceiptUsage.user_id == user_id,
+        ReceiptUsage.month == month
+    )
+    if limit is None:
+        session.execute(counter.values(count=ReceiptUsage.count + requested))
+        return requested
+
+    granted = 0
+    while granted < requested:
+        result = session.execute(
+            counter.where(ReceiptUsage.count < limit).values(count=ReceiptUsage.count + 1)
+        )
+        if result.rowcount != 1:
+            break
+        granted += 1
+    return granted
+
+
+def release_receipt_slot(session, user_id, created_at):
+    """Gives back the slot of a deleted receipt in the month it was uploaded."""
+    session.execute(
+        update(ReceiptUsage).where(
+            ReceiptUsage.user_id == user_id,
+            ReceiptUsage.month == month_start(created_at),
+            ReceiptUsage.count > 0
+        ).values(count=ReceiptUsage.count - 1)
+    )
+
+
+def get_monthly_usage(session, user_id):
+    """
+    Receipts uploaded by the user in the current month, read from the counter. A month
+    without a counter yet is counted from the receipts; the counter itself is only
+    created by the write path (reserve_receipt_slots).
+    """
+    month = month_start()
+    usage = session.get(ReceiptUsage, (user_id, month))
+    return usage.count if usage is not None else uploaded_in_month(session, user_id, month)
+
+
+def get_receipt_total(session, user_id):
+    """
+    Receipts the user has, summed from the monthly counters (one row per month with
+    uploads) instead of counted from the receipt table. Every month is covered: the
+    counters are created by each upload and were filled for earlier months by migration
+    d1f7a3c5b9e0.
+    """
+    return session.query(func.coalesce(func.sum(ReceiptUsage.count), 0))\
+        .filter(ReceiptUsage.user_id == user_id).scalar()
@@ -0,0 +1,459 @@
+from datetime import datetime, timedelta
+
+# Pure payload builders for the analytics widgets. Each takes receipt rows that are
+# already loaded (anything with .date, .total, .store_name, .store_category, .items),
+# so /api/analytics/dashboard can scan a user's receipts once and fill every widget,
+# while the per-widget endpoints share the same aggregation code.
+
+DEFAULT_WIDGETS = [
+    'bill_stats',
+    'total_spent',
+    'expenses_by_category',
+    'top_products',
+    'most_expensive',
+    'diet_composition',
+    'shopping_days'
+]
+
+# Per-widget query parameters and their defaults, matching the standalone endpoints
+WIDGET_PARAMS = {
+    'bill_stats': {'interval': 'M'},
+    'total_spent': {'interval': 'monthly'},
+    'expenses_by_category': {'period': 'week'},
+    'top_products': {'period': 'month', 'limit': 10},
+    'most_expensive': {'period': 'month', 'limit': 8},
+    'diet_composition': {'interval': 'month'},
+    'shopping_days': {'period': 'month'},
+}
+
+# Look-back window (days) for each widget's `period` option; other values mean all time
+PERIOD_DAYS = {
+    'expenses_by_category': {'week': 7, 'month': 30},
+    'top_products': {'month': 30, 'year': 365},
+    'most_expensive': {'month': 30, 'year': 365},
+    'shopping_days': {'month': 30},
+}
+
+DIET_GROUPS = [
+    ('fruits', {'Fruits'}),
+    ('vegetables', {'Vegetables'}),
+    ('meat', {'Meat & poultry'}),
+    ('seafood', {'Seafood'}),
+    ('snacks', {'Snacks'}),
+    ('dairy', {'Dairy & eggs'}),
+]
+DIET_INTERVAL_DAYS = {'month': 30, '3months': 90, '6months': 180}
+
+DAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+SPEND_GRANULARITIES = ['daily', 'weekly', 'monthly']
+
+
+def window_start(today, period, days_by_period):
+    """First day included for `period`, or None for all time."""
+    days = days_by_period.get(period)
+    return today - timedelta(days=days) if days else None
+
+
+def in_window(rows, start, end=None):
+    return [
+        r for r in rows
+        if r.date is not None and (start is None or r.date >= start) and (end is None or r.date <= end)
+    ]
+
+
+def filter_store(rows, store_name=None, store_category=None):
+    if store_name:
+        rows = [r for r in rows if r.store_name == store_name]
+    if store_category:
+        rows = [r for r in rows if r.store_category == store_category]
+    return rows
+
+
+def item_dicts(rows):
+    for r in rows:
+        for item in r.items or []:
+            if isinstance(item, dict):
+                yield item
+
+
+def item_total(item):
+    try:
+        return float(item.get('total', 0))
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def format_period(period_start, interval):
+    """Chart label for a period: '09 Jun' (daily), 'W23' (weekly) or 'Jun' (monthly)."""
+    if interval == 'daily':
+        return period_start.strftime('%d %b')
+    if interval == 'weekly':
+        return f'W{period_start.isocalendar()[1]}'
+    return period_start.strftime('%b')
+
+
+def period_start(day, interval):
+    if interval == 'daily':
+        return day
+    if interval == 'weekly':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_period(start, interval):
+    if interval == 'daily':
+        return start + timedelta(days=1)
+    if interval == 'weekly':
+        return start + timedelta(days=7)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def period_key(period_start, interval):
+    """Unambiguous period id: '2024-06-09', ISO week '2024-W23' or '2024-06'."""
+    if interval == 'daily':
+        return period_start.isoformat()
+    if interval == 'weekly':
+        year, week, _ = period_start.isocalendar()
+        return f'{year}-W{week:02d}'
+    return period_start.strftime('%Y-%m')
+
+
+def spend_buckets(daily_totals, interval, start=None, end=None):
+    """
+    {period_start: total} from {day: total}. With a range, every period overlapping
+    [start, end] is present, empty ones at 0.
+    """
+    totals = {}
+    if start and end:
+        key, last = period_start(start, interval), period_start(end, interval)
+        while key <= last:
+            totals[key] = 0.0
+            key = next_period(key, interval)
+    for day in sorted(daily_totals):
+        key = period_start(day, interval)
+        totals[key] = totals.get(key, 0.0) + daily_totals[day]
+    return totals
+
+
+def spend_points(buckets, interval):
+    """Series points oldest first, with the chart label and the period's id and first day."""
+    return [
+        {
+            'period': format_period(key, interval),
+            'key': period_key(key, interval),
+            'start': key.isoformat(),
+            'total_spent': round(buckets[key], 4)
+        }
+        for key in sorted(buckets)
+    ]
+
+
+def spend_series(rows, interval):
+    """Total spent per day, week (Monday start) or month, oldest first."""
+    totals = {}
+    for r in rows:
+        if r.date is None:
+            continue
+        key = period_start(r.date, interval)
+        totals[key] = totals.get(key, 0.0) + (r.total or 0.0)
+    return [
+        {'period': format_period(key, interval), 'total_spent': round(totals[key], 4)}
+        for key in sorted(totals)
+    ]
+
+
+def category_breakdown(category_totals):
+    result = [
+        {'category': cat, 'total': round(total, 2)}
+        for cat, total in category_totals.items()
+    ]
+    result.sort(key=lambda x: x['total'], reverse=True)
+    return result
+
+
+def category_totals(rows):
+    totals = {}
+    for item in item_dicts(rows):
+        category = item.get('category') or 'Other'
+        totals[category] = totals.get(category, 0.0) + item_total(item)
+    return totals
+
+
+def top_products(rows, limit):
+    """Products ranked by the number of receipts they appear on."""
+    product_receipt_counts = {}  # {product_name: {'count': int, 'category': str}}
+    for r in rows:
+        # Count each unique product once per receipt
+        products_in_receipt = {}
+        for item in r.items or []:
+            if not item or not item.get('name'):
+                continue
+            product_name = item['name'].strip()
+            if product_name:
+                products_in_receipt[product_name] = item.get('category', 'Other')
+        for product_name, category in products_in_receipt.items():
+            if product_name in product_receipt_counts:
+                product_receipt_counts[product_name]['count'] += 1
+            else:
+                product_receipt_counts[product_name] = {'count': 1, 'category': category}
+
+    total_receipts = len(rows)
+    products = [
+        {
+            'name': name,
+            'count': data['count'],
+            'percentage': round((data['count'] / total_receipts) * 100, 1),
+            'category': data['category']
+        }
+        for name, data in product_receipt_counts.items()
+    ]
+    products.sort(key=lambda x: x['count'], reverse=True)
+    return products[:limit]
+
+
+def most_expensive_products(rows, limit):
+    """Products ranked by the highest unit price paid, with how often they were bought."""
+    product_data = {}  # {product_name: {'max_price': float, 'count': int, 'category': str}}
+    for r in rows:
+        for item in r.items or []:
+            if not item or not item.get('name') or not item.get('price'):
+                continue
+            product_name = item['name'].strip()
+            try:
+                price = float(item.get('price', 0))
+            except (ValueError, TypeError):
+                price = 0.0
+            if not product_name or price <= 0:
+                continue
+            category = item.get('category', 'Other')
+            data = product_data.get(product_name)
+            if data is None:
+                product_data[product_name] = {'max_price': price, 'count': 1, 'category': category}
+                continue
+            if price > data['max_price']:
+                # Category follows the highest priced instance
+                data['max_price'] = price
+                data['category'] = category
+            data['count'] += 1
+
+    products = [
+        {
+            'name': name,
+            'price': round(data['max_price'], 2),
+            'count': data['count'],
+            'category': data['category']
+        }
+        for name, data in product_data.items()
+    ]
+    products.sort(key=lambda x: x['price'], reverse=True)
+    return products[:limit]
+
+
+def products_by_category(rows, category):
+    """Items of one category grouped by (name, unit price), largest total first."""
+    product_groups = {}
+    for r in rows:
+        for item in r.items or []:
+            if item.get('category') != category:
+                continue
+            name = item.get('name', '')
+            # Add null checks before float conversion
+            try:
+                price = float(item.get('price', 0)) if item.get('price') is not None else 0.0
+                quantity = float(item.get('quantity', 1)) if item.get('quantity') is not None else 1.0
+                total = float(item.get('total', 0)) if item.get('total') is not None else 0.0
+            except (ValueError, TypeError):
+                # Skip items with invalid numeric values
+                continue
+
+            # Use (name, price) as key to group identical products
+            key = (name, price)
+            if key in product_groups:
+                product_groups[key]['quantity'] += quantity
+                product_groups[key]['total'] += total
+            else:
+                product_groups[key] = {'quantity': quantity, 'total': total}
+
+    products = [
+        {
+            'name': name,
+            'quantity': round(data['quantity'], 2),
+            'price': price,
+            'total': round(data['total'], 2)
+        }
+        for (name, price), data in product_groups.items()
+    ]
+    products.sort(key=lambda x: x['total'], reverse=True)
+    return products
+
+
+def weekday_counts(counts_by_day):
+    """[{'day': 'Mon', 'count': n}, ...] from {date: receipt_count}."""
+    day_counts = [0] * 7
+    for day, count in counts_by_day.items():
+        day_counts[day.weekday()] += count
+    return [{'day': DAY_NAMES[i], 'count': count} for i, count in enumerate(day_counts)]
+
+
+def date_range(start, end):
+    """Every day from start to end, inclusive."""
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def diet_window(today, interval):
+    days = DIET_INTERVAL_DAYS.get(interval, 30)  # fallback to 30 days if invalid
+    start_date = today - timedelta(days=days - 1)
+    return start_date, date_range(start_date, today)
+
+
+def diet_series(date_list, totals_by_day):
+    """Daily food-group spend and percentages from {'YYYY-MM-DD': [(category, total)]}."""
+    result = []
+    for d in date_list:
+        day_str = d.strftime('%Y-%m-%d')
+        sums = {group: 0.0 for group, _ in DIET_GROUPS}
+        sum_other = 0.0
+        for category, total in totals_by_day.get(day_str, []):
+            for group, categories in DIET_GROUPS:
+                if category in categories:
+                    sums[group] += total
+                    break
+            else:
+                sum_other += total
+        total_spent = sum(sums.values()) + sum_other
+        row = {'period': day_str}
+        for group, _ in DIET_GROUPS:
+            row[f'{group}_percent'] = round(sums[group] / total_spent * 100, 2) if total_spent > 0 else 0.0
+        row['total_spent'] = round(total_spent, 2)
+        for group, _ in DIET_GROUPS:
+            row[f'sum_{group}'] = round(sums[group], 2)
+        result.append(row)
+    return result
+
+
+def bill_stats(total_receipts, total_amount, prev_count=0, prev_total=0.0):
+    """Average bill for a period and its change against the previous one (None if either is empty)."""
+    avg_bill = total_amount / total_receipts if total_receipts > 0 else 0
+    avg_bill_delta = None
+    if prev_count and total_receipts:
+        avg_bill_delta = avg_bill - prev_total / prev_count
+    return {
+        'total_receipts': total_receipts,
+        'average_bill': round(avg_bill, 2),
+        'average_bill_delta': round(avg_bill_delta, 2) if avg_bill_delta is not None else None,
+    }
+
+
+def scan_start(widgets, params, today):
+    """Earliest receipt date any of `widgets` looks at, or None if one needs all history."""
+    starts = []
+    for widget in widgets:
+        options = params[widget]
+        if widget == 'bill_stats':
+            # The monthly view compares against the 30 days before its own 30
+            start = today - timedelta(days=60) if options['interval'] == 'M' else None
+        elif widget == 'diet_composition':
+            start = diet_window(today, options['interval'])[0]
+        elif widget in PERIOD_DAYS:
+            start = window_start(today, options['period'], PERIOD_DAYS[widget])
+        else:
+            start = None
+        if start is None:
+            return None
+        starts.append(start)
+    return min(starts) if starts else None
+
+
+def build_dashboard(widgets, params, all_rows, store_name, store_category, currency, has_data, today=None,
+                    item_columns=None):
+    """
+    Payloads for `widgets` from one scan of the user's receipts. `all_rows` is every receipt
+    of the user since scan_start(); the store filters are applied here because bill_stats
+    compares against the unfiltered previous period, exactly like /bill-stats.
+    `item_columns` (utils.columnar.ItemColumns) computes the item-level widgets from arrays
+    built once from the filtered rows; without it they run on the rows directly.
+    """
+    today = today or datetime.utcnow().date()
+    rows = filter_store(all_rows, store_name, store_category)
+    columns = item_columns(rows) if item_columns else None
+    payloads = {}
+    for widget in widgets:
+        options = params[widget]
+        if widget == 'bill_stats':
+            interval = options['interval']
+            current = rows
+            prev_count, prev_total = 0, 0.0
+            if interval == 'M':
+                start_date = today - timedelta(days=30)
+                current = in_window(rows, start_date)
+                prev = in_window(all_rows, start_date - timedelta(days=30), start_date - timedelta(days=1))
+                prev_count, prev_total = len(prev), sum(r.total or 0.0 for r in prev)
+            payloads[widget] = {
+                **bill_stats(len(current), sum(r.total or 0.0 for r in current), prev_count, prev_total),
+                'currency': currency,
+                'has_data': has_data
+            }
+        elif widget == 'total_spent':
+            payloads[widget] = {'currency': currency, 'data': spend_series(rows, options['interval'])}
+        elif widget == 'expenses_by_category':
+            start_date = window_start(today, options['period'], PERIOD_DAYS[widget])
+            payloads[widget] = {
+                'categories': category_breakdown(
+                    columns.category_totals(columns.receipts_in(start_date)) if columns
+                    else category_totals(in_window(rows, start_date))
+                ),
+                'currency': currency,
+                'has_data': has_data
+            }
+        elif widget == 'top_products':
+            start_date = window_start(today, options['period'], PERIOD_DAYS[widget])
+            current = in_window(rows, start_date)
+            if columns:
+                products = columns.top_products(columns.receipts_in(start_date), options['limit'])
+            else:
+                products = top_products(current, options['limit'])
+            payloads[widget] = {
+                'period': options['period'],
+                'products': products,
+                'total_receipts': len(current),
+                'has_data': has_data
+            }
+        elif widget == 'most_expensive':
+            start_date = window_start(today, options['period'], PERIOD_DAYS[widget])
+            if columns:
+                products = columns.most_expensive_products(columns.receipts_in(start_date), options['limit'])
+            else:
+                products = most_expensive_products(in_window(rows, start_date), options['limit'])
+            payloads[widget] = {
+                'period': options['period'],
+                'products': products,
+                'currency': currency,
+                'has_data': has_data
+            }
+        elif widget == 'diet_composition':
+            start_date, date_list = diet_window(today, options['interval'])
+            if columns:
+                totals_by_day = columns.diet_totals_by_day(columns.receipts_in(start_date, today), date_list)
+            else:
+                totals_by_day = {}
+                for r in in_window(rows, start_date, today):
+                    day_totals = totals_by_day.setdefault(r.date.strftime('%Y-%m-%d'), [])
+                    day_totals.extend((item.get('category', 'Other'), item_total(item)) for item in item_dicts([r]))
+            payloads[widget] = {
+                'interval': options['interval'],
+                'group_by': 'day',
+                'data': diet_series(date_list, totals_by_day),
+                'currency': currency,
+            }
+        elif widget == 'shopping_days':
+            start_date = window_start(today, options['period'], PERIOD_DAYS[widget])
+            counts_by_day = {}
+            for r in in_window(rows, start_date):
+                counts_by_day[r.date] = counts_by_day.get(r.date, 0) + 1
+            payloads[widget] = {
+                'period': options['period'],
+                'data': weekday_counts(counts_by_day),
+                'has_data': has_data
+            }
+    return payloads
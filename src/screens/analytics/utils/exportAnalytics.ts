@@ -14,64 +14,38 @@ async function fetchWithAuth(url: string, params: any = {}) {
   });
 }
 
-// Main export function
+const EXPORT_POLL_INTERVAL_MS = 1000;
+const EXPORT_TIMEOUT_MS = 5 * 60 * 1000;
+
+const sleep = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
+
+// Main export function. The server computes the analytics for the user's plan and renders
+// the PDF in the background; the app starts the job, polls it and downloads the file.
 export async function exportAnalyticsAsPDF(userId: string, userPlan: string) {
-  // 1. Determine endpoints and intervals
-  const endpoints: { [key: string]: { url: string, intervals: string[] } } = {
-    bill_stats: { url: '/api/analytics/bill-stats', intervals: ['M', 'All'] },
-    total_spent: { url: '/api/analytics/spend', intervals: ['daily', 'weekly', 'monthly'] },
-    by_category: { url: '/api/analytics/expenses-by-category', intervals: ['week', 'month', 'all'] },
-    top_products: { url: '/api/analytics/top-products', intervals: ['month', 'year', 'all'] },
-    most_expensive: { url: '/api/analytics/most-expensive-products', intervals: ['month', 'year', 'all'] },
-    shopping_days: { url: '/api/analytics/shopping-days', intervals: ['month', 'all'] },
-    diet_composition: { url: '/api/analytics/diet-composition', intervals: ['3months'] },
-  };
+  try {
+    const token = await AsyncStorage.getItem('jwt_token');
+    const headers = { 'Authorization': `Bearer ${token}` };
 
-  // 2. Filter endpoints by plan
-  const chartsToExport = userPlan === 'basic'
-    ? ['bill_stats', 'total_spent', 'by_category']
-    : Object.keys(endpoints);
+    // 1. Start the export job (or join the one already running)
+    const created = await axios.post(`${API_BASE_URL}/api/analytics/exports`, {}, { headers });
+    const exportId = created.data.id;
 
-  // 3. Fetch all data
-  const analyticsData: any = {};
-  for (const chart of chartsToExport) {
-    analyticsData[chart] = {};
-    for (const interval of endpoints[chart].intervals) {
-      let params: any = { user_id: userId };
-      // Map interval param names
-      if (chart === 'bill_stats') params.interval = interval;
-      if (chart === 'total_spent') params.interval = interval;
-      if (chart === 'by_category') params.period = interval;
-      if (chart === 'top_products' || chart === 'most_expensive') params.period = interval;
-      if (chart === 'shopping_days') params.period = interval;
-      if (chart === 'diet_composition') params.interval = interval;
-      try {
-        const res = await fetchWithAuth(`${API_BASE_URL}${endpoints[chart].url}`, params);
-        analyticsData[chart][interval] = res.data;
-      } catch (e) {
-        analyticsData[chart][interval] = { error: true };
-      }
+    // 2. Wait for it to finish
+    let status = created.data.status;
+    const deadline = Date.now() + EXPORT_TIMEOUT_MS;
+    while (status === 'queued' || status === 'running') {
+      if (Date.now() > deadline) return false;
+      await sleep(EXPORT_POLL_INTERVAL_MS);
+      const res = await fetchWithAuth(`${API_BASE_URL}/api/analytics/exports/${exportId}`);
+      status = res.data.status;
     }
-  }
+    if (status !== 'completed') return false;
 
-  // 4. Send to backend for PDF generation
-  try {
-    const token = await AsyncStorage.getItem('jwt_token');
-    const res = await axios.post(
-      `${API_BASE_URL}/api/analytics/export-pdf`,
-      {
-        user_plan: userPlan,
-        data: analyticsData,
-        export_date: new Date().toISOString(),
-      },
-      {
-        headers: {
-          'Authorization': `Bearer ${token}`,
-          'Content-Type': 'application/json',
-        },
-        responseType: 'arraybuffer',
-      }
-    );
+    // 3. Download and share the PDF
+    const res = await axios.get(`${API_BASE_URL}/api/analytics/exports/${exportId}/download`, {
+      headers,
+      responseType: 'arraybuffer',
+    });
     // Convert ArrayBuffer to base64
     const base64 = Buffer.from(res.data, 'binary').toString('base64');
     const fileUri = FileSystem.cacheDirectory + `analytics_export_${Date.now()}.pdf`;
@@ -81,4 +55,4 @@ export async function exportAnalyticsAsPDF(userId: string, userPlan: string) {
   } catch (e) {
     return false;
   }
-} 
\ No newline at end of file
+}